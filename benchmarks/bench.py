@@ -0,0 +1,190 @@
+"""
+Module: bench.py
+Benchmark suite for the Org-Process calculation stages.
+
+Synthetic batches are generated with reportgen for each combination of peak
+count and file count, and the parsing, blank averaging, concentration and csv
+writing stages are timed separately so that scaling can be compared across
+releases. The fastest of --repeat runs of each stage is reported, and the
+results can be saved as JSON with --json.
+
+By default the peak count is scaled from 100 to 10,000 with 10 samples, and the
+sample count from 10 to 1,000 with 1,000 peaks. Use --grid to time every
+combination of --peaks and --files instead.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy (only with --vectorised)
+
+Functions:
+bench_case: Times each stage for one synthetic batch
+main: Runs the benchmark suite from the command line
+time_stage: Times the fastest of several runs of a stage
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import op
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+DEF_PEAK_COUNTS = [100, 1000, 10000]
+DEF_FILE_COUNTS = [10, 100, 1000]
+DEF_BLANK_COUNT = 3
+STAGES = ['parse', 'blank', 'concentration', 'csv']
+
+
+def bench_case(directory, peak_count, file_count, parameters, repeat=3, processes=1, vectorised=False,
+               extension='.xls'):
+    """
+    Times each stage for one synthetic batch
+    :param directory: Directory for the batch's reports. Reports from an earlier
+        run with the same counts are reused.
+    :param peak_count: Number of peaks in each report
+    :param file_count: Number of sample reports
+    :param parameters: Instance of op.BatchParameters class
+    :param repeat: Number of runs of each stage, the fastest is reported
+    :param processes: Worker processes for the parse stage (1 = serial)
+    :param vectorised: If True, time the opvec engine for the concentration stage
+    :param extension: Report file extension, which selects the report reader
+    :return: Dictionary of the counts and the seconds taken by each stage.
+    """
+    directory = os.path.normpath(directory)
+    marker = directory + '.complete'
+    if not os.path.exists(marker):
+        reportgen.generate_batch(directory, file_count, peak_count, DEF_BLANK_COUNT, parameters.analysis_c6_c10,
+                                 extension=extension)
+        open(marker, 'w').close()
+    blank_file_list, sample_file_list = op.find_report_files(directory)
+
+    timings = {}
+    timings['parse'], reports = time_stage(
+        lambda: op.get_data_from_reports(blank_file_list + sample_file_list, processes), repeat)
+    blank_data_list = [r[2] for r in reports[:len(blank_file_list)]]
+    sample_reports = reports[len(blank_file_list):]
+
+    timings['blank'], blank_average = time_stage(
+        lambda: op.BlankAverage(blank_data=blank_data_list, analysis_c6_c10=parameters.analysis_c6_c10,
+                                **parameters.istd_kwargs()), repeat)
+
+    if vectorised:
+        import opvec
+        calculate = lambda: opvec.calculate_sample_results(sample_reports, blank_average, parameters)
+    else:
+        calculate = lambda: [op.calculate_sample_result(sample_name, analysis_time, peak_data, blank_average,
+                                                        parameters)
+                             for sample_name, analysis_time, peak_data in sample_reports]
+    timings['concentration'], result_set = time_stage(calculate, repeat)
+
+    out_filepath = directory + '.csv'
+
+    def write_results():
+        writer = op.CsvResultWriter(out_filepath, parameters.fieldnames)
+        for f, result in zip(sample_file_list, result_set):
+            writer.write(f, result)
+        writer.close()
+    timings['csv'], _ = time_stage(write_results, repeat)
+    os.remove(out_filepath)
+
+    return {
+        'peaks': peak_count,
+        'files': file_count + len(blank_file_list),
+        'seconds': timings
+    }
+
+
+def time_stage(stage, repeat):
+    """
+    Times the fastest of several runs of a stage
+    :param stage: Callable to time
+    :param repeat: Number of runs
+    :return: Tuple of the fastest time in seconds and the return value of the last run.
+    """
+    best = None
+    value = None
+    for _ in range(max(repeat, 1)):
+        start = timeit.default_timer()
+        value = stage()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, value
+
+
+def main(argv=None):
+    """Run the benchmark suite from the command line."""
+    parser = argparse.ArgumentParser(description='Time the Org-Process calculation stages on synthetic batches.')
+    parser.add_argument('--peaks', type=int, nargs='+', default=DEF_PEAK_COUNTS, help='Peak counts per report')
+    parser.add_argument('--files', type=int, nargs='+', default=DEF_FILE_COUNTS, help='Sample report counts')
+    parser.add_argument('--grid', action='store_true', help='Time every combination of --peaks and --files')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each stage, the fastest is reported')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Worker processes for the parse stage (0 = one per CPU, 1 = serial)')
+    parser.add_argument('--c6-c10', dest='analysis_c6_c10', action='store_true', help='C6-C10 analysis')
+    parser.add_argument('--vectorised', action='store_true', help='Time the NumPy concentration engine')
+    parser.add_argument('--format', default='xls', choices=['xls', 'csv', 'txt'],
+                        help='Report file format, which selects the report reader')
+    parser.add_argument('--work-dir', help='Directory for the generated reports, kept so later runs reuse them '
+                                           '(default: a temporary directory that is removed)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.grid:
+        cases = [(p, f) for p in args.peaks for f in args.files]
+    else:
+        cases = [(p, args.files[0]) for p in args.peaks]
+        cases += [(args.peaks[len(args.peaks) // 2], f) for f in args.files[1:]]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='org-process-bench-')
+    parameters = op.BatchParameters(analysis_c6_c10=args.analysis_c6_c10)
+    results = []
+    try:
+        sys.stdout.write("%8s %8s" % ('peaks', 'files') + ''.join("%15s" % s for s in STAGES) + "\n")
+        for peak_count, file_count in cases:
+            directory = os.path.join(work_dir, '%s_%s_p%d_f%d' % ('c6' if args.analysis_c6_c10 else 'c10',
+                                                                  args.format, peak_count, file_count))
+            result = bench_case(directory, peak_count, file_count, parameters, args.repeat, args.processes,
+                                args.vectorised, '.' + args.format)
+            results.append(result)
+            sys.stdout.write("%8d %8d" % (result['peaks'], result['files']) +
+                             ''.join("%13.1fms" % (result['seconds'][s] * 1000) for s in STAGES) + "\n")
+            sys.stdout.flush()
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'version': op.__version__,
+                'date': datetime.datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'analysis_c6_c10': args.analysis_c6_c10,
+                'processes': args.processes,
+                'vectorised': args.vectorised,
+                'format': args.format,
+                'repeat': args.repeat,
+                'results': results
+            }, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
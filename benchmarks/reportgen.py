@@ -0,0 +1,208 @@
+"""
+Module: reportgen.py
+Generates synthetic MassHunter AnalysisReport workbooks, or the same reports
+exported as delimited text, for benchmarking.
+
+The workbooks use the layout read by op.get_data_from_report: the sample name
+and acquired time headers on opx.SAMPLE_NAME_ROW and opx.ANALYSIS_TIME_ROW, and
+an "Integration Peak List" block with the peak index, start, RT, end and area
+columns at the opx column positions. Each report has an internal standard peak
+within the default tolerances for the analysis type, so every sample calculates.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlwt
+
+Functions:
+generate_batch: Writes the blank and sample reports for one synthetic batch
+main: Generates a synthetic batch from the command line
+write_report: Writes one synthetic AnalysisReport workbook
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import random
+import sys
+
+import xlwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+# Retention time range of the generated peaks for each analysis type
+RT_RANGE_C6_C10 = (3.5, 14.0)
+RT_RANGE_C10_C40 = (7.0, 34.0)
+# Rows between the acquired time header and the peak list, as in instrument reports
+PEAK_LIST_ROW = opx.ANALYSIS_TIME_ROW + 6
+
+
+def generate_batch(directory, sample_count, peak_count, blank_count=3, analysis_c6_c10=False, seed=0,
+                   extension='.xls'):
+    """
+    Writes the blank and sample reports for one synthetic batch
+    :param directory: Directory to write the reports to, created if needed
+    :param sample_count: Number of sample reports
+    :param peak_count: Number of peaks in each report
+    :param blank_count: Number of blank reports
+    :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+    :param seed: Random seed, so the same arguments always give the same reports
+    :param extension: Report file extension, '.xls' for workbooks or a text export
+        extension in opx.TEXT_REPORT_DELIMITERS such as '.csv'
+    :return: Tuple of the blank file list and the sample file list.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    start_time = datetime.datetime(2017, 2, 24, 9, 0)
+
+    blank_file_list = []
+    for n in range(blank_count):
+        f = os.path.join(directory, 'Report_%s%d%s' % (opx.BLANK_TAG, n, extension))
+        write_report(f, '%s%d' % (opx.BLANK_TAG, n), start_time + datetime.timedelta(minutes=n), peak_count,
+                     analysis_c6_c10, blank=True, seed=(seed, 'blank', n))
+        blank_file_list.append(f)
+
+    sample_file_list = []
+    for n in range(sample_count):
+        f = os.path.join(directory, 'Report_S%04d%s' % (n, extension))
+        write_report(f, 'S%04d' % n, start_time + datetime.timedelta(minutes=blank_count + n), peak_count,
+                     analysis_c6_c10, blank=False, seed=(seed, 'sample', n))
+        sample_file_list.append(f)
+    return blank_file_list, sample_file_list
+
+
+def write_report(file, sample_name, analysis_time, peak_count, analysis_c6_c10=False, blank=False, seed=None,
+                 max_rt=None, istd_area=None):
+    """
+    Writes one synthetic AnalysisReport workbook
+    :param file: Path of the report to write. Files with a text export extension in
+        opx.TEXT_REPORT_DELIMITERS are written as delimited text, others as .xls workbooks
+    :param sample_name: Sample name header value
+    :param analysis_time: Acquired time header value, as a datetime
+    :param peak_count: Number of peaks in the integration peak list, including the internal standard
+    :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+    :param blank: True for a blank, which has smaller peak areas than a sample
+    :param seed: Random seed for the peak data
+    :param max_rt: Optional highest retention time of the other peaks, e.g. to write
+        a report that ends before the last fraction boundary
+    :param istd_area: Optional area of the internal standard peak, e.g. to write a
+        report whose internal standard is outside the area tolerance
+    :return: No return value
+    """
+    rng = random.Random(repr(seed))
+    if analysis_c6_c10:
+        rt_low, rt_high = RT_RANGE_C6_C10
+        istd_rt = opx.DEF_ISTD_RT_C6_C10
+        istd_rt_tolerance = opx.DEF_ISTD_RT_TOLERANCE_C6_C10
+        istd_area_target = opx.DEF_ISTD_AREA_TARGET_C6_C10
+        istd_area_tolerance = opx.DEF_ISTD_AREA_TOLERANCE_C6_C10
+    else:
+        rt_low, rt_high = RT_RANGE_C10_C40
+        istd_rt = opx.DEF_ISTD_RT_C10_C40
+        istd_rt_tolerance = opx.DEF_ISTD_RT_TOLERANCE_C10_C40
+        istd_area_target = opx.DEF_ISTD_AREA_TARGET_C10_C40
+        istd_area_tolerance = opx.DEF_ISTD_AREA_TOLERANCE_C10_C40
+    if max_rt is not None:
+        rt_high = min(rt_high, max_rt)
+
+    # Other peaks are kept out of the internal standard window so it has one candidate
+    peaks = []
+    while len(peaks) < peak_count - 1:
+        rt = rng.uniform(rt_low, rt_high)
+        if abs(rt - istd_rt) > istd_rt_tolerance:
+            area = rng.uniform(10, 2000) if blank else rng.uniform(100, 50000)
+            peaks.append((rt, area))
+    peaks.append((istd_rt + rng.uniform(-0.5, 0.5) * istd_rt_tolerance,
+                  istd_area_target + rng.uniform(-0.5, 0.5) * istd_area_tolerance))
+    if istd_area is not None:
+        peaks[-1] = (peaks[-1][0], istd_area)
+    peaks.sort()
+
+    # Cell values by (row, column)
+    cells = {}
+    cells[opx.SAMPLE_NAME_ROW, 0] = 'Sample Name'
+    cells[opx.SAMPLE_NAME_ROW, opx.SAMPLE_NAME_COLUMN] = sample_name
+    cells[opx.ANALYSIS_TIME_ROW, 0] = 'Acquired Time'
+    cells[opx.ANALYSIS_TIME_ROW, opx.ANALYSIS_TIME_COLUMN] = analysis_time.strftime('%d/%m/%Y %H:%M:%S')
+
+    cells[PEAK_LIST_ROW, opx.PEAK_INDEX_COLUMN] = 'Integration Peak List'
+    title_row = PEAK_LIST_ROW + 1
+    cells[title_row, opx.PEAK_INDEX_COLUMN] = 'Peak'
+    cells[title_row, opx.PEAK_START_COLUMN] = 'Start'
+    cells[title_row, opx.RT_COLUMN] = 'RT'
+    cells[title_row, opx.PEAK_END_COLUMN] = 'End'
+    cells[title_row, opx.AREA_COLUMN] = 'Area'
+
+    for n, (rt, area) in enumerate(peaks):
+        row = title_row + 1 + n
+        width = rng.uniform(0.01, 0.05)
+        cells[row, opx.PEAK_INDEX_COLUMN] = n + 1
+        cells[row, opx.PEAK_START_COLUMN] = round(rt - width, 3)
+        cells[row, opx.RT_COLUMN] = round(rt, 3)
+        cells[row, opx.PEAK_END_COLUMN] = round(rt + width, 3)
+        cells[row, opx.AREA_COLUMN] = float(round(area))
+
+    # Footer after a blank row, which ends the peak list
+    cells[title_row + len(peaks) + 2, 0] = 'Printed at: %s' % analysis_time.strftime('%d/%m/%Y %H:%M')
+
+    delimiter = opx.TEXT_REPORT_DELIMITERS.get(os.path.splitext(file)[1].lower())
+    if delimiter is None:
+        _save_excel(file, cells)
+    else:
+        _save_text(file, cells, delimiter)
+
+
+def main(argv=None):
+    """Generate a synthetic batch from the command line."""
+    parser = argparse.ArgumentParser(description='Generate synthetic MassHunter AnalysisReport workbooks.')
+    parser.add_argument('directory', help='Directory to write the reports to')
+    parser.add_argument('--samples', type=int, default=10, help='Number of sample reports')
+    parser.add_argument('--blanks', type=int, default=3, help='Number of blank reports')
+    parser.add_argument('--peaks', type=int, default=1000, help='Number of peaks in each report')
+    parser.add_argument('--c6-c10', dest='analysis_c6_c10', action='store_true', help='C6-C10 analysis')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--format', default='xls', choices=['xls', 'csv', 'txt', 'tsv'], help='Report file format')
+    args = parser.parse_args(argv)
+
+    blank_file_list, sample_file_list = generate_batch(args.directory, args.samples, args.peaks, args.blanks,
+                                                       args.analysis_c6_c10, args.seed, '.' + args.format)
+    sys.stdout.write("%d blanks and %d samples written to %s\n" %
+                     (len(blank_file_list), len(sample_file_list), args.directory))
+    return 0
+
+
+def _save_excel(file, cells):
+    """Saves the cells as the first sheet of an Excel workbook."""
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('Sheet1')
+    for (row, column), value in cells.items():
+        sheet.write(row, column, value)
+    book.save(file)
+
+
+def _save_text(file, cells, delimiter):
+    """Saves the cells as delimited text, as MassHunter exports a report."""
+    row_count = max(row for row, _ in cells) + 1
+    column_count = max(column for _, column in cells) + 1
+    with open(file, 'wb') as f:
+        writer = csv.writer(f, delimiter=delimiter, lineterminator='\r\n')
+        for row in range(row_count):
+            writer.writerow([_text_value(cells.get((row, column), '')) for column in range(column_count)])
+
+
+def _text_value(value):
+    """Formats a cell value with repr for floats, so text exports hold the same values as workbooks."""
+    return repr(value) if isinstance(value, float) else value
+
+
+if __name__ == "__main__":
+    sys.exit(main())
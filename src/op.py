@@ -11,90 +11,734 @@ Date modified: 24/02/1017
 External dependencies: xlrd
 
 Exceptions:
+CalculationCancelled: Raised when a batch calculation is cancelled by the caller
 IstdError: Custom excption for ISTD errors.
+ReportError: A report that could not be read, given in place of its data when errors are collected
+
+Classes:
+BatchParameters: Analysis type, internal standard and calibration parameters for a batch
+BlankAverage: Average fraction and internal standard areas of the blanks in a batch, added one blank at a time
+CsvResultWriter: Writes result rows to a csv file as they are calculated, with a journal for resuming
+PeakTable: Table of peaks stored as one array per column, with area and retention time indexes
+SampleEvaluation: Internal standard and fraction areas of one sample, each resolved once
 
 Functions:
+batch_names: Gets a name for each batch directory, used in the batch column and file names of results
+calculate_batch: Calculates the results for a directory of reports and writes them to a csv file
+calculate_batches: Calculates the results for several batch directories in one run
+calculate_concentration: Calculate a blank corrected concentration from a fraction area and internal standard area
 calculate_sample_concentration: Calculate the concentration of a compound in a sample
-get_data_from_report: Gets retention time and peak area data from a MassHunter-generated Excel report
+calculate_sample_result: Calculates the fraction concentrations for a single sample
+find_batch_directories: Finds the batch directories in a root directory
+find_report_files: Finds the blank and sample report files in a directory
+fraction_names: Gets the fraction names for the analysis type
+get_data_from_excel_report: Gets retention time and peak area data from a MassHunter-generated Excel report
+get_data_from_report: Gets the report data using the reader registered for the report's file extension
+get_data_from_reports: Gets the report data for a list of reports, optionally over a pool of processes
+get_data_from_text_report: Gets retention time and peak area data from a MassHunter report exported as delimited text
+get_fraction_areas: Sums the areas of every fraction for the analysis type
 get_fraction_end_index: Finds the ending index for the peaks list for the retention time wanted
 get_fraction_start_index: Finds the starting index for the peaks list for the retention times wanted
 get_istd_area: Get the peak area for the given internal standard
+get_istd_candidates: Gets the peaks that could be the internal standard, to show why a search failed
+get_report_reader: Gets the reader function for a report file from its extension
+is_blank_report: Checks whether a report is a blank
+iter_batch_results: Generates the result of each sample of a list of batches
+iter_batches: Generates the blank and sample report files of each batch directory
+iter_data_from_reports: Generates the report data for a list of reports, optionally parsed over a pool of processes
 mean: Calculates the mean of a given list of numbers
+read_failure_manifest: Reads a failure manifest written by a run with continue_on_error
+register_report_reader: Registers a reader function for report files with the given extensions
+rerun_failures: Recalculates only the reports listed in a failure manifest
+run_pipeline: Calculates batch directories as a pipeline of generator stages with bounded memory
+scan_report_files: Classifies the files in a directory as blanks, samples or ignored files, reading the directory once
 sum_areas: Sums the peak areas given a set of bounding indices for the peak data list
 write_to_csv: Write a list of data dictionaries to a csv file
 """
 
+import array
+import bisect
+import codecs
+import collections
 import csv
+import functools
+import itertools
+import json
+import math
+import multiprocessing
+import os
 import xlrd
+import opstats
 import opx
 
+try:
+    from itertools import izip
+except ImportError:
+    # Python 3 zip is already lazy
+    izip = zip
+
+try:
+    from os import scandir
+except ImportError:
+    # Python 2 has no os.scandir, so directories are listed with os.listdir
+    scandir = None
+
 __author__ = 'Daniel Harris'
 __date__ = '9 March 2017'
 __email__ = 'daniel.harris@dpi.nsw.gov.au'
 __version__ = '1.0.1'
 
+# opstats.RunStats instance collecting timings and counters, or None when disabled
+stats = None
+
+# Report reader functions by lower case file extension, see register_report_reader
+REPORT_READERS = {}
+
+# Array typecodes of the PeakTable columns
+INDEX_TYPECODE = 'l'
+VALUE_TYPECODE = 'd'
+COLUMN_TYPECODES = (INDEX_TYPECODE, VALUE_TYPECODE, VALUE_TYPECODE, VALUE_TYPECODE, VALUE_TYPECODE)
+
 
 ###############################################################################
 # Custom exception classes
 ###############################################################################
+class CalculationCancelled(Exception):
+    """Raised when a batch calculation is cancelled by the caller."""
+    pass
+
+
 class IstdError(Exception):
     """ Custom excption for ISTD errors."""
+    # Set by calculate_batch and calculate_batches to identify the batch and report that failed
+    blank = False
+    sample_name = None
+    batch = None
+
+
+class ReportError(Exception):
+    """A report that could not be read, given in place of its data when errors are collected."""
     pass
 
 
 ###############################################################################
 # Custom classes
 ###############################################################################
-class BlankAverage:
-    def __init__(self, blank_data, analysis_c6_c10, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance):
-
-        # Create required empty lists
-        areas_c6_c10 = []
-        areas_c10_c16 = []
-        areas_c16_c34 = []
-        areas_c34_c40 = []
-        areas_c10_c40 = []
-
-        # For each blank item
-        for blank in blank_data:
-            if analysis_c6_c10:
-                # Find bounding indexes for C6-C10 fraction
-                i_c10 = get_fraction_end_index(blank, opx.C6_C10_END)
-                sum_c6_c10 = sum_areas(blank, 0, i_c10)
-                areas_c6_c10.append(sum_c6_c10)
-                # Calculate average peak area
-                self.area_c6_c10 = mean(areas_c6_c10)
+class BatchParameters(object):
+    """
+    Analysis type, internal standard and calibration parameters for a batch.
+    Any value that is not given takes the default for the analysis type.
+    """
+    def __init__(self, analysis_c6_c10=opx.DEF_ANALYSIS_C6_C10, istd_rt=None, istd_rt_tolerance=None,
+                 istd_area_target=None, istd_area_tolerance=None, calibration_slope=None,
+                 calibration_intercept=None, istd_concentration=None, dilution_factor=None):
+        if analysis_c6_c10:
+            defaults = (opx.DEF_ISTD_RT_C6_C10, opx.DEF_ISTD_RT_TOLERANCE_C6_C10, opx.DEF_ISTD_AREA_TARGET_C6_C10,
+                        opx.DEF_ISTD_AREA_TOLERANCE_C6_C10, opx.DEF_ISTD_CONC_C6_C10, opx.DEF_DILUTION_FACTOR_C6_C10)
+        else:
+            defaults = (opx.DEF_ISTD_RT_C10_C40, opx.DEF_ISTD_RT_TOLERANCE_C10_C40, opx.DEF_ISTD_AREA_TARGET_C10_C40,
+                        opx.DEF_ISTD_AREA_TOLERANCE_C10_C40, opx.DEF_ISTD_CONC_C10_C40, opx.DEF_DILUTION_FACTOR_C10_C40)
 
-            else:
-                # Find bounding indexes for C10-C16 fraction
-                i_c10 = get_fraction_start_index(blank, opx.C10_C16_START)
-                i_c16 = get_fraction_end_index(blank, opx.C10_C16_END)
-                sum_c10_c16 = sum_areas(blank, i_c10, i_c16)
-                areas_c10_c16.append(sum_c10_c16)
-                # Find bounding indexes for C16-C34 fraction
-                i_c34 = get_fraction_end_index(blank, opx.C16_C34_END)
-                sum_c16_c34 = sum_areas(blank, i_c16, i_c34)
-                areas_c16_c34.append(sum_c16_c34)
-                # Find bounding indexes for C34-C40 fraction
-                i_c40 = get_fraction_end_index(blank, opx.C34_C40_END)
-                sum_c34_c40 = sum_areas(blank, i_c34, i_c40)
-                areas_c34_c40.append(sum_c34_c40)
-                # Calculate sum areas for C10-C40 fraction
-                sum_c10_c40 = sum_areas(blank, i_c10, i_c40)
-                areas_c10_c40.append(sum_c10_c40)
-                # Calculate average peak areas
-                self.area_c10_c16 = mean(areas_c10_c16)
-                self.area_c16_c34 = mean(areas_c16_c34)
-                self.area_c34_c40 = mean(areas_c34_c40)
-                self.area_c10_c40 = mean(areas_c10_c40)
-
-        self.istd = mean([get_istd_area(x, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance) for x in blank_data])
+        self.analysis_c6_c10 = analysis_c6_c10
+        self.istd_rt = _default(istd_rt, defaults[0])
+        self.istd_rt_tolerance = _default(istd_rt_tolerance, defaults[1])
+        self.istd_area_target = _default(istd_area_target, defaults[2])
+        self.istd_area_tolerance = _default(istd_area_tolerance, defaults[3])
+        self.istd_concentration = _default(istd_concentration, defaults[4])
+        self.dilution_factor = _default(dilution_factor, defaults[5])
+        self.calibration_slope = _default(calibration_slope, opx.DEF_CALIBRATION_SLOPE)
+        self.calibration_intercept = _default(calibration_intercept, opx.DEF_CALIBRATION_INTERCEPT)
+
+    @property
+    def fieldnames(self):
+        """CSV fieldnames for the analysis type."""
+        if self.analysis_c6_c10:
+            return opx.FIELDNAMES_C6_C10
+        return opx.FIELDNAMES_C10_C40
+
+    def as_dict(self):
+        """All of the parameters as a dictionary."""
+        parameters = {'analysis_c6_c10': self.analysis_c6_c10}
+        parameters.update(self.istd_kwargs())
+        parameters.update(self.calibration_kwargs())
+        return parameters
+
+    def istd_kwargs(self):
+        """Keyword arguments for the internal standard search."""
+        return {
+            'istd_rt': self.istd_rt,
+            'istd_rt_tolerance': self.istd_rt_tolerance,
+            'istd_area_target': self.istd_area_target,
+            'istd_area_tolerance': self.istd_area_tolerance
+        }
+
+    def calibration_kwargs(self):
+        """Keyword arguments for converting an area to a concentration."""
+        return {
+            'calibration_slope': self.calibration_slope,
+            'calibration_intercept': self.calibration_intercept,
+            'istd_concentration': self.istd_concentration,
+            'dilution_factor': self.dilution_factor
+        }
+
+
+class BlankAverage(object):
+    """
+    Average fraction and internal standard areas of the blanks in a batch, added
+    one blank at a time. Only running totals are kept, so each blank's peak data
+    can be freed once it is added. The averages are running sums divided by the
+    count, which gives the same values as mean() of every blank's areas, and the
+    spread of the blanks is kept with Welford's running variance for QC.
+    """
+    def __init__(self, blank_data=None, analysis_c6_c10=opx.DEF_ANALYSIS_C6_C10, istd_rt=None,
+                 istd_rt_tolerance=None, istd_area_target=None, istd_area_tolerance=None):
+        """
+        :param blank_data: Iterable of peak area lists of the blanks, e.g. a generator
+            reading them one at a time, or None to add each blank with add
+        :raises ValueError: If blank_data is given but has no blanks
+        """
+        self.analysis_c6_c10 = analysis_c6_c10
+        self.istd_kwargs = {
+            'istd_rt': istd_rt,
+            'istd_rt_tolerance': istd_rt_tolerance,
+            'istd_area_target': istd_area_target,
+            'istd_area_tolerance': istd_area_tolerance
+        }
+        self.count = 0
+        self.istd = None
         self.area = None
+        # Name ('istd' or a fraction) -> [sum, running mean, sum of squared differences, min, max]
+        self._totals = {}
+        for name in ['istd'] + fraction_names(analysis_c6_c10):
+            self._totals[name] = [0, 0.0, 0.0, float('inf'), float('-inf')]
+            if name != 'istd':
+                setattr(self, 'area_' + name, None)
+
+        if blank_data is not None:
+            for blank in blank_data:
+                self.add(blank)
+            if not self.count:
+                raise ValueError("No blanks to average.")
+
+    def add(self, peak_data_list):
+        """
+        Adds one blank to the averages
+        :param peak_data_list: Peak area list for the blank, which is not kept
+        :return: Instance of SampleEvaluation class with the blank's areas. If the
+            internal standard search raises IstdError the averages are unchanged.
+        """
+        if stats is not None:
+            start = opstats.timer()
+
+        evaluation = SampleEvaluation(peak_data_list, self.analysis_c6_c10, **self.istd_kwargs)
+        self.count += 1
+        self._add_value('istd', evaluation.istd)
+        for fraction, area in evaluation.areas.items():
+            self._add_value(fraction, area)
+
+        self.istd = self._totals['istd'][0] / self.count
+        for fraction in evaluation.areas:
+            setattr(self, 'area_' + fraction, self._totals[fraction][0] / self.count)
+
+        if stats is not None:
+            stats.add('blank_average', opstats.timer() - start)
+        return evaluation
+
+    def spread(self):
+        """
+        Gets the spread of the blank areas, for QC
+        :return: Dictionary of 'istd' and each fraction name to a dictionary of the
+            mean, sample standard deviation ('stdev', None for fewer than two blanks),
+            relative standard deviation in percent ('rsd_percent', None if the mean
+            is zero), minimum and maximum. Empty if no blanks have been added.
+        """
+        if not self.count:
+            return {}
+        spread = {}
+        for name, (total, _, squares, minimum, maximum) in self._totals.items():
+            average = total / self.count
+            stdev = math.sqrt(squares / (self.count - 1)) if self.count > 1 else None
+            spread[name] = {
+                'mean': average,
+                'stdev': stdev,
+                'rsd_percent': 100 * stdev / abs(average) if stdev is not None and average else None,
+                'min': minimum,
+                'max': maximum
+            }
+        return spread
+
+    def _add_value(self, name, value):
+        """Adds a blank's value to the running sum, Welford variance and range for name."""
+        totals = self._totals[name]
+        # Summed in blank order from 0, as sum() in mean() does
+        totals[0] += value
+        delta = value - totals[1]
+        totals[1] += delta / self.count
+        totals[2] += delta * (value - totals[1])
+        totals[3] = min(totals[3], value)
+        totals[4] = max(totals[4], value)
+
+
+class CsvResultWriter(object):
+    """
+    Writes result dictionaries to a csv file one row at a time, flushing each row
+    to disk as it is written. A journal file next to the csv file records the
+    source report and csv file size after every row, so that a run that dies
+    part way through can be resumed after the last completed sample. The journal
+    is removed when the writer is closed on a completed run.
+    """
+    def __init__(self, out_filepath, fieldnames, run_info=None, resume=False):
+        """
+        :param out_filepath: Path of the csv results file
+        :param fieldnames: List of fieldnames to be used when writing
+        :param run_info: JSON serialisable description of the run (e.g. directory and
+            parameters). A run can only be resumed with the same run_info.
+        :param resume: If True, continue the csv file of an interrupted run. A new
+            file is started if there is no journal or it ends before its header.
+        """
+        self.out_filepath = out_filepath
+        self.journal_filepath = out_filepath + opx.JOURNAL_SUFFIX
+        self.rows_written = 0
+        # Source reports whose rows are already in the csv file
+        self.completed = set()
+
+        header = {'fieldnames': list(fieldnames), 'run': run_info}
+        offsets = None
+        if resume and os.path.exists(self.journal_filepath):
+            offsets = self._read_journal(header)
+        if offsets is not None:
+            csv_offset, journal_offset = offsets
+            with open(self.out_filepath, 'r+b') as f:
+                # Drops any partly written row after the last completed one
+                f.truncate(csv_offset)
+            self._csv_file = open(self.out_filepath, 'ab')
+            self._journal_file = open(self.journal_filepath, 'r+b')
+            self._journal_file.truncate(journal_offset)
+            self._journal_file.seek(0, os.SEEK_END)
+            self._writer = self._dict_writer(fieldnames)
+        else:
+            self._csv_file = open(self.out_filepath, 'wb')
+            self._journal_file = open(self.journal_filepath, 'wb')
+            self._writer = self._dict_writer(fieldnames)
+            self._writer.writeheader()
+            self._commit(header)
+
+    def write(self, source, result):
+        """
+        Writes and commits one result row
+        :param source: Report file the result was calculated from
+        :param result: Result dictionary
+        :return: No return value
+        """
+        if stats is not None:
+            start = opstats.timer()
+        self._writer.writerow(result)
+        self._commit({'file': source})
+        self.completed.add(source)
+        self.rows_written += 1
+        if stats is not None:
+            stats.add('csv_write', opstats.timer() - start)
+
+    def close(self, completed=True):
+        """
+        Closes the csv file
+        :param completed: True if the run completed, which removes the journal.
+            False keeps the journal so the run can be resumed.
+        :return: No return value
+        """
+        self._csv_file.close()
+        self._journal_file.close()
+        if completed:
+            os.remove(self.journal_filepath)
+
+    def _commit(self, entry):
+        """Flushes the csv file to disk, then journals the entry with the csv file size."""
+        self._csv_file.flush()
+        os.fsync(self._csv_file.fileno())
+        entry['offset'] = self._csv_file.tell()
+        self._journal_file.write((json.dumps(entry) + '\n').encode('utf-8'))
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def _dict_writer(self, fieldnames):
+        return csv.DictWriter(
+            self._csv_file,
+            delimiter=',',
+            extrasaction='ignore',
+            fieldnames=fieldnames
+        )
+
+    def _read_journal(self, header):
+        """
+        Reads the journal of an interrupted run
+        :param header: Expected journal header for this run
+        :return: Tuple of the csv file size and the journal file size after the
+            last complete entry, or None if the journal has no complete header.
+        """
+        csv_offset = None
+        journal_offset = 0
+        with open(self.journal_filepath, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # Partly written final entry
+                    break
+                if csv_offset is None:
+                    if entry.get('fieldnames') != header['fieldnames'] or \
+                            entry.get('run') != json.loads(json.dumps(header['run'])):
+                        raise ValueError("%s was started with different settings and cannot be resumed."
+                                         % self.out_filepath)
+                else:
+                    self.completed.add(entry['file'])
+                csv_offset = entry['offset']
+                journal_offset += len(line)
+
+        if csv_offset is None:
+            # Stopped while the header was written, before any row
+            return None
+        if not os.path.exists(self.out_filepath) or os.path.getsize(self.out_filepath) < csv_offset:
+            raise ValueError("%s does not match its journal and cannot be resumed." % self.out_filepath)
+        return csv_offset, journal_offset
+
+
+class PeakTable(object):
+    """
+    Table of peaks stored as one array per column: idx, start, rt, end and area.
+    Each column uses 8 bytes per peak, against a tuple and five number objects
+    per peak in a list of tuples. Indexing and iterating give (idx, start, rt,
+    end, area) tuples in the opx.PEAK_LS_* layout, so it can be used in place of
+    a list of peak tuples.
+    cumulative_areas[i] is the total area of the first i peaks, so the area of
+    any run of peaks is the difference of two entries. sorted_starts, sorted_ends
+    and sorted_rts hold each column in ascending order, with start_order,
+    end_order and rt_order giving the table position of each value, so that
+    boundaries and the internal standard window can be found by bisection.
+    The table is not changed once built; the indexes are built with it.
+    """
+    __slots__ = ('idx', 'start', 'rt', 'end', 'area', 'cumulative_areas', 'start_order', 'sorted_starts',
+                 'end_order', 'sorted_ends', 'rt_order', 'sorted_rts')
+
+    def __init__(self, peaks=()):
+        """
+        :param peaks: Iterable of (idx, start, rt, end, area) peak tuples
+        """
+        self.idx = array.array(INDEX_TYPECODE)
+        self.start = array.array(VALUE_TYPECODE)
+        self.rt = array.array(VALUE_TYPECODE)
+        self.end = array.array(VALUE_TYPECODE)
+        self.area = array.array(VALUE_TYPECODE)
+        for peak in peaks:
+            self.idx.append(peak[opx.PEAK_LS_IDX])
+            self.start.append(peak[opx.PEAK_LS_START])
+            self.rt.append(peak[opx.PEAK_LS_RT])
+            self.end.append(peak[opx.PEAK_LS_END])
+            self.area.append(peak[opx.PEAK_LS_AREA])
+        self._build_indexes()
+
+    @classmethod
+    def from_columns(cls, idx, start, rt, end, area):
+        """
+        Builds a table from the values of each column
+        :return: PeakTable instance.
+        """
+        table = cls.__new__(cls)
+        table.idx = array.array(INDEX_TYPECODE, idx)
+        table.start = array.array(VALUE_TYPECODE, start)
+        table.rt = array.array(VALUE_TYPECODE, rt)
+        table.end = array.array(VALUE_TYPECODE, end)
+        table.area = array.array(VALUE_TYPECODE, area)
+        if not len(table.idx) == len(table.start) == len(table.rt) == len(table.end) == len(table.area):
+            raise ValueError("Peak table columns are not the same length.")
+        table._build_indexes()
+        return table
+
+    @property
+    def columns(self):
+        """Column arrays in the opx.PEAK_LS_* order."""
+        return self.idx, self.start, self.rt, self.end, self.area
+
+    def __len__(self):
+        return len(self.idx)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PeakTable.from_columns(*[column[i] for column in self.columns])
+        return self.idx[i], self.start[i], self.rt[i], self.end[i], self.area[i]
+
+    def __iter__(self):
+        return izip(self.idx, self.start, self.rt, self.end, self.area)
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == b for a, b in izip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __repr__(self):
+        return 'PeakTable(%r)' % list(self)
+
+    def __getstate__(self):
+        # Raw column bytes are much smaller and faster to pickle than the values
+        return tuple(_array_bytes(column) for column in self.columns)
+
+    def __setstate__(self, state):
+        self.idx, self.start, self.rt, self.end, self.area = [
+            _array_from_bytes(typecode, data) for typecode, data in zip(COLUMN_TYPECODES, state)]
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """Builds the cumulative area and sorted column indexes."""
+        total = 0.0
+        cumulative_areas = array.array(VALUE_TYPECODE, [total])
+        for area in self.area:
+            total += area
+            cumulative_areas.append(total)
+        self.cumulative_areas = cumulative_areas
+
+        self.start_order, self.sorted_starts = _sort_column(self.start)
+        self.end_order, self.sorted_ends = _sort_column(self.end)
+        self.rt_order, self.sorted_rts = _sort_column(self.rt)
+
+
+class SampleEvaluation(object):
+    """
+    Internal standard and fraction areas of one sample, each resolved once.
+    Concentrations are then pure arithmetic on the stored areas.
+    """
+    def __init__(self, peak_data_list, analysis_c6_c10, istd_rt, istd_rt_tolerance, istd_area_target,
+                 istd_area_tolerance):
+        self.analysis_c6_c10 = analysis_c6_c10
+        self.istd = get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance)
+        self.areas = get_fraction_areas(peak_data_list, analysis_c6_c10)
+
+    @property
+    def fractions(self):
+        """Fraction names for the analysis type, in csv column order."""
+        return fraction_names(self.analysis_c6_c10)
+
+    def concentration(self, fraction, blank, calibration_slope, calibration_intercept, istd_concentration,
+                      dilution_factor):
+        """
+        Calculate the concentration of one fraction of the sample
+        :param fraction: Fraction name, e.g. 'c10_c16'
+        :param blank: Instance of BlankAverage class
+        :return: Final corrected concentration for the fraction.
+        """
+        return calculate_concentration(self.areas[fraction], self.istd, getattr(blank, 'area_' + fraction),
+                                       blank.istd, calibration_slope, calibration_intercept, istd_concentration,
+                                       dilution_factor)
 
 
 ###############################################################################
 # Functions
 ###############################################################################
+def batch_names(directories):
+    """
+    Gets a name for each batch directory, used in the batch column and file names of results
+    :param directories: List of batch directories
+    :return: List of names in directories order. Each is the directory's base name,
+        with a numbered suffix if another directory has the same base name.
+    """
+    names = []
+    for directory in directories:
+        name = os.path.basename(os.path.normpath(os.path.abspath(directory)))
+        unique_name = name
+        n = 1
+        while unique_name in names:
+            n += 1
+            unique_name = '%s_%d' % (name, n)
+        names.append(unique_name)
+    return names
+
+
+def calculate_batch(directory, out_filepath, parameters, processes=opx.DEF_PARSE_PROCESSES, progress=None,
+                    cancelled=None, cache=None, vectorised=False, resume=False, run_report=False, store=None,
+                    continue_on_error=False, recursive=False):
+    """
+    Calculates the results for a directory of reports and writes them to a csv file.
+    Each sample's row is written as soon as it is calculated, so an interrupted
+    run can be resumed after the last completed sample.
+    :param directory: Directory containing the blank and sample reports for one batch
+    :param out_filepath: Path of the csv results file to be written
+    :param parameters: Instance of BatchParameters class
+    :param processes: Number of worker processes used to parse the reports
+    :param progress: Optional callable taking (reports done, total reports), called
+        after each report is processed
+    :param cancelled: Optional callable returning True if the calculation should stop.
+        It is checked between reports and CalculationCancelled is raised if it is set.
+    :param cache: Optional opcache.ReportCache instance used to skip parsing unchanged reports
+    :param vectorised: If True, samples are calculated in blocks of opx.DEF_VECTOR_BLOCK_SIZE
+        with the NumPy engine in opvec instead of one at a time
+    :param resume: If True and out_filepath is from an interrupted run of the same
+        batch, only the samples that were not completed are calculated
+    :param run_report: If True, stage timings and per-file counters are collected
+        and written to a JSON file named out_filepath + opx.RUN_REPORT_SUFFIX
+    :param store: Optional opdb.ResultStore instance. When the run completes, every
+        result in out_filepath (including any from an interrupted run that was
+        resumed) is added to the store as one batch.
+    :param continue_on_error: If True, a sample or blank that cannot be read, fails its
+        internal standard search or has no peak after a fraction boundary does not stop
+        the run. The failures are listed with the
+        reason and the internal standard candidates found in a JSON manifest named
+        out_filepath + opx.FAILURES_SUFFIX, which rerun_failures recalculates. The
+        manifest of an earlier run is removed if nothing fails.
+    :param recursive: If True, reports in sub-directories of directory are part of the batch
+    :return: Number of sample results written by this run.
+    """
+    run_info = {
+        'directory': os.path.abspath(directory),
+        'parameters': parameters.as_dict()
+    }
+    if run_report:
+        return _run_with_report(out_filepath + opx.RUN_REPORT_SUFFIX, run_info, cache, lambda: calculate_batch(
+            directory, out_filepath, parameters, processes, progress, cancelled, cache, vectorised, resume,
+            store=store, continue_on_error=continue_on_error, recursive=recursive))
+
+    # The results file is left out in case it is written to the batch directory
+    blank_file_list, sample_file_list = find_report_files(directory, recursive, exclude=[out_filepath])
+    writer = CsvResultWriter(out_filepath, parameters.fieldnames, run_info, resume)
+    failures = [] if continue_on_error else None
+    try:
+        # Samples completed by an interrupted run are not calculated again
+        sample_file_list = [f for f in sample_file_list if f not in writer.completed]
+        batches = [(directory, blank_file_list, sample_file_list)]
+        for _, f, result in iter_batch_results(batches, parameters, processes, progress, cancelled, cache,
+                                               vectorised, failures):
+            writer.write(f, result)
+    except:
+        # Keep the journal so the run can be resumed
+        writer.close(completed=False)
+        raise
+
+    writer.close(completed=True)
+    if continue_on_error:
+        _write_failure_manifest(out_filepath + opx.FAILURES_SUFFIX, run_info, failures)
+    if store is not None:
+        store.add_batch(parameters, _read_results(out_filepath), directory, results_file=out_filepath)
+    return writer.rows_written
+
+
+def calculate_batches(directories, out_path, parameters, processes=opx.DEF_PARSE_PROCESSES, progress=None,
+                      cancelled=None, cache=None, vectorised=False, resume=False, per_batch=False,
+                      run_report=False, store=None, continue_on_error=False):
+    """
+    Calculates the results for several batch directories in one run. Each directory
+    has its own blank average, and the reports of every directory are parsed over
+    one shared pool so the workers are kept busy across directory boundaries.
+    Parameters not listed are as for calculate_batch.
+    :param directories: List of directories, each containing the blank and sample reports for one batch
+    :param out_path: Path of the combined csv results file, which has a 'batch' column
+        naming the directory of each sample. If per_batch is True, the directory the
+        results files are written to, one <batch>.csv file per batch directory.
+    :param parameters: Instance of BatchParameters class, used for every batch
+    :param per_batch: If True, write one results file per batch instead of a combined file
+    :param run_report: If True, write a JSON run report named out_path + opx.RUN_REPORT_SUFFIX,
+        or with per_batch, 'batches' + opx.RUN_REPORT_SUFFIX in the out_path directory
+    :param store: Optional opdb.ResultStore instance. When the run completes, each
+        batch's results are added to the store in a separate transaction.
+    :param continue_on_error: If True, failures do not stop the run and are listed in a
+        manifest named out_path + opx.FAILURES_SUFFIX, or with per_batch, 'batches' +
+        opx.FAILURES_SUFFIX in the out_path directory
+    :return: Number of sample results written by this run.
+    """
+    names = batch_names(directories)
+    run_info = {
+        'directories': [os.path.abspath(d) for d in directories],
+        'parameters': parameters.as_dict()
+    }
+    if run_report:
+        if per_batch:
+            if not os.path.isdir(out_path):
+                os.makedirs(out_path)
+            run_report_filepath = os.path.join(out_path, 'batches' + opx.RUN_REPORT_SUFFIX)
+        else:
+            run_report_filepath = out_path + opx.RUN_REPORT_SUFFIX
+        return _run_with_report(run_report_filepath, run_info, cache, lambda: calculate_batches(
+            directories, out_path, parameters, processes, progress, cancelled, cache, vectorised, resume,
+            per_batch, store=store, continue_on_error=continue_on_error))
+    if per_batch:
+        if not os.path.isdir(out_path):
+            os.makedirs(out_path)
+        writers = []
+        try:
+            for directory, name in zip(directories, names):
+                writers.append(CsvResultWriter(os.path.join(out_path, name + '.csv'), parameters.fieldnames,
+                                               dict(run_info, directories=[os.path.abspath(directory)]), resume))
+        except:
+            for writer in writers:
+                writer.close(completed=False)
+            raise
+    else:
+        writer = CsvResultWriter(out_path, ['batch'] + parameters.fieldnames, run_info, resume)
+        writers = [writer] * len(directories)
+
+    failures = [] if continue_on_error else None
+    try:
+        batches = []
+        results_files = [writer.out_filepath for writer in set(writers)]
+        for directory, writer in zip(directories, writers):
+            blank_file_list, sample_file_list = find_report_files(directory, exclude=results_files)
+            sample_file_list = [f for f in sample_file_list if f not in writer.completed]
+            batches.append((directory, blank_file_list, sample_file_list))
+
+        for n, f, result in iter_batch_results(batches, parameters, processes, progress, cancelled, cache,
+                                               vectorised, failures):
+            if not per_batch:
+                result['batch'] = names[n]
+            writers[n].write(f, result)
+    except:
+        for writer in set(writers):
+            writer.close(completed=False)
+        raise
+
+    for writer in set(writers):
+        writer.close(completed=True)
+    if continue_on_error:
+        if per_batch:
+            manifest_filepath = os.path.join(out_path, 'batches' + opx.FAILURES_SUFFIX)
+        else:
+            manifest_filepath = out_path + opx.FAILURES_SUFFIX
+        _write_failure_manifest(manifest_filepath, run_info, failures, names)
+
+    if store is not None:
+        if per_batch:
+            for directory, name, writer in zip(directories, names, writers):
+                store.add_batch(parameters, _read_results(writer.out_filepath), directory, name,
+                                writer.out_filepath)
+        else:
+            results = _read_results(out_path)
+            for directory, name in zip(directories, names):
+                store.add_batch(parameters, [r for r in results if r['batch'] == name], directory, name, out_path)
+    return sum(writer.rows_written for writer in set(writers))
+
+
+def calculate_concentration(area, istd, blank_area, blank_istd, calibration_slope, calibration_intercept,
+                            istd_concentration, dilution_factor):
+    """
+    Calculate a blank corrected concentration from a fraction area and internal standard area
+    :param area: Summed peak area of the fraction
+    :param istd: Peak area of the internal standard
+    :param blank_area: Average blank area for the fraction
+    :param blank_istd: Average blank internal standard area
+    :return: Final corrected concentration, rounded to opx.DEF_DECIMAL_PLACES.
+    """
+    istd_blank_corrected = istd * (blank_area / blank_istd)
+    area_blank_corrected = area - istd_blank_corrected
+
+    response_ratio = area_blank_corrected / istd
+    concentration_ratio = (response_ratio - calibration_intercept) / calibration_slope
+
+    concentration_vial = concentration_ratio * istd_concentration
+    concentration_sample = concentration_vial * dilution_factor
+
+    return round(concentration_sample, opx.DEF_DECIMAL_PLACES)
+
+
 def calculate_sample_concentration(peak_data_list, blank, low_index, high_index, istd_rt, istd_rt_tolerance,
                                    istd_area_target, istd_area_tolerance, calibration_slope, calibration_intercept,
                                    istd_concentration, dilution_factor):
@@ -110,97 +754,200 @@ def calculate_sample_concentration(peak_data_list, blank, low_index, high_index,
     :param istd_area_tolerance: Acceptable percent tolerance (expressed as a decimal) for istd area
     :return: Final corrected concentration for compound in sample.
     """
+    if stats is not None:
+        start = opstats.timer()
     area = sum_areas(peak_data_list, low_index, high_index)
     istd = get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance)
 
-    istd_blank_corrected = istd * (blank.area / blank.istd)
-    area_blank_corrected = area - istd_blank_corrected
+    concentration = calculate_concentration(area, istd, blank.area, blank.istd, calibration_slope,
+                                            calibration_intercept, istd_concentration, dilution_factor)
+    if stats is not None:
+        stats.add('concentration', opstats.timer() - start)
+    return concentration
 
-    response_ratio = area_blank_corrected / istd
-    concentration_ratio = (response_ratio - calibration_intercept) / calibration_slope
 
-    concentration_vial = concentration_ratio * istd_concentration
-    concentration_sample = concentration_vial * dilution_factor
+def calculate_sample_result(sample_name, analysis_time, peak_data, blank_average, parameters):
+    """
+    Calculates the fraction concentrations for a single sample
+    :param sample_name: Sample name from the report
+    :param analysis_time: Acquired time from the report
+    :param peak_data: Peak area list for the sample
+    :param blank_average: Instance of BlankAverage class for the batch
+    :param parameters: Instance of BatchParameters class
+    :return: Result dictionary keyed by the csv fieldnames for the analysis type.
+    """
+    evaluation = SampleEvaluation(peak_data, parameters.analysis_c6_c10, **parameters.istd_kwargs())
 
-    return round(concentration_sample, opx.DEF_DECIMAL_PLACES)
+    if stats is not None:
+        start = opstats.timer()
+    result = {
+        'sample_name': sample_name,
+        'analysis_time': analysis_time
+    }
+    for fraction in evaluation.fractions:
+        result['conc_' + fraction] = evaluation.concentration(fraction, blank_average,
+                                                              **parameters.calibration_kwargs())
+    if stats is not None:
+        stats.add('concentration', opstats.timer() - start)
+    return result
 
 
-def get_data_from_report(file):
+def find_batch_directories(root):
+    """
+    Finds the batch directories in a root directory
+    :param root: Directory containing one sub-directory per batch
+    :return: List of the sub-directories that contain reports, sorted by name.
+    """
+    directories = []
+    for name, path, is_dir, _ in sorted(_list_directory(root)):
+        if is_dir and not name.startswith('.') and any(find_report_files(path)):
+            directories.append(path)
+    return directories
+
+
+def find_report_files(directory, recursive=False, exclude=None):
+    """
+    Finds the blank and sample report files in a directory
+    :param directory: Directory containing the reports for one batch
+    :param recursive: If True, reports in sub-directories are included
+    :param exclude: Optional list of files to leave out, e.g. the results file of the run
+    :return: Tuple of the blank file list and the sample file list (includes QC),
+        both sorted by file name.
+    """
+    blank_file_list, sample_file_list, _ = scan_report_files(directory, recursive, exclude)
+    return blank_file_list, sample_file_list
+
+
+def fraction_names(analysis_c6_c10):
+    """
+    Gets the fraction names for the analysis type
+    :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+    :return: List of fraction names, in csv column order.
+    """
+    if analysis_c6_c10:
+        return opx.FRACTIONS_C6_C10
+    return opx.FRACTIONS_C10_C40
+
+
+def get_data_from_excel_report(file):
     """
     Gets retention time and peak area data from a MassHunter-generated Excel report
     :param file: Fully resolved location and file name of target report file
-    :return: List of tuples of each peak, retention time and area of sample
-    """
-    # Open the Excel workbook
-    gcms_book = xlrd.open_workbook(file)
-    sheet = gcms_book.sheet_by_index(0)
-
-    # Find sample name column
-    n = 0
-    while sheet.cell(opx.SAMPLE_NAME_ROW, n).value != 'Sample Name':
-        n += 1
-    sample_name_col = n + 1
-    while sheet.cell(opx.SAMPLE_NAME_ROW, sample_name_col).value == '':
-        sample_name_col += 1
-
-    # Find analysis time column
-    n = 0
-    while sheet.cell(opx.ANALYSIS_TIME_ROW, n).value != 'Acquired Time':
-        n += 1
-    analysis_time_col = n + 1
-    while sheet.cell(opx.ANALYSIS_TIME_ROW, analysis_time_col).value == '':
-        analysis_time_col += 1
-
-    # Collate sample metadata
-    sample_name = sheet.cell(opx.SAMPLE_NAME_ROW, sample_name_col).value
-    analysis_time = sheet.cell(opx.ANALYSIS_TIME_ROW, analysis_time_col).value
-
-    # Find beginning of integration peak list
-    n = 0
-    while sheet.cell(n, opx.PEAK_INDEX_COLUMN).value != "Integration Peak List":
-        n += 1
-    PEAK_LIST_TITLE_ROW = n + 1
-    PEAK_LIST_START_ROW = n + 2
-
-    # Find end of integration peak list
-    n = PEAK_LIST_START_ROW
-    while sheet.cell_type(n, opx.PEAK_INDEX_COLUMN) not in (xlrd.XL_CELL_BLANK, xlrd.XL_CELL_EMPTY):
-        n += 1
-    PEAK_LIST_END_ROW = n
-
-    # Find retention time start column
-    n = 0
-    while sheet.cell(PEAK_LIST_TITLE_ROW, n).value != 'Start':
-        n += 1
-    PEAK_START_COLUMN = n
-
-    # Find retention time midpoint column
-    n = 0
-    while sheet.cell(PEAK_LIST_TITLE_ROW, n).value != 'RT':
-        n += 1
-    RT_COLUMN = n
-
-    # Find retention time end column
-    n = 0
-    while sheet.cell(PEAK_LIST_TITLE_ROW, n).value != 'End':
-        n += 1
-    PEAK_END_COLUMN = n
-
-    # Find area column
-    n = 0
-    while sheet.cell(PEAK_LIST_TITLE_ROW, n).value != 'Area':
-        n += 1
-    AREA_COLUMN = n
-
-    # Import peak and rt data
-    peaks = sheet.col_values(opx.PEAK_INDEX_COLUMN, PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
-    starts = sheet.col_values(PEAK_START_COLUMN, PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
-    rts = sheet.col_values(RT_COLUMN, PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
-    ends = sheet.col_values(PEAK_END_COLUMN, PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
-    areas = sheet.col_values(AREA_COLUMN, PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
-
-    peaks = map(int, peaks)
-    peak_data = zip(peaks, starts, rts, ends, areas)
+    :return: PeakTable of each peak, retention time and area of sample
+    """
+    # Open the Excel workbook, loading only the first sheet
+    gcms_book = xlrd.open_workbook(file, on_demand=True, formatting_info=False)
+    try:
+        sheet = gcms_book.sheet_by_index(0)
+
+        # Collate sample metadata from the header rows
+        sample_name = _get_header_value(sheet.row_values(opx.SAMPLE_NAME_ROW), 'Sample Name')
+        analysis_time = _get_header_value(sheet.row_values(opx.ANALYSIS_TIME_ROW), 'Acquired Time')
+
+        # Find beginning of integration peak list
+        index_column = sheet.col_values(opx.PEAK_INDEX_COLUMN)
+        n = index_column.index("Integration Peak List")
+        PEAK_LIST_TITLE_ROW = n + 1
+        PEAK_LIST_START_ROW = n + 2
+
+        # Find end of integration peak list, at the first blank cell or the end of the sheet
+        PEAK_LIST_END_ROW = sheet.nrows
+        index_types = sheet.col_types(opx.PEAK_INDEX_COLUMN, PEAK_LIST_START_ROW)
+        for n, cell_type in enumerate(index_types, PEAK_LIST_START_ROW):
+            if cell_type in (xlrd.XL_CELL_BLANK, xlrd.XL_CELL_EMPTY):
+                PEAK_LIST_END_ROW = n
+                break
+
+        columns = _get_peak_list_columns(sheet.row_values(PEAK_LIST_TITLE_ROW), file)
+
+        # Import peak and rt data
+        peaks = index_column[PEAK_LIST_START_ROW:PEAK_LIST_END_ROW]
+        starts = sheet.col_values(columns['Start'], PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
+        rts = sheet.col_values(columns['RT'], PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
+        ends = sheet.col_values(columns['End'], PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
+        areas = sheet.col_values(columns['Area'], PEAK_LIST_START_ROW, PEAK_LIST_END_ROW)
+    finally:
+        # Free the workbook straight away, reports are only read once
+        gcms_book.release_resources()
+
+    peak_data = PeakTable.from_columns(map(int, peaks), starts, rts, ends, areas)
+
+    return sample_name, analysis_time, peak_data
+
+
+def get_data_from_report(file):
+    """
+    Gets retention time and peak area data from a MassHunter-generated report,
+    using the reader registered for the report's file extension
+    :param file: Fully resolved location and file name of target report file
+    :return: Tuple of the sample name, analysis time and PeakTable of the sample.
+    """
+    return get_report_reader(file)(file)
+
+
+def get_data_from_reports(file_list, processes=opx.DEF_PARSE_PROCESSES, cache=None):
+    """
+    Gets the report data for a list of reports, optionally over a pool of processes
+    :param file_list: List of fully resolved locations and file names of report files
+    :param processes: Number of worker processes used to parse the reports. 1 parses
+        the reports serially in this process; 0 or None uses one process per CPU.
+    :param cache: Optional opcache.ReportCache instance used to skip parsing unchanged reports
+    :return: List of (sample name, analysis time, peak data) tuples, in the same
+        order as file_list regardless of the order in which the reports finish parsing.
+    """
+    return list(iter_data_from_reports(file_list, processes, cache))
+
+
+def get_data_from_text_report(file):
+    """
+    Gets retention time and peak area data from a MassHunter report exported as
+    delimited text. The export has the same rows and columns as the Excel report.
+    The file is read one row at a time and reading stops at the end of the peak list.
+    :param file: Fully resolved location and file name of target report file
+    :return: Tuple of the sample name, analysis time and PeakTable of the sample.
+    """
+    delimiter = opx.TEXT_REPORT_DELIMITERS.get(os.path.splitext(file)[1].lower(), ',')
+    with open(file, 'rb') as f:
+        rows = csv.reader(f, delimiter=delimiter)
+
+        # Collate sample metadata from the header rows, up to the beginning of the integration peak list
+        sample_name = analysis_time = None
+        for n, row in enumerate(rows):
+            if n == 0 and row and row[0].startswith(codecs.BOM_UTF8):
+                row[0] = row[0][len(codecs.BOM_UTF8):]
+            if n == opx.SAMPLE_NAME_ROW:
+                sample_name = _get_header_value(_decode_row(row), 'Sample Name')
+            elif n == opx.ANALYSIS_TIME_ROW:
+                analysis_time = _get_header_value(_decode_row(row), 'Acquired Time')
+            if len(row) > opx.PEAK_INDEX_COLUMN and row[opx.PEAK_INDEX_COLUMN] == "Integration Peak List":
+                break
+        else:
+            raise ValueError("%s has no integration peak list." % file)
+        if sample_name is None or analysis_time is None:
+            raise ValueError("%s is missing the sample name or acquired time header." % file)
+
+        columns = _get_peak_list_columns(_decode_row(next(rows, [])), file)
+        start_column = columns['Start']
+        rt_column = columns['RT']
+        end_column = columns['End']
+        area_column = columns['Area']
+
+        # Import peak and rt data, up to the first blank index cell or the end of the file
+        peaks = []
+        starts = []
+        rts = []
+        ends = []
+        areas = []
+        for row in rows:
+            if len(row) <= opx.PEAK_INDEX_COLUMN or not row[opx.PEAK_INDEX_COLUMN].strip():
+                break
+            peaks.append(int(float(row[opx.PEAK_INDEX_COLUMN])))
+            starts.append(float(row[start_column]))
+            rts.append(float(row[rt_column]))
+            ends.append(float(row[end_column]))
+            areas.append(float(row[area_column]))
+
+    peak_data = PeakTable.from_columns(peaks, starts, rts, ends, areas)
 
     return sample_name, analysis_time, peak_data
 
@@ -211,10 +958,21 @@ def get_fraction_end_index(peak_data_list, rt_end):
     :param peak_data_list: Peak area list for the sample
     :param rt_end: Ending retention time for boundaries
     :return: Integer representing the ending index.
+    :raises ValueError: If no peak ends at or after rt_end
     """
+    if isinstance(peak_data_list, PeakTable):
+        # Closest end at or after the target is the first one found by bisection
+        k = bisect.bisect_left(peak_data_list.sorted_ends, rt_end)
+        if k == len(peak_data_list):
+            raise ValueError("No peak ends after retention time %s." % rt_end)
+        positions = _equal_differences(peak_data_list.sorted_ends, peak_data_list.end_order, rt_end, k, 1)
+        return peak_data_list.idx[min(positions)]
+
     # Get the differences for each peak and find the closest to zero that
     end_indexes = [(x[opx.PEAK_LS_IDX], x[opx.PEAK_LS_END] - rt_end) for x in peak_data_list if
                    x[opx.PEAK_LS_END] - rt_end >= 0]
+    if not end_indexes:
+        raise ValueError("No peak ends after retention time %s." % rt_end)
     # Get ending index
     end_tuple = min(end_indexes, key = lambda i: i[1])
     return end_tuple[0]
@@ -227,6 +985,15 @@ def get_fraction_start_index(peak_data_list, rt_start):
     :param rt_start: Starting retention time for boundaries
     :return: Integer representing the starting index.
     """
+    if isinstance(peak_data_list, PeakTable):
+        # Closest start at or before the target is the last one found by bisection
+        k = bisect.bisect_right(peak_data_list.sorted_starts, rt_start)
+        if k == 0:
+            # First detected peak starts after target retention time
+            return 1
+        positions = _equal_differences(peak_data_list.sorted_starts, peak_data_list.start_order, rt_start, k - 1, -1)
+        return peak_data_list.idx[min(positions)]
+
     # Get the differences for each peak and find the closest to zero that
     start_indexes = [(x[opx.PEAK_LS_IDX], abs(x[opx.PEAK_LS_START] - rt_start)) for x in peak_data_list if
                    x[opx.PEAK_LS_START] - rt_start <= 0]
@@ -240,6 +1007,38 @@ def get_fraction_start_index(peak_data_list, rt_start):
     return start_idx
 
 
+def get_fraction_areas(peak_data_list, analysis_c6_c10):
+    """
+    Sums the areas of every fraction for the analysis type
+    :param peak_data_list: Peak area list for the sample
+    :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+    :return: Dictionary of fraction name (e.g. 'c10_c16') to summed area.
+    """
+    if stats is not None:
+        start = opstats.timer()
+
+    # C6-C10
+    if analysis_c6_c10:
+        i_c10 = get_fraction_end_index(peak_data_list, opx.C6_C10_END)
+        if stats is not None:
+            stats.add('fraction_index', opstats.timer() - start)
+        return {'c6_c10': sum_areas(peak_data_list, 0, i_c10)}
+
+    # C10-C16, C16-C34, C34-C40 and C10-C40
+    i_c10 = get_fraction_start_index(peak_data_list, opx.C10_C16_START)
+    i_c16 = get_fraction_end_index(peak_data_list, opx.C10_C16_END)
+    i_c34 = get_fraction_end_index(peak_data_list, opx.C16_C34_END)
+    i_c40 = get_fraction_end_index(peak_data_list, opx.C34_C40_END)
+    if stats is not None:
+        stats.add('fraction_index', opstats.timer() - start)
+    return {
+        'c10_c16': sum_areas(peak_data_list, i_c10, i_c16),
+        'c16_c34': sum_areas(peak_data_list, i_c16, i_c34),
+        'c34_c40': sum_areas(peak_data_list, i_c34, i_c40),
+        'c10_c40': sum_areas(peak_data_list, i_c10, i_c40)
+    }
+
+
 def get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance):
     """
     Get the peak area for the given internal standard
@@ -250,6 +1049,9 @@ def get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target,
     :param istd_area_tolerance: Acceptable percent tolerance (expressed as a decimal) for istd area
     :return: Peak area integration for the internal standard
     """
+    if stats is not None:
+        start = opstats.timer()
+
     # Calculate acceptable retention time window
     istd_rt_low = istd_rt - istd_rt_tolerance
     istd_rt_high = istd_rt + istd_rt_tolerance
@@ -258,8 +1060,22 @@ def get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target,
     upper_limit = istd_area_target + istd_area_tolerance
 
     # Find all peaks in istd range
-    istd_peak_list = [(x[opx.PEAK_LS_RT], x[opx.PEAK_LS_AREA]) for x in peak_data_list if istd_rt_low <= x[opx.PEAK_LS_RT] <= istd_rt_high
-                      and lower_limit <= x[opx.PEAK_LS_AREA] <= upper_limit]
+    if isinstance(peak_data_list, PeakTable):
+        # Bisect the retention time window, then check areas in table order
+        low = bisect.bisect_left(peak_data_list.sorted_rts, istd_rt_low)
+        high = bisect.bisect_right(peak_data_list.sorted_rts, istd_rt_high)
+        rts = peak_data_list.rt
+        areas = peak_data_list.area
+        istd_peak_list = [(rts[i], areas[i]) for i in sorted(peak_data_list.rt_order[low:high])
+                          if lower_limit <= areas[i] <= upper_limit]
+    else:
+        istd_peak_list = [(x[opx.PEAK_LS_RT], x[opx.PEAK_LS_AREA]) for x in peak_data_list if istd_rt_low <= x[opx.PEAK_LS_RT] <= istd_rt_high
+                          and lower_limit <= x[opx.PEAK_LS_AREA] <= upper_limit]
+
+    if stats is not None:
+        stats.add('istd_search', opstats.timer() - start)
+        stats.count(('istd_none', 'istd_single_candidate', 'istd_multiple_candidates')[min(len(istd_peak_list), 2)])
+        stats.record_current(istd_candidates=len(istd_peak_list))
 
     # Try to isolate a single peak if there are multiples
     if len(istd_peak_list) > 1:
@@ -275,6 +1091,306 @@ def get_istd_area(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target,
         return istd_peak_list[0][1]  # istd area
 
 
+def get_istd_candidates(peak_data_list, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance,
+                        count=opx.DEF_ISTD_CANDIDATE_COUNT):
+    """
+    Gets the peaks that could be the internal standard, to show why a search failed
+    :param peak_data_list: Peak area list for the sample
+    :param count: Number of peaks nearest the retention time target listed when none are in the window
+    :return: List of dictionaries with each peak's index, retention time and area, and
+        whether it is in the retention time window and area range, nearest the target
+        first. Every peak in the retention time window is listed, or if there are none,
+        the count peaks nearest the target.
+    """
+    istd_rt_low = istd_rt - istd_rt_tolerance
+    istd_rt_high = istd_rt + istd_rt_tolerance
+    lower_limit = istd_area_target - istd_area_tolerance
+    upper_limit = istd_area_target + istd_area_tolerance
+
+    peaks = sorted(peak_data_list, key=lambda x: abs(x[opx.PEAK_LS_RT] - istd_rt))
+    candidates = [x for x in peaks if istd_rt_low <= x[opx.PEAK_LS_RT] <= istd_rt_high] or peaks[:count]
+    return [{
+        'peak': x[opx.PEAK_LS_IDX],
+        'rt': x[opx.PEAK_LS_RT],
+        'area': x[opx.PEAK_LS_AREA],
+        'in_rt_window': istd_rt_low <= x[opx.PEAK_LS_RT] <= istd_rt_high,
+        'in_area_range': lower_limit <= x[opx.PEAK_LS_AREA] <= upper_limit
+    } for x in candidates]
+
+
+def get_report_reader(file):
+    """
+    Gets the reader function for a report file from its extension
+    :param file: Location and file name of the report
+    :return: Reader function taking the file and returning (sample name, analysis time, PeakTable).
+        Files with an extension that has no registered reader are read as Excel reports.
+    """
+    return REPORT_READERS.get(os.path.splitext(file)[1].lower(), get_data_from_excel_report)
+
+
+def is_blank_report(file):
+    """
+    Checks whether a report is a blank
+    :param file: Report file location or name
+    :return: True if the file name contains opx.BLANK_TAG, in any case.
+    """
+    return opx.BLANK_TAG.lower() in os.path.basename(file).lower()
+
+
+def iter_batch_results(batches, parameters, processes=opx.DEF_PARSE_PROCESSES, progress=None, cancelled=None,
+                       cache=None, vectorised=False, failures=None):
+    """
+    Generates the result of each sample of a list of batches, the parse and evaluate stages of run_pipeline.
+    Every report is parsed over one pool and each batch's blanks come before its
+    samples. Only the reports in the parse window, one blank and (when vectorised)
+    one block of samples are held at a time, so memory does not grow with the batches.
+    :param batches: Iterable of (directory, blank file list, sample file list) tuples, as iter_batches.
+        It is read in full before the first report is parsed, as the file list of every
+        batch is needed for the shared pool and the progress total.
+    :param parameters: Instance of BatchParameters class, used for every batch
+    :param processes: Number of worker processes used to parse the reports
+    :param progress: Optional callable taking (reports done, total reports)
+    :param cancelled: Optional callable returning True if the calculation should stop
+    :param cache: Optional opcache.ReportCache instance
+    :param vectorised: If True, samples are calculated in blocks with the NumPy engine in opvec
+    :param failures: If a list, errors do not stop the run. A (batch number, failure
+        record) pair is appended to it for each report that cannot be read, fails its
+        internal standard search or has no peak after a fraction boundary, and for every
+        sample of a batch with no blank average.
+    :return: Generator of (batch number, sample file, result dictionary) tuples in
+        batch and file order. Closing the generator early stops the pool.
+    """
+    if vectorised:
+        # Imported here so numpy is only needed by the vectorised engine
+        import opvec
+        calculate_block = opvec.calculate_sample_results
+    else:
+        calculate_block = _calculate_sample_block
+
+    # Only the file names are listed up front, for the shared pool and the progress total
+    batches = list(batches)
+    file_list = []
+    for _, blank_file_list, sample_file_list in batches:
+        file_list.extend(blank_file_list)
+        file_list.extend(sample_file_list)
+    total = len(file_list)
+    done = 0
+
+    # The pool works ahead into the following batches while a blank average is
+    # calculated, so the workers are not left idle between batches
+    reports = iter_data_from_reports(file_list, processes, cache, errors=failures is not None)
+    try:
+        for batch_number, (directory, blank_file_list, sample_file_list) in enumerate(batches):
+            # Each blank is added to the average as it is read and its peak data is not kept
+            blank_average = BlankAverage(analysis_c6_c10=parameters.analysis_c6_c10, **parameters.istd_kwargs())
+            for f in blank_file_list:
+                _check_cancelled(cancelled)
+                report_data = next(reports)
+                if stats is not None:
+                    stats.record(f, batch=directory, blank=True)
+                if isinstance(report_data, ReportError):
+                    _add_failure(failures, batch_number, f, directory, True, 'unreadable', report_data)
+                else:
+                    if stats is not None:
+                        stats.current_file = f
+                    try:
+                        blank_average.add(report_data[2])
+                    except (IstdError, ValueError) as e:
+                        # ValueError is raised for a report with no peak after a fraction boundary
+                        if failures is None:
+                            e.blank = True
+                            e.batch = directory
+                            raise
+                        _add_failure(failures, batch_number, f, directory, True, _failure_reason(e), e,
+                                     report_data, parameters)
+                    finally:
+                        if stats is not None:
+                            stats.current_file = None
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+
+            # An average of the remaining blanks would give different results, so
+            # the batch's samples fail with any of its blanks
+            if not blank_file_list:
+                if failures is None:
+                    raise ValueError("No blank reports found in %s." % directory)
+                blank_failure = "No blank reports found."
+                blank_average = None
+            elif blank_average.count < len(blank_file_list):
+                blank_failure = "No blank average, %d of %d blanks failed." % (
+                    len(blank_file_list) - blank_average.count, len(blank_file_list))
+                blank_average = None
+            elif stats is not None:
+                stats.blanks[directory] = blank_average.spread()
+
+            # Iterate through sample files, yielding each result as it is calculated
+            block_files = []
+            block = []
+            block_size = opx.DEF_VECTOR_BLOCK_SIZE if vectorised else 1
+            for n, f in enumerate(sample_file_list):
+                _check_cancelled(cancelled)
+                report_data = next(reports)
+                if isinstance(report_data, ReportError):
+                    _add_failure(failures, batch_number, f, directory, False, 'unreadable', report_data)
+                elif blank_average is None:
+                    _add_failure(failures, batch_number, f, directory, False, 'blank_average', blank_failure,
+                                 report_data)
+                else:
+                    block_files.append(f)
+                    block.append(report_data)
+                    if stats is not None:
+                        stats.record(f, batch=directory, blank=False, sample_name=report_data[0])
+                if block and (len(block) == block_size or n == len(sample_file_list) - 1):
+                    if stats is not None:
+                        # Values recorded during the calculation belong to the block's samples
+                        stats.current_file = block_files[0] if len(block) == 1 else None
+                        stats.current_block = block_files
+                        start = opstats.timer()
+                    try:
+                        results = calculate_block(block, blank_average, parameters)
+                    except (IstdError, ValueError) as e:
+                        if failures is None:
+                            e.batch = directory
+                            raise
+                        # Calculate the block one sample at a time to find the ones that failed
+                        results = []
+                        for block_file, report_data in zip(block_files, block):
+                            if stats is not None:
+                                stats.current_file = block_file
+                            try:
+                                results.append(calculate_sample_result(report_data[0], report_data[1],
+                                                                       report_data[2], blank_average, parameters))
+                            except (IstdError, ValueError) as sample_error:
+                                results.append(None)
+                                _add_failure(failures, batch_number, block_file, directory, False,
+                                             _failure_reason(sample_error), sample_error, report_data,
+                                             parameters)
+                    if stats is not None:
+                        seconds = opstats.timer() - start
+                        stats.add('sample_calculation', seconds)
+                        for block_file in block_files:
+                            stats.record(block_file, calculate_seconds=seconds / len(block_files))
+                        stats.current_file = None
+                        stats.current_block = []
+                    for block_file, result in zip(block_files, results):
+                        if result is not None:
+                            yield batch_number, block_file, result
+                    block_files = []
+                    block = []
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+    finally:
+        # Stops the parsing pool straight away if the batches ended early
+        reports.close()
+
+
+def iter_batches(directories, recursive=False, exclude=None):
+    """
+    Generates the blank and sample report files of each batch directory, the discover stage of run_pipeline
+    :param directories: Iterable of directories, each containing the blank and sample reports for one batch
+    :param recursive: If True, reports in sub-directories are part of the batch
+    :param exclude: Optional list of files to leave out, e.g. the results file of the run
+    :return: Generator of (directory, blank file list, sample file list) tuples. Each
+        directory is only scanned when its batch is taken, though iter_batch_results
+        takes every batch before it starts parsing.
+    """
+    for directory in directories:
+        blank_file_list, sample_file_list = find_report_files(directory, recursive, exclude)
+        yield directory, blank_file_list, sample_file_list
+
+
+def iter_data_from_reports(file_list, processes=opx.DEF_PARSE_PROCESSES, cache=None, errors=False, window=None,
+                           pool=None):
+    """
+    Generates the report data for a list of reports, optionally parsed over a pool of processes
+    :param file_list: List of fully resolved locations and file names of report files
+    :param processes: Number of worker processes used to parse the reports. 1 parses
+        the reports serially in this process; 0 or None uses one process per CPU.
+    :param cache: Optional opcache.ReportCache instance. Cached reports are not
+        parsed again and newly parsed reports are added to the cache.
+    :param errors: If True, a report that cannot be read gives a ReportError instance
+        with the reason instead of stopping the run. Failed reports are not cached.
+    :param window: Maximum number of reports being parsed or waiting to be taken, or None
+        for opx.DEF_PARSE_WINDOW_PER_PROCESS per process. The pool waits while the
+        caller is behind, so parsed reports do not build up in memory.
+    :param pool: Optional multiprocessing.Pool to parse the reports over instead of
+        starting one, e.g. a pool shared by the requests of a long running server.
+        processes is then only used for the window, and the pool is left running.
+    :return: Generator of (sample name, analysis time, peak data) tuples in the same
+        order as file_list. Closing the generator early stops a pool it started.
+    """
+    file_list = list(file_list)
+
+    # Only reports missing from the cache need parsing. Their cache keys are taken
+    # before they are parsed, so a report changed while it is parsed is parsed again.
+    if cache is not None:
+        parse_list = cache.missing(file_list)
+        keys = dict((f, cache.key(f)) for f in parse_list)
+    else:
+        parse_list = file_list
+
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(parse_list))
+
+    # Parse times are measured where the report is parsed, which may be a worker process
+    parse = functools.partial(_read_report, timed=stats is not None, errors=errors)
+
+    # Not worth the cost of starting a pool for a single process
+    shared_pool = pool is not None
+    if shared_pool and parse_list:
+        parsed = _imap_bounded(pool, parse, parse_list,
+                               window or opx.DEF_PARSE_WINDOW_PER_PROCESS * max(processes, 1))
+    elif processes <= 1:
+        pool = None
+        parsed = (parse(f) for f in parse_list)
+    else:
+        pool = multiprocessing.Pool(processes)
+        parsed = _imap_bounded(pool, parse, parse_list, window or opx.DEF_PARSE_WINDOW_PER_PROCESS * processes)
+
+    parse_set = set(parse_list)
+    completed = False
+    try:
+        for f in file_list:
+            if f not in parse_set:
+                if stats is not None:
+                    start = opstats.timer()
+                keys[f] = cache.key(f)
+                report_data = cache.get(f, keys[f])
+                cache_hit = report_data is not None
+                if not cache_hit:
+                    # Evicted since the cache was checked
+                    report_data = _read_report(f, errors=errors)
+                if stats is not None:
+                    seconds = opstats.timer() - start
+            else:
+                report_data = next(parsed)
+                cache_hit = False
+                if stats is not None:
+                    report_data, seconds = report_data
+
+            failed = isinstance(report_data, ReportError)
+            if cache is not None and not cache_hit and not failed:
+                cache.put(f, report_data, keys[f])
+            if stats is not None:
+                stats.add('cache_read' if cache_hit else 'parse', seconds)
+                if failed:
+                    stats.record(f, read_seconds=seconds, cache_hit=False)
+                else:
+                    stats.record(f, read_seconds=seconds, cache_hit=cache_hit, peaks=len(report_data[2]))
+            yield report_data
+        completed = True
+    finally:
+        if pool is not None and not shared_pool:
+            if completed:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+
 def mean(list):
     """
     Calculates the mean of a given list of numbers.
@@ -284,16 +1400,197 @@ def mean(list):
     return sum(list) / len(list)
 
 
+def read_failure_manifest(manifest_filepath):
+    """
+    Reads a failure manifest written by a run with continue_on_error
+    :param manifest_filepath: Path of the JSON failure manifest
+    :return: Dictionary of the run that wrote the manifest ('run') and its failure
+        records ('failures'), each with the report file, its batch directory and
+        name, whether it is a blank, the sample name, the reason ('unreadable',
+        'istd', 'fraction_boundary' or 'blank_average'), the error message and any
+        internal standard candidates from get_istd_candidates.
+    """
+    with open(manifest_filepath, 'r') as f:
+        return json.load(f)
+
+
+def register_report_reader(extensions, reader):
+    """
+    Registers a reader function for report files with the given extensions. Readers
+    must be registered when their module is imported, so that the worker processes
+    parsing reports have the same readers.
+    :param extensions: List of file extensions including the dot, e.g. ['.csv']
+    :param reader: Function taking the report file and returning (sample name,
+        analysis time, PeakTable), as get_data_from_excel_report
+    :return: No return value
+    """
+    for extension in extensions:
+        REPORT_READERS[extension.lower()] = reader
+
+
+def rerun_failures(manifest_filepath, out_filepath, parameters, processes=opx.DEF_PARSE_PROCESSES, progress=None,
+                   cancelled=None, cache=None, vectorised=False, run_report=False, store=None):
+    """
+    Recalculates only the reports listed in a failure manifest, e.g. with adjusted
+    internal standard tolerances, and writes their results to a new csv file. The
+    blanks of each batch are read again for its blank average, so a batch whose
+    blank failed is recalculated in full. Reports that fail again are listed in a
+    new manifest named out_filepath + opx.FAILURES_SUFFIX for a further rerun.
+    Parameters not listed are as for calculate_batch.
+    :param manifest_filepath: Failure manifest written by a run with continue_on_error
+    :param out_filepath: Path of the csv results file to be written, which has a
+        'batch' column if the manifest was written by calculate_batches
+    :return: Number of sample results written.
+    """
+    run_info = {
+        'manifest': os.path.abspath(manifest_filepath),
+        'parameters': parameters.as_dict()
+    }
+    if run_report:
+        return _run_with_report(out_filepath + opx.RUN_REPORT_SUFFIX, run_info, cache, lambda: rerun_failures(
+            manifest_filepath, out_filepath, parameters, processes, progress, cancelled, cache, vectorised,
+            store=store))
+
+    # Failed samples by batch directory, in the order they were calculated
+    directories = []
+    names = {}
+    sample_file_lists = {}
+    for failure in read_failure_manifest(manifest_filepath)['failures']:
+        directory = failure['directory']
+        if directory not in sample_file_lists:
+            directories.append(directory)
+            names[directory] = failure['batch']
+            sample_file_lists[directory] = []
+        if not failure['blank']:
+            sample_file_lists[directory].append(failure['file'])
+    batch_column = any(names[d] is not None for d in directories)
+
+    writer = CsvResultWriter(out_filepath, ['batch'] + parameters.fieldnames if batch_column else
+                             parameters.fieldnames, run_info)
+    failures = []
+    try:
+        batches = [(d, find_report_files(d, exclude=[out_filepath])[0], sample_file_lists[d]) for d in directories]
+        for n, f, result in iter_batch_results(batches, parameters, processes, progress, cancelled, cache,
+                                               vectorised, failures):
+            if batch_column:
+                result['batch'] = names[directories[n]]
+            writer.write(f, result)
+    except:
+        writer.close(completed=False)
+        raise
+
+    writer.close(completed=True)
+    _write_failure_manifest(out_filepath + opx.FAILURES_SUFFIX, run_info, failures,
+                            [names[d] for d in directories])
+    if store is not None:
+        results = _read_results(out_filepath)
+        for directory in directories:
+            store.add_batch(parameters, [r for r in results if r.get('batch') == names[directory]], directory,
+                            names[directory], out_filepath)
+    return writer.rows_written
+
+
+def run_pipeline(directories, parameters, write, stages=None, processes=opx.DEF_PARSE_PROCESSES, progress=None,
+                 cancelled=None, cache=None, vectorised=False, failures=None, recursive=False, exclude=None):
+    """
+    Calculates batch directories as a pipeline of generator stages: discover (iter_batches),
+    parse and evaluate (iter_batch_results), any stages given, and write. Every directory
+    is scanned first, for the shared pool and the progress total. After that each stage
+    takes items from the one before only as it needs them, so a stage that falls behind
+    holds the others back. Memory for the reports stays bounded by the parse window and
+    the vectorised block size however many reports there are; only the file names of
+    every batch are held. Parameters not listed are as for iter_batch_results.
+    :param directories: Iterable of directories, each containing the blank and sample reports for one batch
+    :param parameters: Instance of BatchParameters class, used for every batch
+    :param write: Callable taking (batch number, sample file, result dictionary) for each
+        result that reaches the end of the pipeline, e.g. a CsvResultWriter's write
+        wrapped to drop the batch number
+    :param stages: Optional list of callables, each taking an iterable of (batch number,
+        sample file, result dictionary) tuples and returning one, applied in order
+        between evaluation and writing (e.g. to filter, annotate or copy results)
+    :param failures: If a list, errors do not stop the run and are appended to it, as iter_batch_results
+    :param recursive: If True, reports in sub-directories are part of each batch
+    :param exclude: Optional list of files to leave out, e.g. the results file of the run
+    :return: Number of results written.
+    """
+    results = iter_batch_results(iter_batches(directories, recursive, exclude), parameters, processes, progress,
+                                 cancelled, cache, vectorised, failures)
+    try:
+        stream = results
+        for stage in stages or []:
+            stream = stage(stream)
+        rows_written = 0
+        for batch_number, f, result in stream:
+            write(batch_number, f, result)
+            rows_written += 1
+    finally:
+        # Stops the parsing pool if a stage or the write raised
+        results.close()
+    return rows_written
+
+
+def scan_report_files(directory, recursive=False, exclude=None):
+    """
+    Classifies the files in a directory as blanks, samples or ignored files, reading the directory once.
+    A file is a blank if its name contains opx.BLANK_TAG in any case. Excel and
+    LibreOffice temp and lock files, hidden files, opx.IGNORED_FILE_NAMES and the
+    journal, run report and failure manifest of a run are ignored.
+    :param directory: Directory containing the reports for one batch
+    :param recursive: If True, the files in sub-directories are included
+    :param exclude: Optional list of files to ignore, e.g. the results file of the run
+    :return: Tuple of the blank file list, the sample file list and the ignored file
+        list, each sorted by path.
+    """
+    # Compared by normalised absolute path, so the same file is matched however it is written
+    excluded = set(os.path.normcase(os.path.abspath(f)) for f in exclude or [])
+    ignored_names = set(opx.IGNORED_FILE_NAMES)
+    blank_file_list = []
+    sample_file_list = []
+    ignored_file_list = []
+    directories = [directory]
+    while directories:
+        for name, path, is_dir, is_file in _list_directory(directories.pop()):
+            if is_dir:
+                # Hidden directories (e.g. .git or a cache) are not searched
+                if recursive and not name.startswith('.'):
+                    directories.append(path)
+                continue
+            if not is_file:
+                continue
+            lower_name = name.lower()
+            if (lower_name in ignored_names or lower_name.startswith(opx.IGNORED_FILE_PREFIXES) or
+                    lower_name.endswith(opx.IGNORED_FILE_SUFFIXES) or
+                    os.path.normcase(os.path.abspath(path)) in excluded):
+                ignored_file_list.append(path)
+            elif is_blank_report(name):
+                blank_file_list.append(path)
+            else:
+                sample_file_list.append(path)
+    return sorted(blank_file_list), sorted(sample_file_list), sorted(ignored_file_list)
+
+
 def sum_areas(peak_data_list, low_index, high_index):
     """
     Sums the peak areas given a set of bounding indices for the peak data list
     :param peak_data_list: Peak area list for the sample
     :param low_index: Index of first peak to sum
     :param high_index: Index of final peak in list to sum
-    :return: Total area between the bounding indices.
+    :return: Total area between the bounding indices. For a PeakTable this is the
+        difference of two running totals, which can differ from sum() of the list
+        slice by rounding error of at most len(peak_data_list) * 2**-52 times the
+        sample's total area, as peak areas are never negative.
     """
-    areas = [x[opx.PEAK_LS_AREA] for x in peak_data_list[low_index:high_index]]
-    return sum(areas)
+    cumulative_areas = getattr(peak_data_list, 'cumulative_areas', None)
+    if cumulative_areas is None:
+        # Plain list without an area index
+        areas = [x[opx.PEAK_LS_AREA] for x in peak_data_list[low_index:high_index]]
+        return sum(areas)
+
+    # Same bounds as the list slice peak_data_list[low_index:high_index]
+    low_index, high_index, _ = slice(low_index, high_index).indices(len(peak_data_list))
+    if high_index <= low_index:
+        return 0
+    return cumulative_areas[high_index] - cumulative_areas[low_index]
 
 
 def write_to_csv(data_list, out_filepath, fieldnames_list):
@@ -305,6 +1602,8 @@ def write_to_csv(data_list, out_filepath, fieldnames_list):
     :param fieldnames_list: List of fieldnames to be used when writing
     :return: No return value
     """
+    if stats is not None:
+        start = opstats.timer()
     with open(out_filepath, 'wb') as f:
         writer = csv.DictWriter(
             f,
@@ -314,4 +1613,247 @@ def write_to_csv(data_list, out_filepath, fieldnames_list):
         )
         writer.writeheader()
         writer.writerows(data_list)
+    if stats is not None:
+        stats.add('csv_write', opstats.timer() - start)
     return True
+
+
+def _add_failure(failures, batch_number, file, directory, blank, reason, error, report_data=None,
+                 parameters=None):
+    """
+    Appends a (batch number, failure record) pair for a report that failed
+    :param reason: 'unreadable', 'istd', 'fraction_boundary' or 'blank_average'
+    :param error: Exception or message describing the failure
+    :param report_data: Report data, if the report was read
+    :param parameters: Instance of BatchParameters class, for listing the internal standard candidates
+    :return: No return value
+    """
+    failure = {
+        'file': os.path.abspath(file),
+        'directory': os.path.abspath(directory),
+        'blank': blank,
+        'sample_name': report_data[0] if report_data is not None else None,
+        'reason': reason,
+        'error': '%s' % error,
+        'istd_candidates': None
+    }
+    if reason == 'istd':
+        failure['istd_candidates'] = get_istd_candidates(report_data[2], **parameters.istd_kwargs())
+    failures.append((batch_number, failure))
+    if stats is not None:
+        stats.count('failed_reports')
+        stats.record(file, failure=reason)
+
+
+def _array_bytes(column):
+    """Gets the raw bytes of an array."""
+    return column.tobytes() if hasattr(column, 'tobytes') else column.tostring()
+
+
+def _array_from_bytes(typecode, data):
+    """Builds an array from raw bytes written by _array_bytes."""
+    column = array.array(typecode)
+    if hasattr(column, 'frombytes'):
+        column.frombytes(data)
+    else:
+        column.fromstring(data)
+    return column
+
+
+def _calculate_sample_block(sample_reports, blank_average, parameters):
+    """Calculates the results for a list of sample reports one sample at a time."""
+    result_set = []
+    for sample_name, analysis_time, peak_data in sample_reports:
+        try:
+            result = calculate_sample_result(sample_name, analysis_time, peak_data, blank_average, parameters)
+        except IstdError as e:
+            e.sample_name = sample_name
+            raise
+        result_set.append(result)
+    return result_set
+
+
+def _check_cancelled(cancelled):
+    """Raises CalculationCancelled if the cancelled callable is set and returns True."""
+    if cancelled is not None and cancelled():
+        raise CalculationCancelled("Calculation cancelled.")
+
+
+def _decode_row(row):
+    """Decodes the cells of a row read from a text report to unicode, as xlrd gives."""
+    return [cell.decode('utf-8') if isinstance(cell, bytes) else cell for cell in row]
+
+
+def _default(value, default):
+    """Returns value, or default if value is None."""
+    if value is None:
+        return default
+    return value
+
+
+def _equal_differences(sorted_values, order, target, k, step):
+    """
+    Gets the list positions of the peaks closest to target, stepping through the
+    sorted values from the closest one at k. Differences are compared as calculated,
+    as the linear searches do, so values that round to the same difference tie.
+    """
+    closest = abs(sorted_values[k] - target)
+    positions = []
+    while 0 <= k < len(sorted_values) and abs(sorted_values[k] - target) == closest:
+        positions.append(order[k])
+        k += step
+    return positions
+
+
+def _failure_reason(error):
+    """Gets the failure reason for an error from calculating a sample or adding a blank."""
+    return 'istd' if isinstance(error, IstdError) else 'fraction_boundary'
+
+
+def _get_header_value(row_values, label):
+    """
+    Gets a report header value, which is the first non-empty cell after its label
+    :param row_values: List of cell values in the header row
+    :param label: Header label, e.g. 'Sample Name'
+    :return: Header value.
+    """
+    n = row_values.index(label)
+    for value in row_values[n + 1:]:
+        if value != '':
+            return value
+    raise ValueError("No value found for report header '%s'." % label)
+
+
+def _get_peak_list_columns(title_row, file):
+    """
+    Finds the start, RT, end and area columns in one pass of the peak list title row
+    :return: Dictionary of column title to column number.
+    """
+    columns = {}
+    for n, title in enumerate(title_row):
+        if title in opx.PEAK_LIST_TITLES and title not in columns:
+            columns[title] = n
+    missing = [title for title in opx.PEAK_LIST_TITLES if title not in columns]
+    if missing:
+        raise ValueError("%s has no %s column in the integration peak list." % (file, missing[0]))
+    return columns
+
+
+def _imap_bounded(pool, function, items, window):
+    """
+    Generates function(item) for each item in order, computed over a pool with at most
+    window items submitted and not yet taken. Unlike Pool.imap, which submits every item
+    at once and keeps each result until it is taken, the next item is only submitted
+    when a result is taken.
+    """
+    items = iter(items)
+    pending = collections.deque(pool.apply_async(function, (item,)) for item in itertools.islice(items, window))
+    while pending:
+        result = pending.popleft().get()
+        for item in itertools.islice(items, 1):
+            pending.append(pool.apply_async(function, (item,)))
+        yield result
+
+
+def _list_directory(directory):
+    """Generates (name, path, is directory, is file) for each entry of a directory, with one directory read."""
+    if scandir is None:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            yield name, path, os.path.isdir(path), os.path.isfile(path)
+    else:
+        for entry in scandir(directory):
+            # The entry types come from the directory read, so most files are not stat'ed again
+            yield entry.name, entry.path, entry.is_dir(), entry.is_file()
+
+
+def _read_report(file, timed=False, errors=False):
+    """
+    Gets the report data for iter_data_from_reports, in the process that parses the report
+    :param timed: If True, return (report data, seconds taken) for the run report
+    :param errors: If True, return a ReportError instance if the report cannot be read
+    """
+    start = opstats.timer()
+    try:
+        report_data = get_data_from_report(file)
+    except Exception as e:
+        if not errors:
+            raise
+        # Library exceptions may not pickle, so only the reason goes back from a worker
+        report_data = ReportError('%s: %s' % (type(e).__name__, e))
+    if timed:
+        return report_data, opstats.timer() - start
+    return report_data
+
+
+def _read_results(out_filepath):
+    """Reads the result dictionaries back from a completed csv results file."""
+    with open(out_filepath, 'rb') as f:
+        return list(csv.DictReader(f))
+
+
+def _run_with_report(run_report_filepath, run_info, cache, calculate):
+    """
+    Runs a batch calculation with stats collected by an opstats.RunStats instance
+    and writes the run report, including when the calculation fails or is cancelled.
+    :return: Return value of the calculate callable.
+    """
+    global stats
+    previous_stats = stats
+    stats = opstats.RunStats(run_info)
+    if cache is not None:
+        cache_counts = cache.hits, cache.misses
+    try:
+        rows_written = calculate()
+    except BaseException as e:
+        stats.finish(completed=False, error='%s: %s' % (type(e).__name__, e))
+        raise
+    else:
+        stats.finish(completed=True, rows_written=rows_written)
+        return rows_written
+    finally:
+        if cache is not None:
+            stats.count('cache_hits', cache.hits - cache_counts[0])
+            stats.count('cache_misses', cache.misses - cache_counts[1])
+        stats.write(run_report_filepath)
+        stats = previous_stats
+
+
+def _sort_column(values):
+    """
+    Gets the sort order and sorted values of a PeakTable column
+    :return: Tuple of the order array (table position of each sorted value) and sorted values array.
+    """
+    # Peaks come out of MassHunter in RT order, so columns are usually sorted already
+    if all(a <= b for a, b in izip(values, itertools.islice(values, 1, None))):
+        # The column is not changed, so it can double as its own sorted index
+        return array.array(INDEX_TYPECODE, range(len(values))), values
+    # Sort is stable, so equal values stay in table order
+    order = sorted(range(len(values)), key=values.__getitem__)
+    return array.array(INDEX_TYPECODE, order), array.array(VALUE_TYPECODE, [values[i] for i in order])
+
+
+def _write_failure_manifest(manifest_filepath, run_info, failures, names=None):
+    """
+    Writes the failures of a completed run as a JSON manifest, or removes the
+    manifest of an earlier run if there were no failures
+    :param failures: List of (batch number, failure record) pairs from iter_batch_results
+    :param names: List of batch names by batch number, or None for a calculate_batch run
+    :return: No return value
+    """
+    if not failures:
+        if os.path.exists(manifest_filepath):
+            os.remove(manifest_filepath)
+        return
+    # Each batch's blanks then samples, in file name order as they were calculated
+    records = [dict(failure, batch=names[n] if names is not None else None)
+               for n, failure in sorted(failures, key=lambda x: (x[0], not x[1]['blank'], x[1]['file']))]
+    with open(manifest_filepath, 'w') as f:
+        json.dump({'run': run_info, 'failures': records}, f, indent=2, sort_keys=True)
+
+
+###############################################################################
+# Report readers
+###############################################################################
+register_report_reader(opx.EXCEL_REPORT_EXTENSIONS, get_data_from_excel_report)
+register_report_reader(opx.TEXT_REPORT_DELIMITERS.keys(), get_data_from_text_report)
@@ -0,0 +1,370 @@
+"""
+Module: oparchive.py
+Archive of the peak tables of every report processed, for trend questions over
+years of reports (e.g. internal standard area drift, or which samples had a
+large C34-C40 fraction) without opening any Excel file again.
+
+The archive is a directory with one file per peak column (idx, start, RT, end
+and area, as 8 byte little endian values) that every report's peaks are
+appended to, and an index with one JSON line per report giving its file,
+fingerprint, sample name, analysis time and the offset and number of its peaks
+in the columns. Queries memory-map the columns, so only the pages of the
+reports asked for are read, and work through the reports in blocks with the
+opvec engine, which gives the same values as a normal run.
+
+A report that changes is appended again, and queries use its latest version.
+An append that is interrupted is discarded the next time the archive is added to.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: numpy
+
+Classes:
+PeakArchive: Append-only columnar archive of report peak tables, with a per-report index.
+"""
+
+import json
+import os
+
+import numpy as np
+
+try:
+    from itertools import izip
+except ImportError:
+    # Python 3 zip is already lazy
+    izip = zip
+
+import op
+import opdb
+import opvec
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+# Change whenever the layout of the archive files changes
+ARCHIVE_VERSION = 1
+VERSION_FILENAME = 'archive.json'
+INDEX_FILENAME = 'reports.jsonl'
+# Column file names and dtypes, in the opx.PEAK_LS_* order
+COLUMNS = [('idx', '<i8'), ('start', '<f8'), ('rt', '<f8'), ('end', '<f8'), ('area', '<f8')]
+
+
+class PeakArchive(object):
+    """
+    Append-only columnar archive of report peak tables, with a per-report index.
+    Index entries are dictionaries with the report's file, size, mtime, directory,
+    sample_name, analysis_time, time (ISO 8601, or None if the analysis time could
+    not be read), blank, offset and peaks. Query results are arrays in the order
+    of the entries given, NaN where a report has no value.
+    """
+    def __init__(self, directory):
+        """
+        :param directory: Archive directory, created if it does not exist
+        :raises ValueError: If the archive was written by a different version
+        """
+        self.directory = directory
+        version_filepath = os.path.join(directory, VERSION_FILENAME)
+        if os.path.exists(version_filepath):
+            with open(version_filepath, 'r') as f:
+                version = json.load(f).get('version')
+            if version != ARCHIVE_VERSION:
+                raise ValueError("%s is a version %s peak archive, not version %d." %
+                                 (directory, version, ARCHIVE_VERSION))
+        else:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(version_filepath, 'w') as f:
+                json.dump({'version': ARCHIVE_VERSION}, f)
+        self._load_index()
+
+    def __len__(self):
+        return len(self._latest)
+
+    def add_directory(self, directory, recursive=True, processes=opx.DEF_PARSE_PROCESSES, cache=None):
+        """
+        Adds the reports in a directory that are new or changed since they were archived
+        :param directory: Directory of reports, e.g. a year of batches
+        :param recursive: If True, the reports in sub-directories are added too
+        :return: As add_reports.
+        """
+        blank_file_list, sample_file_list = op.find_report_files(directory, recursive)
+        return self.add_reports(blank_file_list + sample_file_list, processes, cache)
+
+    def add_reports(self, file_list, processes=opx.DEF_PARSE_PROCESSES, cache=None):
+        """
+        Adds reports that are new or changed since they were archived. The index is only
+        appended to after every report's peaks are written, so a run that fails adds none.
+        :param file_list: List of report file locations
+        :param processes: Number of worker processes used to parse the reports
+        :param cache: Optional opcache.ReportCache instance
+        :return: Tuple of the number of reports added, the number already archived
+            and a list of (file, error) tuples for reports that could not be read.
+        """
+        read_list = []
+        fingerprints = {}
+        failed = []
+        archived = 0
+        for f in file_list:
+            f = os.path.abspath(f)
+            try:
+                stat = os.stat(f)
+            except OSError as e:
+                # Removed since it was listed, or not readable
+                failed.append((f, '%s: %s' % (type(e).__name__, e)))
+                continue
+            entry = self._latest.get(f)
+            if entry is None or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime):
+                read_list.append(f)
+                fingerprints[f] = (stat.st_size, stat.st_mtime)
+            else:
+                archived += 1
+
+        entries = []
+        peak_count = self._peak_count
+        self._truncate()
+        column_files = [open(self._column_filepath(name), 'ab') for name, _ in COLUMNS]
+        try:
+            reports = op.iter_data_from_reports(read_list, processes, cache, errors=True)
+            for f, report_data in izip(read_list, reports):
+                if isinstance(report_data, op.ReportError):
+                    failed.append((f, str(report_data)))
+                    continue
+                sample_name, analysis_time, peak_data = report_data
+                columns = _peak_columns(peak_data)
+                for column_file, column in zip(column_files, columns):
+                    column_file.write(column.tobytes())
+                entries.append({
+                    'file': f,
+                    'size': fingerprints[f][0],
+                    'mtime': fingerprints[f][1],
+                    'directory': os.path.dirname(f),
+                    'sample_name': sample_name,
+                    'analysis_time': analysis_time,
+                    'time': opdb.parse_analysis_time(analysis_time),
+                    'blank': op.is_blank_report(f),
+                    'offset': peak_count,
+                    'peaks': len(columns[0])
+                })
+                peak_count += len(columns[0])
+            for column_file in column_files:
+                column_file.flush()
+                os.fsync(column_file.fileno())
+        finally:
+            for column_file in column_files:
+                column_file.close()
+            # Mapped again with the new length by the next query
+            self._columns = None
+
+        # The index is only appended to once every column write has reached the disk, so it
+        # never points past the columns. Peaks written by a failed run are not indexed and
+        # are discarded by the next _truncate.
+        with open(os.path.join(self.directory, INDEX_FILENAME), 'ab') as index_file:
+            index_file.write(b''.join((json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+                                      for entry in entries))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+            index_bytes = index_file.tell()
+        for entry in entries:
+            self._add_entry(entry)
+        self._index_bytes = index_bytes
+        return len(entries), archived, failed
+
+    def concentrations(self, entries, parameters):
+        """
+        Calculates the concentrations of archived samples, each blank corrected with the
+        average of the archived blanks in its directory, as op.calculate_batch would
+        :param entries: List of index entries, as reports
+        :param parameters: Instance of op.BatchParameters class
+        :return: Dictionary of csv fieldname (e.g. 'conc_c34_c40') to an array of
+            concentrations, NaN for samples with no internal standard peak or whose
+            directory has no blank average.
+        """
+        blank_areas = {}
+        for directory in set(entry['directory'] for entry in entries):
+            blanks = self.reports(blank=True, directory=directory)
+            try:
+                blank_average = op.BlankAverage(blank_data=[self.peaks(entry) for entry in blanks],
+                                                analysis_c6_c10=parameters.analysis_c6_c10,
+                                                **parameters.istd_kwargs())
+            except (op.IstdError, ValueError):
+                blank_areas[directory] = None
+                continue
+            blank_areas[directory] = dict(
+                (fraction, getattr(blank_average, 'area_' + fraction))
+                for fraction in op.fraction_names(parameters.analysis_c6_c10))
+            blank_areas[directory]['istd'] = blank_average.istd
+
+        def blank_column(name):
+            return np.array([blank_areas[entry['directory']][name] if blank_areas[entry['directory']] else np.nan
+                             for entry in entries], dtype=float)
+
+        istd = self.istd_areas(entries, **parameters.istd_kwargs())
+        blank_istd = blank_column('istd')
+        concentrations = {}
+        for fraction, area in self.fraction_areas(entries, parameters.analysis_c6_c10).items():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                concentrations['conc_' + fraction] = opvec.calculate_concentrations(
+                    area, istd, blank_column(fraction), blank_istd, **parameters.calibration_kwargs())
+        return concentrations
+
+    def fraction_areas(self, entries, analysis_c6_c10):
+        """
+        Calculates the fraction areas of archived reports
+        :param entries: List of index entries, as reports
+        :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+        :return: Dictionary of fraction name (e.g. 'c34_c40') to an array of areas, NaN
+            for reports with no peak ending after a fraction's end.
+        """
+        blocks = []
+        for block in _blocks(entries):
+            try:
+                blocks.append(opvec.fraction_areas(self._arrays(block), analysis_c6_c10))
+            except ValueError:
+                # Calculate the block one report at a time to leave out the ones without a boundary
+                for entry in block:
+                    try:
+                        blocks.append(opvec.fraction_areas(self._arrays([entry]), analysis_c6_c10))
+                    except ValueError:
+                        blocks.append(dict((fraction, np.array([np.nan]))
+                                           for fraction in op.fraction_names(analysis_c6_c10)))
+        return dict((fraction, np.concatenate([block[fraction] for block in blocks] or [np.zeros(0)]))
+                    for fraction in op.fraction_names(analysis_c6_c10))
+
+    def istd_areas(self, entries, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance):
+        """
+        Gets the internal standard area of archived reports, e.g. to follow its drift over time
+        :param entries: List of index entries, as reports
+        :return: Array of internal standard areas as op.get_istd_area, NaN for reports
+            with no acceptable peak.
+        """
+        return np.concatenate([opvec.get_istd_areas(self._arrays(block), istd_rt, istd_rt_tolerance,
+                                                    istd_area_target, istd_area_tolerance)
+                               for block in _blocks(entries)] or [np.zeros(0)])
+
+    def peaks(self, entry):
+        """
+        Gets the peak table of an archived report
+        :param entry: Index entry, as reports
+        :return: Instance of op.PeakTable class.
+        """
+        start = entry['offset']
+        end = start + entry['peaks']
+        idx, rt_start, rt, rt_end, area = [column[start:end] for column in self._mapped_columns()]
+        return op.PeakTable.from_columns(idx.tolist(), rt_start.tolist(), rt.tolist(), rt_end.tolist(),
+                                         area.tolist())
+
+    def reports(self, start=None, end=None, sample_name=None, blank=None, directory=None):
+        """
+        Gets the index entries of the latest version of each archived report
+        :param start: Earliest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :param end: Latest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :param sample_name: Sample name to match, ignoring case, or None for every sample
+        :param blank: True for blanks only, False for samples only, or None for both
+        :param directory: Directory the reports are in, or None for every directory
+        :return: List of index entries ordered by analysis time, then file. Reports
+            without a readable analysis time are left out when a time limit is given.
+        """
+        start = _iso_time(start)
+        end = _iso_time(end)
+        if directory is not None:
+            directory = os.path.abspath(directory)
+        entries = []
+        for entry in self._latest.values():
+            if (start is not None or end is not None) and entry['time'] is None:
+                continue
+            if (start is not None and entry['time'] < start) or (end is not None and entry['time'] > end):
+                continue
+            if sample_name is not None and (entry['sample_name'] or '').lower() != sample_name.lower():
+                continue
+            if blank is not None and entry['blank'] != blank:
+                continue
+            if directory is not None and entry['directory'] != directory:
+                continue
+            entries.append(entry)
+        return sorted(entries, key=lambda entry: (entry['time'] or '', entry['file']))
+
+    def _add_entry(self, entry):
+        self._latest[entry['file']] = entry
+        self._peak_count = entry['offset'] + entry['peaks']
+
+    def _arrays(self, entries):
+        return opvec.PeakArrays.from_segments(self._mapped_columns(), [entry['offset'] for entry in entries],
+                                              [entry['peaks'] for entry in entries])
+
+    def _column_filepath(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def _load_index(self):
+        """Reads the index, stopping at a line left partly written by an interrupted append."""
+        self._latest = {}
+        self._peak_count = 0
+        self._index_bytes = 0
+        self._columns = None
+        index_filepath = os.path.join(self.directory, INDEX_FILENAME)
+        if not os.path.exists(index_filepath):
+            return
+        with open(index_filepath, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                self._add_entry(entry)
+                self._index_bytes += len(line)
+
+    def _mapped_columns(self):
+        """Memory-maps the columns up to the end of the last indexed report."""
+        if self._columns is None:
+            if self._peak_count:
+                self._columns = [np.memmap(self._column_filepath(name), dtype=dtype, mode='r',
+                                           shape=(self._peak_count,)) for name, dtype in COLUMNS]
+            else:
+                # An empty file cannot be mapped
+                self._columns = [np.zeros(0, dtype=dtype) for _, dtype in COLUMNS]
+        return self._columns
+
+    def _truncate(self):
+        """Discards anything an interrupted append wrote after the last indexed report."""
+        self._columns = None
+        for name, dtype in COLUMNS:
+            size = self._peak_count * np.dtype(dtype).itemsize
+            filepath = self._column_filepath(name)
+            if not os.path.exists(filepath):
+                open(filepath, 'wb').close()
+            if os.path.getsize(filepath) < size:
+                raise ValueError("%s is shorter than its index, the archive is damaged." % filepath)
+            if os.path.getsize(filepath) > size:
+                with open(filepath, 'r+b') as f:
+                    f.truncate(size)
+        index_filepath = os.path.join(self.directory, INDEX_FILENAME)
+        if os.path.exists(index_filepath) and os.path.getsize(index_filepath) > self._index_bytes:
+            with open(index_filepath, 'r+b') as f:
+                f.truncate(self._index_bytes)
+
+
+def _blocks(entries):
+    """Splits entries into blocks of opx.DEF_VECTOR_BLOCK_SIZE reports for the opvec engine."""
+    return [entries[i:i + opx.DEF_VECTOR_BLOCK_SIZE] for i in range(0, len(entries), opx.DEF_VECTOR_BLOCK_SIZE)]
+
+
+def _iso_time(value):
+    if value is None or not hasattr(value, 'strftime'):
+        return value
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _peak_columns(peak_data):
+    """Gets the columns of a peak table or list of peak tuples as arrays of the COLUMNS dtypes."""
+    if isinstance(peak_data, op.PeakTable):
+        values = [np.frombuffer(column, dtype=column.typecode) for column in peak_data.columns]
+    else:
+        values = list(np.array(list(peak_data), dtype=float).reshape(-1, len(COLUMNS)).T)
+    return [np.asarray(column, dtype=dtype) for column, (_, dtype) in zip(values, COLUMNS)]
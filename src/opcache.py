@@ -0,0 +1,195 @@
+"""
+Module: opcache.py
+Persistent on-disk cache of parsed MassHunter report data, so that re-running
+a calculation on an unchanged folder does not parse the Excel reports again.
+
+Entries are keyed by the report's path, size and modification time, so a
+report that is changed or replaced is parsed again. The cache is bounded in
+size; the least recently used entries are evicted first.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: None
+
+Classes:
+ReportCache: On-disk cache of parsed report data.
+
+Functions:
+default_cache_directory: Gets the default location of the report cache
+"""
+
+import hashlib
+import os
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+# Change whenever the structure of the cached report data changes
+CACHE_VERSION = 4
+ENTRY_SUFFIX = '.pickle'
+
+
+class ReportCache(object):
+    """
+    On-disk cache of parsed report data.
+    The hits, misses and evictions counters record cache use since the cache
+    was created, so callers can report how much parsing was avoided.
+    """
+    def __init__(self, directory=None, max_bytes=opx.DEF_CACHE_MAX_BYTES):
+        if directory is None:
+            directory = default_cache_directory()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Total size of the entries, worked out on the first write
+        self._size = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, file):
+        """
+        Gets the cache key for a report file
+        :param file: Location and file name of the report
+        :return: Hex digest of the report's path, size and modification time.
+        """
+        path = os.path.normcase(os.path.abspath(file))
+        stat = os.stat(file)
+        fingerprint = '%d|%s|%d|%r' % (CACHE_VERSION, path, stat.st_size, stat.st_mtime)
+        return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+    def contains(self, file):
+        """Tests whether there is a cache entry for the current version of a report file."""
+        return os.path.exists(self._entry_path(self.key(file)))
+
+    def missing(self, file_list):
+        """
+        Finds the report files that are not in the cache, counting each one as a miss
+        :param file_list: List of report file locations
+        :return: List of the files that need parsing, in file_list order.
+        """
+        missing_list = [f for f in file_list if not self.contains(f)]
+        self.misses += len(missing_list)
+        return missing_list
+
+    def get(self, file, key=None):
+        """
+        Gets the cached data for a report file
+        :param file: Location and file name of the report
+        :param key: Cache key of the report from key(), or None to get it now
+        :return: The (sample name, analysis time, peak data) tuple, or None if the
+            report is not in the cache.
+        """
+        entry_path = self._entry_path(key or self.key(file))
+        try:
+            with open(entry_path, 'rb') as f:
+                report_data = pickle.load(f)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception:
+            # Unreadable entry, e.g. from an interrupted write
+            self._remove(entry_path)
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return report_data
+
+    def put(self, file, report_data, key=None):
+        """
+        Stores the data for a report file, evicting old entries if the cache is full
+        :param file: Location and file name of the report
+        :param report_data: The (sample name, analysis time, peak data) tuple
+        :param key: Cache key from key() taken before the report was read, so that a
+            report changed while it was read is stored under the version that was
+            read. If None, the key is taken now.
+        :return: No return value
+        """
+        entry_path = self._entry_path(key or self.key(file))
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(report_data, f, pickle.HIGHEST_PROTOCOL)
+        try:
+            replaced_size = os.path.getsize(entry_path)
+        except OSError:
+            replaced_size = 0
+        self._remove(entry_path)
+        os.rename(temp_path, entry_path)
+
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += os.path.getsize(entry_path) - replaced_size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is within max_bytes
+        :return: No return value
+        """
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            self._remove(entry_path)
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        for entry_path, _, _ in self._entries():
+            self._remove(entry_path)
+        self._size = 0
+
+    def _entries(self):
+        """Generates (path, size, last used time) for each cache entry."""
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                entry_path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                yield entry_path, stat.st_size, stat.st_mtime
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    @staticmethod
+    def _remove(entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+
+def default_cache_directory():
+    """
+    Gets the default location of the report cache
+    :return: Cache directory in the user's home directory.
+    """
+    return os.path.join(os.path.expanduser('~'), opx.DEF_CACHE_DIRNAME)
@@ -0,0 +1,208 @@
+"""
+Module: opdb.py
+SQLite store of calculated results, so that a sample's results from past
+batches can be found without searching the csv files of every run.
+
+Each batch is stored as a run, with the analysis type, internal standard and
+calibration parameters it was calculated with, and its result rows are
+inserted in the same transaction. Results are indexed by sample name and
+analysis time for sample lookups and trend queries.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: None
+
+Classes:
+ResultStore: SQLite database of runs and their results.
+
+Functions:
+parse_analysis_time: Converts a report's acquired time to an ISO 8601 string
+"""
+
+import datetime
+import os
+import sqlite3
+
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+# Change whenever the database schema changes
+SCHEMA_VERSION = 1
+PARAMETER_COLUMNS = ['istd_rt', 'istd_rt_tolerance', 'istd_area_target', 'istd_area_tolerance',
+                     'istd_concentration', 'dilution_factor', 'calibration_slope', 'calibration_intercept']
+CONCENTRATION_COLUMNS = ['conc_' + fraction for fraction in opx.FRACTIONS_C6_C10 + opx.FRACTIONS_C10_C40]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    created TEXT NOT NULL,
+    directory TEXT,
+    batch TEXT,
+    results_file TEXT,
+    analysis_c6_c10 INTEGER NOT NULL,
+    %(parameters)s
+);
+CREATE TABLE IF NOT EXISTS results (
+    result_id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    sample_name TEXT NOT NULL COLLATE NOCASE,
+    analysis_time TEXT,
+    reported_analysis_time TEXT,
+    %(concentrations)s
+);
+CREATE INDEX IF NOT EXISTS results_sample_name ON results (sample_name, analysis_time);
+CREATE INDEX IF NOT EXISTS results_analysis_time ON results (analysis_time);
+CREATE INDEX IF NOT EXISTS results_run_id ON results (run_id);
+""" % {
+    'parameters': ',\n    '.join('%s REAL' % c for c in PARAMETER_COLUMNS),
+    'concentrations': ',\n    '.join('%s REAL' % c for c in CONCENTRATION_COLUMNS)
+}
+
+
+class ResultStore(object):
+    """
+    SQLite database of runs and their results.
+    Result queries return dictionaries with the result columns and the run's
+    directory, batch and analysis type, ordered by analysis time.
+    """
+    def __init__(self, database_filepath):
+        """
+        :param database_filepath: Path of the SQLite database file, created if it does not exist
+        """
+        self.database_filepath = database_filepath
+        self._connection = sqlite3.connect(database_filepath)
+        self._connection.row_factory = sqlite3.Row
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version > SCHEMA_VERSION:
+            self._connection.close()
+            raise ValueError("%s was created by a newer version of Org-Process." % database_filepath)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+            self._connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def add_batch(self, parameters, results, directory=None, batch=None, results_file=None):
+        """
+        Stores a batch's run and its results in one transaction
+        :param parameters: Instance of op.BatchParameters class the batch was calculated with
+        :param results: Iterable of result dictionaries, as written to the csv file
+        :param directory: Directory containing the batch's reports
+        :param batch: Batch name, for batches calculated with op.calculate_batches
+        :param results_file: Path of the csv results file
+        :return: run_id of the new run.
+        """
+        run = {
+            'created': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'directory': os.path.abspath(directory) if directory else None,
+            'batch': batch,
+            'results_file': os.path.abspath(results_file) if results_file else None,
+            'analysis_c6_c10': int(bool(parameters.analysis_c6_c10))
+        }
+        run.update((c, getattr(parameters, c)) for c in PARAMETER_COLUMNS)
+
+        result_columns = ['run_id', 'sample_name', 'analysis_time', 'reported_analysis_time'] + CONCENTRATION_COLUMNS
+        with self._connection:
+            run_id = self._insert('runs', run).lastrowid
+            self._connection.executemany(
+                'INSERT INTO results (%s) VALUES (%s)' % (', '.join(result_columns),
+                                                          ', '.join('?' * len(result_columns))),
+                ([run_id, _text(result['sample_name']), parse_analysis_time(result['analysis_time']),
+                  _text(result['analysis_time'])] + [_number(result.get(c)) for c in CONCENTRATION_COLUMNS]
+                 for result in results))
+        return run_id
+
+    def close(self):
+        """Closes the database."""
+        self._connection.close()
+
+    def results_between(self, start=None, end=None):
+        """
+        Gets the results analysed in a period
+        :param start: Earliest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :param end: Latest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :return: List of result dictionaries ordered by analysis time.
+        """
+        return self._select_results('1', [], start, end)
+
+    def runs(self):
+        """
+        Gets every run in the database
+        :return: List of run dictionaries, newest first.
+        """
+        return [dict(row) for row in self._connection.execute('SELECT * FROM runs ORDER BY run_id DESC')]
+
+    def sample_history(self, sample_name, start=None, end=None):
+        """
+        Gets every result for a sample name, ignoring case
+        :param sample_name: Sample name as in the reports
+        :param start: Earliest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :param end: Latest analysis time, as a datetime or ISO 8601 string, or None for no limit
+        :return: List of result dictionaries ordered by analysis time.
+        """
+        return self._select_results('results.sample_name = ?', [sample_name], start, end)
+
+    def _insert(self, table, values):
+        columns = sorted(values)
+        return self._connection.execute(
+            'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), ', '.join('?' * len(columns))),
+            [values[c] for c in columns])
+
+    def _select_results(self, condition, arguments, start, end):
+        if start is not None:
+            condition += ' AND results.analysis_time >= ?'
+            arguments.append(_iso_time(start))
+        if end is not None:
+            condition += ' AND results.analysis_time <= ?'
+            arguments.append(_iso_time(end))
+        query = ('SELECT results.*, runs.directory, runs.batch, runs.analysis_c6_c10 FROM results '
+                 'JOIN runs ON runs.run_id = results.run_id WHERE %s '
+                 'ORDER BY results.analysis_time, results.result_id' % condition)
+        return [dict(row) for row in self._connection.execute(query, arguments)]
+
+
+def parse_analysis_time(analysis_time):
+    """
+    Converts a report's acquired time to an ISO 8601 string
+    :param analysis_time: Acquired time from the report, e.g. '24/02/2017 10:00:00'
+    :return: String in the form 'YYYY-MM-DD HH:MM:SS', which sorts in time order,
+        or None if the time is not in one of the opx.ANALYSIS_TIME_FORMATS.
+    """
+    text = _text(analysis_time)
+    if text is None:
+        return None
+    for time_format in opx.ANALYSIS_TIME_FORMATS:
+        try:
+            return _iso_time(datetime.datetime.strptime(text.strip(), time_format))
+        except ValueError:
+            continue
+    return None
+
+
+def _iso_time(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def _number(value):
+    """Converts a concentration to a float, as csv files hold them as text."""
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def _text(value):
+    """Converts a csv or report value to unicode text for the database."""
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, float):
+        return repr(value)
+    return value
@@ -0,0 +1,521 @@
+"""
+Module: opserver.py
+Local processing service that keeps batches warm between requests, so a LIMS
+integration can ask for a batch's concentrations without starting Org-Process
+and parsing every report again each time.
+
+The service listens on 127.0.0.1 only and speaks JSON over HTTP. Each batch
+keeps the peak data of its blanks, its blank average and the fraction and
+internal standard areas of its samples in memory. A batch is given as a
+directory, which is checked for new, changed and removed reports on each
+request, and reports can also be submitted in the request body. Only new or
+changed reports are parsed, and the blank average is only recalculated when a
+blank changes.
+
+Requests are handled on separate threads. Each batch has its own lock, so
+requests for different batches run together and requests for the same batch
+are taken in turn. Reports are parsed over one process pool, started with the
+server before any request threads, so worker processes are never forked from a
+request thread.
+
+    GET    /status                         Names of the batches held
+    POST   /batches                        Creates or reuses a batch, JSON body {"name", "directory", "parameters"}
+    GET    /batches/<name>                 Results of a batch, after reading any changed reports
+    PUT    /batches/<name>/reports/<file>  Adds a report to a batch, body is the report file
+    DELETE /batches/<name>                 Releases a batch
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd
+
+Classes:
+BatchState: Parsed reports, blank average and sample areas of one batch, kept between requests.
+ProcessingServer: Threaded HTTP server holding the batches.
+ServerClient: Client for a ProcessingServer on this computer.
+"""
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote, unquote
+    from urllib2 import HTTPError, Request, urlopen
+except ImportError:
+    # Python 3 names
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import HTTPError
+    from urllib.parse import quote, unquote
+    from urllib.request import Request, urlopen
+
+import op
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+class BatchState(object):
+    """
+    Parsed reports, blank average and sample areas of one batch, kept between requests.
+    Reports are keyed by file: the full path for reports in the batch directory and
+    the file name for submitted reports. Blanks are averaged in key order, which for a
+    directory is the order op.calculate_batch uses, so the results are the same.
+    """
+    def __init__(self, name, parameters, directory=None, processes=opx.DEF_PARSE_PROCESSES, cache=None, pool=None):
+        """
+        :param name: Batch name used in request paths
+        :param parameters: Instance of op.BatchParameters class
+        :param directory: Optional directory containing the batch's reports
+        :param processes: Number of worker processes used to parse a group of changed reports
+        :param cache: Optional opcache.ReportCache instance
+        :param pool: Optional multiprocessing.Pool of processes workers to parse the
+            changed reports over. It must be started by the main thread, as
+            ProcessingServer does, and a pool is otherwise started for each refresh.
+        """
+        self.name = name
+        self.parameters = parameters
+        self.directory = os.path.abspath(directory) if directory else None
+        self.processes = processes
+        self.cache = cache
+        self.pool = pool
+        # Held while the batch is refreshed or read, so one request at a time uses it
+        self.lock = threading.Lock()
+
+        # Fingerprint (size, mtime) of each report read from the directory
+        self.fingerprints = {}
+        # Peak data of each blank, and the sample name, analysis time and evaluation of each sample
+        self.blank_data = {}
+        self.samples = {}
+        # Failure record of each report that could not be read, failed its internal standard
+        # search or has no peak after a fraction boundary
+        self.failures = {}
+        self.blank_average = None
+        self.blank_average_error = "No blanks yet."
+
+    def add_report(self, f, report_data):
+        """
+        Adds or replaces a report in the batch. Blanks are found by name with op.is_blank_report.
+        :param f: Report key
+        :param report_data: (sample name, analysis time, peak data) tuple, or op.ReportError
+        :return: True if the report is a blank, so the blank average needs updating.
+        """
+        blank = op.is_blank_report(f)
+        was_blank = self._remove(f)
+        if isinstance(report_data, op.ReportError):
+            self.failures[f] = _failure(f, blank, 'unreadable', report_data)
+        elif blank:
+            self.blank_data[f] = report_data[2]
+        else:
+            sample_name, analysis_time, peak_data = report_data
+            try:
+                evaluation = op.SampleEvaluation(peak_data, self.parameters.analysis_c6_c10,
+                                                 **self.parameters.istd_kwargs())
+            except (op.IstdError, ValueError) as e:
+                self.failures[f] = _failure(f, False, _failure_reason(e), e, sample_name)
+            else:
+                self.samples[f] = (sample_name, analysis_time, evaluation)
+        return blank or was_blank
+
+    def as_dict(self):
+        """
+        Gets the batch's results
+        :return: JSON serialisable dictionary of the batch name, directory, parameters,
+            numbers of blanks and samples, blank average error (None if the blanks
+            were averaged), result rows in file order, each with its 'file', and failures.
+        """
+        results = []
+        failures = [self.failures[f] for f in sorted(self.failures)]
+        for f in sorted(self.samples):
+            sample_name, analysis_time, evaluation = self.samples[f]
+            if self.blank_average is None:
+                failures.append(_failure(f, False, 'blank_average', self.blank_average_error, sample_name))
+                continue
+            result = {
+                'file': f,
+                'sample_name': sample_name,
+                'analysis_time': analysis_time
+            }
+            for fraction in evaluation.fractions:
+                result['conc_' + fraction] = evaluation.concentration(fraction, self.blank_average,
+                                                                      **self.parameters.calibration_kwargs())
+            results.append(result)
+        return {
+            'batch': self.name,
+            'directory': self.directory,
+            'parameters': self.parameters.as_dict(),
+            'blanks': len(self.blank_data),
+            'samples': len(self.samples),
+            'blank_average_error': self.blank_average_error,
+            'results': results,
+            'failures': failures
+        }
+
+    def refresh(self):
+        """
+        Reads the reports in the batch directory that are new or changed since the last
+        refresh, drops removed ones and updates the blank average if a blank changed
+        :return: Number of reports read or removed.
+        """
+        if self.directory is None:
+            return 0
+        if not os.path.isdir(self.directory):
+            raise ValueError("%s is not a directory." % self.directory)
+        blank_file_list, sample_file_list = op.find_report_files(self.directory)
+        current = {}
+        for f in blank_file_list + sample_file_list:
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            current[f] = (stat.st_size, stat.st_mtime)
+
+        changed = sorted(f for f, fingerprint in current.items() if self.fingerprints.get(f) != fingerprint)
+        removed = [f for f in self.fingerprints if f not in current]
+        blanks_changed = False
+        try:
+            for f in removed:
+                del self.fingerprints[f]
+                blanks_changed = self._remove(f) or blanks_changed
+            reports = op.iter_data_from_reports(changed, self.processes, self.cache, errors=True, pool=self.pool)
+            for f, report_data in zip(changed, reports):
+                # Set before the report is added, so the average is updated even if adding it fails
+                blanks_changed = op.is_blank_report(f) or blanks_changed
+                self.add_report(f, report_data)
+                # Only recorded once the report is handled, so a report that stops the refresh is read again
+                self.fingerprints[f] = current[f]
+        finally:
+            # The blanks read before any error are averaged, so the batch is never left without an average
+            if blanks_changed:
+                self.update_blank_average()
+        return len(changed) + len(removed)
+
+    def submit(self, filename, content):
+        """
+        Adds a report submitted as file content
+        :param filename: Name of the report file, whose extension selects the reader
+        :param content: Bytes of the report file
+        :return: No return value
+        """
+        filename = os.path.basename(filename)
+        if not filename:
+            raise ValueError("A report file name is needed.")
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            try:
+                report_data = op.get_data_from_report(temp_path)
+            except Exception as e:
+                report_data = op.ReportError("%s: %s" % (type(e).__name__, e))
+        finally:
+            os.remove(temp_path)
+        if self.add_report(filename, report_data):
+            self.update_blank_average()
+
+    def update_blank_average(self):
+        """Averages the blanks again, in key order."""
+        self.blank_average = None
+        if not self.blank_data:
+            self.blank_average_error = "No blanks yet."
+            return
+        if any(failure['blank'] for failure in self.failures.values()):
+            self.blank_average_error = "No blank average, a blank could not be read or calculated."
+            return
+        blank_average = op.BlankAverage(analysis_c6_c10=self.parameters.analysis_c6_c10,
+                                        **self.parameters.istd_kwargs())
+        for f in sorted(self.blank_data):
+            try:
+                blank_average.add(self.blank_data[f])
+            except (op.IstdError, ValueError) as e:
+                self.failures[f] = _failure(f, True, _failure_reason(e), e)
+                self.blank_average_error = "No blank average, a blank failed: %s" % e
+                return
+        self.blank_average = blank_average
+        self.blank_average_error = None
+
+    def _remove(self, f):
+        """Removes a report from the batch, returning True if it was a blank."""
+        failure = self.failures.pop(f, None)
+        self.samples.pop(f, None)
+        return self.blank_data.pop(f, None) is not None or (failure is not None and failure['blank'])
+
+
+class ProcessingServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server holding the batches. It only listens on 127.0.0.1.
+    """
+    # Request threads do not keep the server running once it is stopped
+    daemon_threads = True
+
+    def __init__(self, port=opx.DEF_SERVER_PORT, parameters=None, processes=opx.DEF_PARSE_PROCESSES, cache=None,
+                 log=None, root=None):
+        """
+        Create the server on the main thread, as it starts the worker processes.
+        :param port: Port to listen on, or 0 for any free port (see server_address)
+        :param parameters: Instance of op.BatchParameters class used for batches created
+            without parameters, and for parameters they do not give
+        :param processes: Number of worker processes in the pool shared by every batch
+            to parse changed reports. 1 parses them on the request thread; 0 or None
+            uses one process per CPU.
+        :param cache: Optional opcache.ReportCache instance
+        :param log: Optional callable taking a message string, for each request
+        :param root: Optional directory that batch directories must be inside
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        # Started here, before any request threads, as forking a process with other threads
+        # running is unsafe, and before listening, so the workers do not hold the socket
+        self.pool = multiprocessing.Pool(self.processes) if self.processes > 1 else None
+        try:
+            HTTPServer.__init__(self, (opx.DEF_SERVER_HOST, port), _RequestHandler)
+        except:
+            self._stop_pool()
+            raise
+        self.parameters = parameters if parameters is not None else op.BatchParameters()
+        self.cache = cache
+        self.log = log
+        self.root = os.path.realpath(root) if root else None
+        self.batches = {}
+        # Held while the batches dictionary is changed, never while a batch is calculated
+        self.lock = threading.Lock()
+
+    def server_close(self):
+        """Stops listening and stops the worker processes."""
+        HTTPServer.server_close(self)
+        self._stop_pool()
+
+    def create_batch(self, name=None, directory=None, parameters=None):
+        """
+        Creates a batch, or reuses the batch of the same name if it has the same directory and parameters
+        :param name: Batch name, or None for the name of the directory
+        :param directory: Optional directory containing the batch's reports
+        :param parameters: Optional dictionary of op.BatchParameters values, with the
+            server's parameters for any not given
+        :return: Instance of BatchState class.
+        """
+        if not name:
+            if not directory:
+                raise ValueError("A batch needs a name or a directory.")
+            name = op.batch_names([directory])[0]
+        if directory:
+            if not os.path.isdir(directory):
+                raise ValueError("%s is not a directory." % directory)
+            if self.root is not None and not _is_inside(directory, self.root):
+                raise ValueError("%s is not inside %s." % (directory, self.root))
+        parameters = parameters or {}
+        if not isinstance(parameters, dict):
+            raise ValueError("The batch parameters must be a JSON object.")
+        values = self.parameters.as_dict()
+        if parameters.get('analysis_c6_c10', values['analysis_c6_c10']) != values['analysis_c6_c10']:
+            # The server's values are for the other analysis type, so the defaults are used
+            values = {}
+        values.update(parameters)
+        try:
+            batch_parameters = op.BatchParameters(**values)
+        except TypeError:
+            raise ValueError("Unknown parameter in %s." % ', '.join(sorted(parameters)))
+
+        with self.lock:
+            batch = self.batches.get(name)
+            if batch is None or batch.parameters.as_dict() != batch_parameters.as_dict() or \
+                    batch.directory != (os.path.abspath(directory) if directory else None):
+                batch = BatchState(name, batch_parameters, directory, self.processes, self.cache, self.pool)
+                self.batches[name] = batch
+        return batch
+
+    def delete_batch(self, name):
+        """
+        Releases a batch and the reports it holds
+        :return: True if the batch existed.
+        """
+        with self.lock:
+            return self.batches.pop(name, None) is not None
+
+    def get_batch(self, name):
+        """
+        Gets a batch by name
+        :raises KeyError: If there is no batch with the name
+        """
+        with self.lock:
+            return self.batches[name]
+
+    def _stop_pool(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+class ServerClient(object):
+    """
+    Client for a ProcessingServer on this computer. Requests the server refuses raise
+    ValueError with the server's message.
+    """
+    def __init__(self, port=opx.DEF_SERVER_PORT, timeout=60):
+        """
+        :param port: Port the server listens on
+        :param timeout: Seconds to wait for a response
+        """
+        self.url = 'http://%s:%d' % (opx.DEF_SERVER_HOST, port)
+        self.timeout = timeout
+
+    def batch(self, name):
+        """Gets a batch's results, as BatchState.as_dict, after the server reads any changed reports."""
+        return self._request('GET', '/batches/' + quote(name, safe=''))
+
+    def create_batch(self, name=None, directory=None, parameters=None):
+        """
+        Creates a batch, or reuses a warm one, and gets its results
+        :param name: Batch name, or None for the name of the directory
+        :param directory: Optional directory containing the batch's reports
+        :param parameters: Optional dictionary of op.BatchParameters values
+        :return: Dictionary of the batch's results, as BatchState.as_dict.
+        """
+        body = {'name': name, 'directory': os.path.abspath(directory) if directory else None,
+                'parameters': parameters}
+        return self._request('POST', '/batches', json.dumps(body).encode('utf-8'))
+
+    def delete_batch(self, name):
+        """Releases a batch on the server."""
+        return self._request('DELETE', '/batches/' + quote(name, safe=''))
+
+    def status(self):
+        """Gets the names of the batches the server holds."""
+        return self._request('GET', '/status')
+
+    def submit_report(self, name, report_filepath):
+        """
+        Sends a report file to a batch
+        :param name: Batch name
+        :param report_filepath: Path of the report file
+        :return: Dictionary of the batch's results, as BatchState.as_dict.
+        """
+        with open(report_filepath, 'rb') as f:
+            content = f.read()
+        return self._request('PUT', '/batches/%s/reports/%s' % (quote(name, safe=''),
+                                                                quote(os.path.basename(report_filepath), safe='')),
+                             content)
+
+    def _request(self, method, path, body=None):
+        request = Request(self.url + path, data=body)
+        request.get_method = lambda: method
+        if body is not None:
+            request.add_header('Content-Type', 'application/octet-stream' if method == 'PUT' else
+                               'application/json')
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8'))['error']
+            except (ValueError, KeyError):
+                message = str(e)
+            raise ValueError(message)
+        try:
+            return json.loads(response.read().decode('utf-8'))
+        finally:
+            response.close()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's batches and replies with JSON."""
+
+    def do_DELETE(self):
+        self._handle()
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        if self.server.log is not None:
+            # client_address rather than address_string, which looks up the host name
+            self.server.log("%s %s" % (self.client_address[0], format % args))
+
+    def _handle(self):
+        parts = [unquote(part) for part in self.path.split('?')[0].strip('/').split('/')]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            status, reply = self._route(self.command, parts, body)
+        except KeyError as e:
+            status, reply = 404, {'error': "No batch named %s." % e.args[0]}
+        except (ValueError, op.IstdError) as e:
+            status, reply = 400, {'error': str(e)}
+        except Exception as e:
+            status, reply = 500, {'error': "%s: %s" % (type(e).__name__, e)}
+
+        content = json.dumps(reply, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _route(self, method, parts, body):
+        server = self.server
+        if method == 'GET' and parts == ['status']:
+            with server.lock:
+                names = list(server.batches)
+            return 200, {'batches': sorted(names), 'version': __version__}
+        if method == 'POST' and parts == ['batches']:
+            content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                return 415, {'error': "The request body must be JSON, with Content-Type application/json."}
+            try:
+                values = json.loads(body.decode('utf-8')) if body else {}
+            except ValueError:
+                raise ValueError("The request body is not valid JSON.")
+            if not isinstance(values, dict):
+                raise ValueError("The request body must be a JSON object.")
+            batch = server.create_batch(values.get('name'), values.get('directory'), values.get('parameters'))
+            return 200, self._refreshed(batch)
+        if len(parts) == 2 and parts[0] == 'batches':
+            if method == 'GET':
+                return 200, self._refreshed(server.get_batch(parts[1]))
+            if method == 'DELETE':
+                if not server.delete_batch(parts[1]):
+                    raise KeyError(parts[1])
+                return 200, {'deleted': parts[1]}
+        if method == 'PUT' and len(parts) == 4 and parts[0] == 'batches' and parts[2] == 'reports':
+            batch = server.get_batch(parts[1])
+            with batch.lock:
+                batch.submit(parts[3], body)
+                return 200, batch.as_dict()
+        return 404, {'error': "No such request: %s /%s" % (method, '/'.join(parts))}
+
+    @staticmethod
+    def _refreshed(batch):
+        with batch.lock:
+            batch.refresh()
+            return batch.as_dict()
+
+
+def _failure(f, blank, reason, error, sample_name=None):
+    return {'file': f, 'blank': blank, 'sample_name': sample_name, 'reason': reason, 'error': str(error)}
+
+
+def _failure_reason(error):
+    """Gets the failure reason for an error from op.SampleEvaluation or op.BlankAverage.add."""
+    return 'istd' if isinstance(error, op.IstdError) else 'fraction_boundary'
+
+
+def _is_inside(directory, root):
+    """Checks whether a directory is root or below it, after resolving links and '..'."""
+    directory = os.path.normcase(os.path.realpath(directory))
+    root = os.path.normcase(root)
+    return directory == root or directory.startswith(os.path.join(root, ''))
@@ -0,0 +1,150 @@
+"""
+Module: opstats.py
+Opt-in timing and counters for finding where the time goes in a batch run.
+
+A RunStats instance collects the total time and number of calls of each stage
+(report parsing, blank averaging, internal standard search, fraction index
+search, concentration calculation and csv writing) and a record for each report
+file (parse time, peak count, internal standard candidates and whether it was
+read from the cache), and the spread of each batch's blanks. It is written as
+a JSON run report next to the results.
+
+Instrumentation is enabled by setting op.stats to a RunStats instance, which
+calculate_batch does when run_report is True. While op.stats is None the only
+cost is a check of the global at each instrumented point.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: None
+
+Classes:
+RunStats: Stage timings, counters and per-file records for one run.
+
+Functions:
+timer: Gets the current time for measuring intervals, in seconds
+"""
+
+import json
+import os
+import tempfile
+import time
+import timeit
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+# Most precise wall clock timer for the platform
+timer = timeit.default_timer
+
+
+class RunStats(object):
+    """
+    Stage timings, counters and per-file records for one run.
+    """
+    def __init__(self, run_info=None):
+        """
+        :param run_info: JSON serialisable description of the run, included in the report
+        """
+        self.run_info = run_info
+        self.started = time.time()
+        self.finished = None
+        self._start_timer = timer()
+        self.elapsed = None
+        # Stage name -> [calls, total seconds]
+        self.stages = {}
+        # Counter name -> value
+        self.counters = {}
+        # Report file -> dictionary of values recorded for the file
+        self.files = {}
+        # Batch directory -> spread of its blank areas, from op.BlankAverage.spread
+        self.blanks = {}
+        # Report file being calculated, for values recorded by functions that only see peak data
+        self.current_file = None
+        # Report files of the block of samples being calculated together by opvec
+        self.current_block = []
+        self.outcome = {}
+
+    def add(self, stage, seconds):
+        """
+        Adds the time of one call of a stage
+        :param stage: Stage name, e.g. 'parse'
+        :param seconds: Time taken by the call
+        :return: No return value
+        """
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+
+    def count(self, counter, n=1):
+        """Adds n to a counter."""
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def record(self, file, **values):
+        """Records values for a report file, e.g. record(f, peaks=120)."""
+        record = self.files.get(file)
+        if record is None:
+            record = self.files[file] = {}
+        record.update(values)
+
+    def record_current(self, **values):
+        """Records values for the report file being calculated, if there is one."""
+        if self.current_file is not None:
+            self.record(self.current_file, **values)
+
+    def record_block(self, **values):
+        """Records one of each list of values for each file of the current block, e.g. record_block(peaks=[120, 98])."""
+        for n, file in enumerate(self.current_block):
+            self.record(file, **dict((name, value[n]) for name, value in values.items()))
+
+    def finish(self, **outcome):
+        """
+        Marks the end of the run
+        :param outcome: Values describing how the run ended, e.g. completed=True
+        :return: No return value
+        """
+        self.finished = time.time()
+        self.elapsed = timer() - self._start_timer
+        self.outcome.update(outcome)
+
+    def as_dict(self):
+        """
+        Gets the run report
+        :return: JSON serialisable dictionary of the run, stages, counters, blank spread and files.
+        """
+        return {
+            'run': self.run_info,
+            'started': _iso_time(self.started),
+            'finished': _iso_time(self.finished) if self.finished is not None else None,
+            'elapsed_seconds': self.elapsed,
+            'outcome': self.outcome,
+            'stages': dict((stage, {'calls': calls, 'seconds': seconds})
+                           for stage, (calls, seconds) in self.stages.items()),
+            'counters': self.counters,
+            'blanks': self.blanks,
+            'files': [dict(self.files[f], file=f) for f in sorted(self.files)]
+        }
+
+    def write(self, out_filepath):
+        """
+        Writes the run report as a JSON file
+        :param out_filepath: Path of the JSON file
+        :return: No return value
+        """
+        # Write to a temporary file first so readers never see a partial report
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(out_filepath)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+        if os.path.exists(out_filepath):
+            os.remove(out_filepath)
+        os.rename(temp_path, out_filepath)
+
+
+def _iso_time(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp))
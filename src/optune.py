@@ -0,0 +1,225 @@
+"""
+Module: optune.py
+Finds the tightest internal standard tolerances that give every report in a
+batch exactly one acceptable internal standard peak.
+
+Instead of re-running a batch with wider tolerances until the internal standard
+search stops failing, the peak data of every blank and sample is read once and
+the acceptable peaks are counted for a whole grid of retention time and area
+tolerances in one pass with opvec.count_istd_candidates. Reports that do not
+have exactly one acceptable peak at the best tolerances found are outliers to
+check in MassHunter.
+
+Tolerances are compared relative to the largest value in each grid, so the
+tightest pair is the one with the smallest sum of the two relative tolerances.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: numpy
+
+Classes:
+ToleranceSearch: Internal standard peak counts of a batch's reports over a grid of tolerances.
+
+Functions:
+search_batch: Reads the reports in a directory and searches a grid of internal standard tolerances
+tolerance_grid: Gets evenly spaced tolerances up to a multiple of the current tolerance
+"""
+
+import numpy as np
+
+try:
+    from itertools import izip
+except ImportError:
+    # Python 3 zip is already lazy
+    izip = zip
+
+import op
+import opvec
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+class ToleranceSearch(object):
+    """
+    Internal standard peak counts of a batch's reports over a grid of tolerances.
+    counts[report, i, j] is the number of peaks op.get_istd_area accepts with
+    rt_tolerances[i] and area_tolerances[j].
+    """
+    def __init__(self, reports, istd_rt, istd_area_target, rt_tolerances, area_tolerances, unreadable=None):
+        """
+        :param reports: Iterable of (file, sample name, peak data) tuples for the blanks and samples.
+            Peaks are counted in blocks of opx.DEF_VECTOR_BLOCK_SIZE reports, so the peak data
+            of a whole batch is not held at once.
+        :param istd_rt: Target retention time for the internal standard
+        :param istd_area_target: Target area for the internal standard
+        :param rt_tolerances: Retention time tolerances to search
+        :param area_tolerances: Area tolerances to search
+        :param unreadable: List of (file, reason) tuples for reports that could not be read
+        """
+        self.files = []
+        self.sample_names = []
+        self.istd_rt = istd_rt
+        self.istd_area_target = istd_area_target
+        self.rt_tolerances = np.unique(np.asarray(rt_tolerances, dtype=float))
+        self.area_tolerances = np.unique(np.asarray(area_tolerances, dtype=float))
+        self.unreadable = unreadable if unreadable is not None else []
+
+        blocks = []
+        block = []
+        for f, sample_name, peak_data in reports:
+            self.files.append(f)
+            self.sample_names.append(sample_name)
+            block.append(peak_data)
+            if len(block) == opx.DEF_VECTOR_BLOCK_SIZE:
+                blocks.append(self._count(block))
+                block = []
+        if block or not blocks:
+            blocks.append(self._count(block))
+        self.counts = np.concatenate(blocks)
+
+    def as_dict(self):
+        """
+        Gets the search results
+        :return: JSON serialisable dictionary of the grids, the tightest and best
+            tolerances, the frontier, the outliers and each report's own tightest tolerances.
+        """
+        rt_tolerance, area_tolerance, single_count = self.best()
+        return {
+            'istd_rt': self.istd_rt,
+            'istd_area_target': self.istd_area_target,
+            'rt_tolerances': self.rt_tolerances.tolist(),
+            'area_tolerances': self.area_tolerances.tolist(),
+            'tightest': _tolerances_dict(self.tightest()),
+            'best': dict(_tolerances_dict((rt_tolerance, area_tolerance)), reports_with_one_peak=single_count,
+                         reports=len(self.files)),
+            'frontier': [_tolerances_dict(pair) for pair in self.frontier()],
+            'outliers': [{'file': f, 'sample_name': self.sample_names[self.files.index(f)], 'peaks': count}
+                         for f, count in self.outliers()],
+            'reports': [{'file': f, 'sample_name': name, 'tightest': _tolerances_dict(self.tightest(f))}
+                        for f, name in zip(self.files, self.sample_names)],
+            'unreadable': [{'file': f, 'error': reason} for f, reason in self.unreadable]
+        }
+
+    def best(self):
+        """
+        Gets the tightest tolerances at which the most reports have exactly one acceptable peak
+        :return: Tuple of the RT tolerance, area tolerance and number of reports with one peak.
+        """
+        single_counts = (self.counts == 1).sum(axis=0)
+        i, j = self._tightest_index(single_counts == single_counts.max())
+        return float(self.rt_tolerances[i]), float(self.area_tolerances[j]), int(single_counts[i, j])
+
+    def frontier(self):
+        """
+        Gets the smallest area tolerance that gives every report one peak at each RT tolerance
+        :return: List of (RT tolerance, area tolerance) tuples, for RT tolerances where there is one.
+        """
+        single = (self.counts == 1).all(axis=0)
+        return [(float(rt_tolerance), float(self.area_tolerances[np.argmax(row)]))
+                for rt_tolerance, row in zip(self.rt_tolerances, single) if row.any()]
+
+    def outliers(self):
+        """
+        Gets the reports that do not have exactly one acceptable peak at the best tolerances
+        :return: List of (file, peak count) tuples in files order.
+        """
+        rt_tolerance, area_tolerance, _ = self.best()
+        return [(f, count) for f, count in zip(self.files, self.peak_counts(rt_tolerance, area_tolerance))
+                if count != 1]
+
+    def peak_counts(self, rt_tolerance, area_tolerance):
+        """
+        Gets the number of acceptable peaks of each report at a pair of tolerances in the grid
+        :return: List of peak counts in files order.
+        """
+        i = np.flatnonzero(self.rt_tolerances == rt_tolerance)
+        j = np.flatnonzero(self.area_tolerances == area_tolerance)
+        if not len(i) or not len(j):
+            raise ValueError("Tolerances %s and %s are not in the search grid." % (rt_tolerance, area_tolerance))
+        return self.counts[:, i[0], j[0]].tolist()
+
+    def tightest(self, file=None):
+        """
+        Gets the tightest tolerances at which every report, or a single report, has exactly one acceptable peak
+        :param file: Report file, or None for every report
+        :return: Tuple of the RT tolerance and area tolerance, or None if no tolerances in the grid do.
+        """
+        single = self.counts == 1
+        if file is not None:
+            single = single[self.files.index(file)]
+        else:
+            single = single.all(axis=0)
+        if not single.any():
+            return None
+        i, j = self._tightest_index(single)
+        return float(self.rt_tolerances[i]), float(self.area_tolerances[j])
+
+    def _count(self, peak_data_lists):
+        return opvec.count_istd_candidates(opvec.PeakArrays(peak_data_lists), self.istd_rt, self.istd_area_target,
+                                           self.rt_tolerances, self.area_tolerances)
+
+    def _tightest_index(self, mask):
+        """Gets the grid index of the tightest tolerances where mask is True, the smaller RT tolerance on a tie."""
+        relative = (self.rt_tolerances[:, np.newaxis] / self.rt_tolerances.max() +
+                    self.area_tolerances[np.newaxis, :] / self.area_tolerances.max())
+        # argmin gives the first of equal values in row order, which has the smaller RT tolerance
+        return np.unravel_index(np.argmin(np.where(mask, relative, np.inf)), mask.shape)
+
+
+def search_batch(directory, parameters, rt_tolerances=None, area_tolerances=None,
+                 processes=opx.DEF_PARSE_PROCESSES, cache=None):
+    """
+    Reads the reports in a directory and searches a grid of internal standard tolerances
+    :param directory: Directory containing the blank and sample reports for one batch
+    :param parameters: Instance of op.BatchParameters class, for the internal standard
+        targets and the current tolerances
+    :param rt_tolerances: Retention time tolerances to search, or None for tolerance_grid
+        of the current RT tolerance
+    :param area_tolerances: Area tolerances to search, or None for tolerance_grid of the
+        current area tolerance
+    :param processes: Number of worker processes used to parse the reports
+    :param cache: Optional opcache.ReportCache instance used to skip parsing unchanged reports
+    :return: Instance of ToleranceSearch class. Reports that cannot be read are listed in its unreadable list.
+    """
+    if rt_tolerances is None:
+        rt_tolerances = tolerance_grid(parameters.istd_rt_tolerance)
+    if area_tolerances is None:
+        area_tolerances = tolerance_grid(parameters.istd_area_tolerance)
+
+    blank_file_list, sample_file_list = op.find_report_files(directory)
+    file_list = blank_file_list + sample_file_list
+    unreadable = []
+
+    def iter_reports():
+        for f, report_data in izip(file_list, op.iter_data_from_reports(file_list, processes, cache, errors=True)):
+            if isinstance(report_data, op.ReportError):
+                unreadable.append((f, str(report_data)))
+            else:
+                yield f, report_data[0], report_data[2]
+    return ToleranceSearch(iter_reports(), parameters.istd_rt, parameters.istd_area_target, rt_tolerances,
+                           area_tolerances, unreadable)
+
+
+def tolerance_grid(tolerance, scale=opx.DEF_TUNE_TOLERANCE_SCALE, steps=opx.DEF_TUNE_GRID_STEPS):
+    """
+    Gets evenly spaced tolerances up to a multiple of the current tolerance
+    :param tolerance: Current tolerance, which is always included in the grid
+    :param scale: Largest tolerance as a multiple of the current tolerance
+    :param steps: Number of evenly spaced tolerances
+    :return: Sorted array of tolerances, rounded to 4 significant figures.
+    """
+    grid = [float('%.4g' % t) for t in np.linspace(tolerance * scale / steps, tolerance * scale, steps)]
+    return np.unique(grid + [tolerance])
+
+
+def _tolerances_dict(tolerances):
+    if tolerances is None:
+        return None
+    return {'istd_rt_tolerance': tolerances[0], 'istd_area_tolerance': tolerances[1]}
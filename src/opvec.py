@@ -0,0 +1,334 @@
+"""
+Module: opvec.py
+Vectorised versions of the op fraction and internal standard calculations
+that work on every sample in a batch at once using NumPy arrays.
+
+The peak columns of each sample (index, start, RT, end and area in the
+opx.PEAK_LS_* layout) are loaded into padded 2D arrays, one row per sample,
+and the boundary indices, internal standard areas and concentrations are
+calculated with array operations. Results match the op functions to
+opx.DEF_DECIMAL_PLACES.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: numpy
+
+Classes:
+PeakArrays: Padded peak data arrays for a set of samples.
+
+Functions:
+calculate_concentrations: Calculate the concentrations for arrays of fraction and internal standard areas
+calculate_sample_results: Calculates the fraction concentrations for a list of samples
+count_istd_candidates: Counts the acceptable internal standard peaks of each sample for a grid of tolerances
+fraction_areas: Calculates the fraction areas for every sample
+get_fraction_end_indices: Finds the ending index of each sample for the retention time wanted
+get_fraction_start_indices: Finds the starting index of each sample for the retention time wanted
+get_istd_areas: Get the internal standard peak area of each sample
+sum_areas: Sums the peak areas of each sample between bounding indices
+"""
+
+import numpy as np
+
+import op
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+class PeakArrays(object):
+    """
+    Padded peak data arrays for a set of samples. Each column array has one row
+    per sample, padded with NaN after the sample's last peak.
+    """
+    def __init__(self, peak_data_lists):
+        peak_data_lists = [p if isinstance(p, op.PeakTable) else list(p) for p in peak_data_lists]
+        counts = np.array([len(p) for p in peak_data_lists], dtype=np.intp)
+        width = int(counts.max()) if len(peak_data_lists) else 0
+
+        columns = np.full((5, len(peak_data_lists), width), np.nan)
+        for row, peak_data in enumerate(peak_data_lists):
+            if not len(peak_data):
+                continue
+            if isinstance(peak_data, op.PeakTable):
+                # Copy the column arrays straight from their buffers
+                for n, column in enumerate(peak_data.columns):
+                    columns[n, row, :len(peak_data)] = np.frombuffer(column, dtype=column.typecode)
+            else:
+                columns[:, row, :len(peak_data)] = np.array(peak_data, dtype=float).T
+        self._set_columns(columns, counts)
+
+    @classmethod
+    def from_segments(cls, columns, offsets, counts):
+        """
+        Builds the arrays from peak columns holding many samples one after another,
+        e.g. the memory-mapped columns of an oparchive.PeakArchive
+        :param columns: Sequence of the idx, start, rt, end and area column arrays
+        :param offsets: Array of the position of each sample's first peak in the columns
+        :param counts: Array of the number of peaks of each sample
+        :return: PeakArrays instance.
+        """
+        counts = np.asarray(counts, dtype=np.intp)
+        width = int(counts.max()) if len(counts) else 0
+        # Row and position in the row of every peak, and where it is in the columns
+        rows = np.repeat(np.arange(len(counts)), counts)
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        source = np.repeat(np.asarray(offsets, dtype=np.intp), counts) + positions
+
+        padded = np.full((5, len(counts), width), np.nan)
+        for n, column in enumerate(columns):
+            padded[n, rows, positions] = column[source]
+        arrays = cls.__new__(cls)
+        arrays._set_columns(padded, counts)
+        return arrays
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _set_columns(self, columns, counts):
+        self.counts = counts
+        self.idx = columns[opx.PEAK_LS_IDX]
+        self.start = columns[opx.PEAK_LS_START]
+        self.rt = columns[opx.PEAK_LS_RT]
+        self.end = columns[opx.PEAK_LS_END]
+        self.area = columns[opx.PEAK_LS_AREA]
+
+        # Cumulative areas with a leading zero column so any slice sum is a difference
+        self.cumulative_area = np.zeros((len(counts), columns.shape[2] + 1))
+        np.cumsum(np.nan_to_num(self.area), axis=1, out=self.cumulative_area[:, 1:])
+
+
+def calculate_concentrations(area, istd, blank_area, blank_istd, calibration_slope, calibration_intercept,
+                             istd_concentration, dilution_factor):
+    """
+    Calculate the concentrations for arrays of fraction and internal standard areas
+    :param area: Array of fraction areas
+    :param istd: Array of internal standard areas
+    :param blank_area: Average blank area for the fraction
+    :param blank_istd: Average blank internal standard area
+    :return: Array of final corrected concentrations, rounded as op.calculate_concentration.
+        Arguments are broadcast, so arrays of calibration values give a concentration
+        for every combination, e.g. shape (scenarios, 1) values with (1, samples) areas.
+    """
+    # Same order of operations as op.calculate_concentration
+    istd_blank_corrected = istd * (blank_area / blank_istd)
+    area_blank_corrected = area - istd_blank_corrected
+
+    response_ratio = area_blank_corrected / istd
+    concentration_ratio = (response_ratio - calibration_intercept) / calibration_slope
+
+    concentration_vial = concentration_ratio * istd_concentration
+    concentration_sample = concentration_vial * dilution_factor
+
+    # Python's round rather than np.round so halves round the same way as op
+    return np.array([round(c, opx.DEF_DECIMAL_PLACES)
+                     for c in concentration_sample.ravel().tolist()]).reshape(concentration_sample.shape)
+
+
+def calculate_sample_results(sample_reports, blank_average, parameters):
+    """
+    Calculates the fraction concentrations for a list of samples
+    :param sample_reports: List of (sample name, analysis time, peak data) tuples
+    :param blank_average: Instance of op.BlankAverage class for the batch
+    :param parameters: Instance of op.BatchParameters class
+    :return: List of result dictionaries in sample_reports order, as op.calculate_sample_result.
+    """
+    sample_reports = list(sample_reports)
+    arrays = PeakArrays([r[2] for r in sample_reports])
+
+    accepted = _accepted_istd_peaks(arrays, **parameters.istd_kwargs())
+    if op.stats is not None:
+        candidates = accepted.sum(axis=1).tolist()
+        for n in candidates:
+            op.stats.count(('istd_none', 'istd_single_candidate', 'istd_multiple_candidates')[min(n, 2)])
+        op.stats.record_block(istd_candidates=candidates)
+    istd = _closest_istd_areas(arrays, accepted, parameters.istd_rt)
+    missing = np.flatnonzero(np.isnan(istd))
+    if len(missing):
+        e = op.IstdError("No acceptable internal standard peaks found.")
+        e.sample_name = sample_reports[missing[0]][0]
+        raise e
+
+    areas = fraction_areas(arrays, parameters.analysis_c6_c10)
+    concentrations = {}
+    for fraction, area in areas.items():
+        concentrations['conc_' + fraction] = calculate_concentrations(
+            area, istd, getattr(blank_average, 'area_' + fraction), blank_average.istd,
+            **parameters.calibration_kwargs())
+
+    result_set = []
+    for n, (sample_name, analysis_time, _) in enumerate(sample_reports):
+        result = {
+            'sample_name': sample_name,
+            'analysis_time': analysis_time
+        }
+        for fieldname, concentration in concentrations.items():
+            result[fieldname] = concentration[n]
+        result_set.append(result)
+    return result_set
+
+
+def count_istd_candidates(arrays, istd_rt, istd_area_target, rt_tolerances, area_tolerances):
+    """
+    Counts the acceptable internal standard peaks of each sample for a grid of tolerances
+    :param arrays: Instance of PeakArrays class
+    :param istd_rt: Target retention time for the internal standard
+    :param istd_area_target: Target area for the internal standard
+    :param rt_tolerances: Sequence of retention time tolerances
+    :param area_tolerances: Sequence of area tolerances
+    :return: Integer array of shape (samples, RT tolerances, area tolerances) with the
+        number of peaks op.get_istd_area accepts for each pair of tolerances.
+    """
+    rt_tolerances = np.asarray(rt_tolerances, dtype=float)
+    area_tolerances = np.asarray(area_tolerances, dtype=float)
+    # Window limits calculated as op.get_istd_area, so the comparisons are identical
+    rt_low = istd_rt - rt_tolerances
+    rt_high = istd_rt + rt_tolerances
+    lower_limits = istd_area_target - area_tolerances
+    upper_limits = istd_area_target + area_tolerances
+
+    # Only peaks inside the widest window can be counted, so move them to the front
+    # of each row and drop the other columns before expanding over the grid
+    with np.errstate(invalid='ignore'):
+        widest = ((rt_low.min() <= arrays.rt) & (arrays.rt <= rt_high.max()) &
+                  (lower_limits.min() <= arrays.area) & (arrays.area <= upper_limits.max()))
+    width = int(widest.sum(axis=1).max()) if widest.size else 0
+    order = np.argsort(~widest, axis=1, kind='mergesort')[:, :width]
+    rows = np.arange(len(arrays))[:, np.newaxis]
+    kept = widest[rows, order]
+    rt = np.where(kept, arrays.rt[rows, order], np.nan)[:, :, np.newaxis]
+    area = np.where(kept, arrays.area[rows, order], np.nan)[:, :, np.newaxis]
+
+    with np.errstate(invalid='ignore'):
+        in_rt_window = (rt_low <= rt) & (rt <= rt_high)
+        in_area_range = (lower_limits <= area) & (area <= upper_limits)
+    # A peak is accepted for a pair of tolerances when it is in both, so the
+    # counts for every pair are a product summed over the peaks
+    return np.einsum('spr,spa->sra', in_rt_window.astype(np.intp), in_area_range.astype(np.intp))
+
+
+def fraction_areas(arrays, analysis_c6_c10):
+    """
+    Calculates the fraction areas for every sample
+    :param arrays: Instance of PeakArrays class
+    :param analysis_c6_c10: True for C6-C10 analysis, False for >C10-C40
+    :return: Dictionary of fraction name (e.g. 'c10_c16') to an array of areas.
+    """
+    # Same boundaries as op.get_fraction_areas
+    if analysis_c6_c10:
+        i_c6 = np.zeros(len(arrays), dtype=np.intp)
+        i_c10 = get_fraction_end_indices(arrays, opx.C6_C10_END)
+        return {'c6_c10': sum_areas(arrays, i_c6, i_c10)}
+
+    i_c10 = get_fraction_start_indices(arrays, opx.C10_C16_START)
+    i_c16 = get_fraction_end_indices(arrays, opx.C10_C16_END)
+    i_c34 = get_fraction_end_indices(arrays, opx.C16_C34_END)
+    i_c40 = get_fraction_end_indices(arrays, opx.C34_C40_END)
+    return {
+        'c10_c16': sum_areas(arrays, i_c10, i_c16),
+        'c16_c34': sum_areas(arrays, i_c16, i_c34),
+        'c34_c40': sum_areas(arrays, i_c34, i_c40),
+        'c10_c40': sum_areas(arrays, i_c10, i_c40)
+    }
+
+
+def get_fraction_end_indices(arrays, rt_end):
+    """
+    Finds the ending index of each sample for the retention time wanted
+    :param arrays: Instance of PeakArrays class
+    :param rt_end: Ending retention time for boundaries
+    :return: Integer array of ending indices, as op.get_fraction_end_index.
+    :raises ValueError: If a sample has no peak ending at or after rt_end
+    """
+    diff = arrays.end - rt_end
+    with np.errstate(invalid='ignore'):
+        diff[~(diff >= 0)] = np.inf
+    # argmin returns the first of equal differences, as min() does
+    rows = np.arange(len(arrays))
+    position = np.argmin(diff, axis=1) if diff.size else None
+    if position is None or not np.isfinite(diff[rows, position]).all():
+        # Same error as op.get_fraction_end_index
+        raise ValueError("No peak ends after retention time %s." % rt_end)
+    return arrays.idx[rows, position].astype(np.intp)
+
+
+def get_fraction_start_indices(arrays, rt_start):
+    """
+    Finds the starting index of each sample for the retention time wanted
+    :param arrays: Instance of PeakArrays class
+    :param rt_start: Starting retention time for boundaries
+    :return: Integer array of starting indices, as op.get_fraction_start_index.
+    """
+    diff = arrays.start - rt_start
+    with np.errstate(invalid='ignore'):
+        diff = np.where(diff <= 0, np.abs(diff), np.inf)
+    if not diff.size:
+        return np.ones(len(arrays), dtype=np.intp)
+    position = np.argmin(diff, axis=1)
+    rows = np.arange(len(arrays))
+    # First detected peak starts after target retention time
+    return np.where(np.isfinite(diff[rows, position]), arrays.idx[rows, position], 1).astype(np.intp)
+
+
+def get_istd_areas(arrays, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance):
+    """
+    Get the internal standard peak area of each sample
+    :param arrays: Instance of PeakArrays class
+    :param istd_rt: Target retention time for the internal standard
+    :param istd_rt_tolerance: Acceptable retention time tolerance for the internal standard
+    :param istd_area_target: Target area for the internal standard
+    :param istd_area_tolerance: Acceptable tolerance for istd area
+    :return: Array of internal standard areas, NaN for samples with no acceptable peak.
+    """
+    accepted = _accepted_istd_peaks(arrays, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance)
+    return _closest_istd_areas(arrays, accepted, istd_rt)
+
+
+def sum_areas(arrays, low_index, high_index):
+    """
+    Sums the peak areas of each sample between bounding indices
+    :param arrays: Instance of PeakArrays class
+    :param low_index: Array of indices of the first peak to sum
+    :param high_index: Array of indices of the final peak to sum
+    :return: Array of total areas, as op.sum_areas with list slice semantics.
+    """
+    low = _slice_bound(np.asarray(low_index, dtype=np.intp), arrays.counts)
+    high = _slice_bound(np.asarray(high_index, dtype=np.intp), arrays.counts)
+    rows = np.arange(len(arrays))
+    total = arrays.cumulative_area[rows, high] - arrays.cumulative_area[rows, low]
+    return np.where(high > low, total, 0.0)
+
+
+def _slice_bound(index, counts):
+    """Normalises slice bounds to 0..count in the same way as a list slice."""
+    index = np.where(index < 0, index + counts, index)
+    return np.clip(index, 0, counts)
+
+
+def _accepted_istd_peaks(arrays, istd_rt, istd_rt_tolerance, istd_area_target, istd_area_tolerance):
+    """Finds the peaks of each sample inside the internal standard window and area limits."""
+    # Calculate acceptable retention time window and area limits as op.get_istd_area
+    istd_rt_low = istd_rt - istd_rt_tolerance
+    istd_rt_high = istd_rt + istd_rt_tolerance
+    lower_limit = istd_area_target - istd_area_tolerance
+    upper_limit = istd_area_target + istd_area_tolerance
+
+    with np.errstate(invalid='ignore'):
+        return ((istd_rt_low <= arrays.rt) & (arrays.rt <= istd_rt_high) &
+                (lower_limit <= arrays.area) & (arrays.area <= upper_limit))
+
+
+def _closest_istd_areas(arrays, accepted, istd_rt):
+    """Gets the area of each sample's accepted peak closest to istd_rt, NaN if there is none."""
+    # Closest retention time wins when there are several acceptable peaks
+    relative_rt = np.where(accepted, np.abs(arrays.rt - istd_rt), np.inf)
+    if not relative_rt.size:
+        return np.full(len(arrays), np.nan)
+    position = np.argmin(relative_rt, axis=1)
+    rows = np.arange(len(arrays))
+    return np.where(accepted[rows, position], arrays.area[rows, position], np.nan)
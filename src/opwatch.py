@@ -0,0 +1,266 @@
+"""
+Module: opwatch.py
+Watch mode for keeping a batch's results file up to date while the instrument
+exports reports into the batch directory.
+
+The directory is polled for new, changed and removed reports. Only those
+reports are parsed. A new or changed sample only updates its own row, while a
+change to the blanks recalculates the blank average and the concentrations of
+the samples, which depend on it. Sample fraction and internal standard areas
+are kept, so recalculating after a blank change does not parse the samples again.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd
+
+Classes:
+ReportWatcher: Keeps the results file of a batch directory up to date as reports arrive.
+"""
+
+import csv
+import os
+import tempfile
+import time
+
+import op
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+class ReportWatcher(object):
+    """
+    Keeps the results file of a batch directory up to date as reports arrive.
+    Call poll regularly (or run, which polls until stopped). A report is only
+    read once its size and modification time have not changed for settle_time
+    seconds, so files that are still being exported are left until complete.
+    """
+    def __init__(self, directory, out_filepath, parameters, processes=opx.DEF_PARSE_PROCESSES, cache=None,
+                 settle_time=opx.DEF_WATCH_SETTLE_SECONDS, log=None):
+        """
+        :param directory: Directory the instrument exports the batch's reports to
+        :param out_filepath: Path of the csv results file to keep up to date
+        :param parameters: Instance of op.BatchParameters class
+        :param processes: Number of worker processes used to parse a group of new reports
+        :param cache: Optional opcache.ReportCache instance
+        :param settle_time: Seconds a report must be unchanged before it is read
+        :param log: Optional callable taking a message string, for progress and errors
+        """
+        self.directory = directory
+        self.out_filepath = out_filepath
+        self.parameters = parameters
+        self.processes = processes
+        self.cache = cache
+        self.settle_time = settle_time
+        self.log = log
+
+        # Fingerprint (size, mtime) of every report that has been read
+        self.fingerprints = {}
+        # Fingerprints of changed reports waiting to settle, with the time first seen
+        self.pending = {}
+        # Peak data of each blank, and the evaluation and metadata of each sample
+        self.blank_data = {}
+        self.samples = {}
+        # Current result row of each sample, and the file order of the rows in the csv file
+        self.results = {}
+        self.blank_average = None
+        self._written = []
+        self._written_rows = {}
+
+    def poll(self):
+        """
+        Checks the directory once and updates the results file for any settled changes
+        :return: List of the report files that were read or removed.
+        """
+        blank_file_list, sample_file_list = op.find_report_files(self.directory, exclude=[self.out_filepath])
+        current = {}
+        for f in blank_file_list + sample_file_list:
+            try:
+                stat = os.stat(f)
+            except OSError:
+                continue
+            current[f] = (stat.st_size, stat.st_mtime)
+
+        # Reports deleted while waiting to settle are no longer waited for
+        for f in [f for f in self.pending if f not in current]:
+            del self.pending[f]
+
+        # Reports that have settled since they last changed
+        now = time.time()
+        ready = []
+        for f, fingerprint in current.items():
+            if self.fingerprints.get(f) == fingerprint:
+                self.pending.pop(f, None)
+                continue
+            first_seen = self.pending.get(f)
+            if first_seen is None or first_seen[0] != fingerprint:
+                self.pending[f] = (fingerprint, now)
+            elif now - first_seen[1] >= self.settle_time:
+                ready.append(f)
+        removed = [f for f in self.fingerprints if f not in current]
+
+        if not ready and not removed:
+            return []
+
+        blank_set = set(blank_file_list)
+        blanks_changed = False
+        for f in removed:
+            del self.fingerprints[f]
+            if f in self.blank_data:
+                del self.blank_data[f]
+                blanks_changed = True
+            self.samples.pop(f, None)
+            self.results.pop(f, None)
+            self._log("Removed %s" % f)
+
+        # Read the settled reports in file order
+        ready.sort()
+        for f, report in zip(ready, self._read_reports(ready)):
+            self.fingerprints[f] = self.pending.pop(f)[0]
+            if report is None:
+                continue
+            sample_name, analysis_time, peak_data = report
+            if f in blank_set:
+                self.blank_data[f] = peak_data
+                blanks_changed = True
+                self._log("Read blank %s" % f)
+                continue
+            try:
+                evaluation = op.SampleEvaluation(peak_data, self.parameters.analysis_c6_c10,
+                                                 **self.parameters.istd_kwargs())
+            except (op.IstdError, ValueError) as e:
+                self.samples.pop(f, None)
+                self.results.pop(f, None)
+                self._log("Error on sample %s: %s" % (sample_name, e))
+                continue
+            self.samples[f] = (sample_name, analysis_time, evaluation)
+            self._log("Read sample %s" % sample_name)
+
+        if blanks_changed:
+            # Every sample's concentration depends on the blank average
+            self._update_blank_average()
+            changed = sorted(self.samples)
+        else:
+            changed = [f for f in ready if f in self.samples]
+        for f in changed:
+            self._update_result(f)
+
+        self._write_results()
+        return ready + removed
+
+    def run(self, interval=opx.DEF_WATCH_INTERVAL_SECONDS, stop=None):
+        """
+        Polls the directory until stopped
+        :param interval: Seconds between polls
+        :param stop: Optional callable returning True when watching should stop
+        :return: No return value
+        """
+        while stop is None or not stop():
+            self.poll()
+            time.sleep(interval)
+
+    def _log(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def _read_reports(self, file_list):
+        """Parses reports in file order, giving None for reports that cannot be read yet."""
+        try:
+            return op.get_data_from_reports(file_list, self.processes, self.cache)
+        except Exception:
+            # Read one at a time to find the bad report(s)
+            reports = []
+            for f in file_list:
+                try:
+                    reports.append(op.get_data_from_report(f))
+                except Exception as e:
+                    # Its fingerprint is still kept, so it is read again once it changes
+                    reports.append(None)
+                    self._log("Could not read %s: %s" % (f, e))
+            return reports
+
+    def _update_blank_average(self):
+        self.blank_average = None
+        if not self.blank_data:
+            self._log("No blanks yet, sample results are on hold")
+            return
+        try:
+            self.blank_average = op.BlankAverage(
+                blank_data=[self.blank_data[f] for f in sorted(self.blank_data)],
+                analysis_c6_c10=self.parameters.analysis_c6_c10,
+                **self.parameters.istd_kwargs())
+        except (op.IstdError, ValueError) as e:
+            self._log("ISTD error encountered on blank: %s" % e)
+            return
+        self._log("Blank average updated from %d blanks" % len(self.blank_data))
+
+    def _update_result(self, f):
+        if self.blank_average is None:
+            self.results.pop(f, None)
+            return
+        sample_name, analysis_time, evaluation = self.samples[f]
+        result = {
+            'sample_name': sample_name,
+            'analysis_time': analysis_time
+        }
+        for fraction in evaluation.fractions:
+            result['conc_' + fraction] = evaluation.concentration(fraction, self.blank_average,
+                                                                  **self.parameters.calibration_kwargs())
+        self.results[f] = result
+
+    def _write_results(self):
+        """
+        Writes the results file, appending rows when the only change is new samples
+        after the existing ones and rewriting it otherwise.
+        """
+        order = sorted(self.results)
+        written = len(self._written)
+        unchanged = order[:written] == self._written and \
+            all(self.results[x] == self._written_rows[x] for x in self._written)
+        if unchanged and written == len(order):
+            return
+
+        if unchanged and written and os.path.exists(self.out_filepath):
+            with open(self.out_filepath, 'ab') as f:
+                writer = self._dict_writer(f)
+                writer.writerows([self.results[x] for x in order[written:]])
+        else:
+            # Write a new file and swap it in, so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.out_filepath)))
+            with os.fdopen(fd, 'wb') as f:
+                writer = self._dict_writer(f)
+                writer.writeheader()
+                writer.writerows([self.results[x] for x in order])
+            _replace(temp_path, self.out_filepath)
+
+        self._written = order
+        self._written_rows = dict((x, self.results[x]) for x in order)
+
+    def _dict_writer(self, f):
+        return csv.DictWriter(
+            f,
+            delimiter=',',
+            extrasaction='ignore',
+            fieldnames=self.parameters.fieldnames
+        )
+
+
+def _replace(source, destination):
+    """Renames source over destination, which readers see change in one step where the platform allows it."""
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    elif os.name == 'nt':
+        # Python 2 on Windows cannot rename over an existing file, so the destination
+        # is briefly missing between the remove and the rename
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+    else:
+        # Python 2 on POSIX, where rename replaces the destination atomically
+        os.rename(source, destination)
@@ -0,0 +1,218 @@
+"""
+Module: opwhatif.py
+Recalculates a batch under many alternative calibrations at once, e.g. to
+re-report a batch with a different calibration slope and intercept, internal
+standard concentration or dilution factor.
+
+The calibration values only enter the final arithmetic of
+op.calculate_concentration, so the reports are read and each sample's fraction
+and internal standard areas are resolved once for the batch. The concentrations
+for every scenario are then calculated together as array arithmetic with
+opvec.calculate_concentrations, in the same order of operations as a normal
+run, so each scenario's results are the same as a full run with its values.
+
+Scenarios are read from a csv file with an optional 'name' column and any of
+the calibration_slope, calibration_intercept, istd_concentration and
+dilution_factor columns. Values that are not given take the batch parameters.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: numpy
+
+Classes:
+ResolvedBatch: Fraction and internal standard areas of a batch's samples, and the batch's blank average.
+
+Functions:
+read_scenarios: Reads calibration scenarios from a csv file
+resolve_batch: Reads a batch directory and resolves the areas of its samples
+write_long: Writes one row per scenario and sample to a csv file
+write_wide: Writes one row per sample with a column per scenario and fraction to a csv file
+"""
+
+import csv
+
+import numpy as np
+
+import op
+import opvec
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+class ResolvedBatch(object):
+    """
+    Fraction and internal standard areas of a batch's samples, and the batch's blank average.
+    """
+    def __init__(self, samples, blank_average, parameters):
+        """
+        :param samples: Iterable of (file, sample name, analysis time, op.SampleEvaluation) tuples
+        :param blank_average: Instance of op.BlankAverage class for the batch
+        :param parameters: Instance of op.BatchParameters class the areas were resolved with
+        """
+        self.files = []
+        self.sample_names = []
+        self.analysis_times = []
+        istd = []
+        areas = dict((fraction, []) for fraction in op.fraction_names(parameters.analysis_c6_c10))
+        for f, sample_name, analysis_time, evaluation in samples:
+            self.files.append(f)
+            self.sample_names.append(sample_name)
+            self.analysis_times.append(analysis_time)
+            istd.append(evaluation.istd)
+            for fraction, area in areas.items():
+                area.append(evaluation.areas[fraction])
+
+        self.blank_average = blank_average
+        self.parameters = parameters
+        self.istd = np.array(istd, dtype=float)
+        self.areas = dict((fraction, np.array(area, dtype=float)) for fraction, area in areas.items())
+
+    def __len__(self):
+        return len(self.files)
+
+    def concentrations(self, scenarios):
+        """
+        Calculates the concentrations of every sample for every scenario
+        :param scenarios: List of (name, op.BatchParameters) tuples, as read_scenarios
+        :return: Dictionary of csv fieldname (e.g. 'conc_c10_c16') to an array of shape
+            (scenarios, samples), rounded as op.calculate_concentration.
+        """
+        calibration = {}
+        for key in opx.SCENARIO_COLUMNS:
+            calibration[key] = np.array([getattr(p, key) for _, p in scenarios], dtype=float)[:, np.newaxis]
+
+        concentrations = {}
+        for fraction in op.fraction_names(self.parameters.analysis_c6_c10):
+            concentrations['conc_' + fraction] = opvec.calculate_concentrations(
+                self.areas[fraction][np.newaxis, :], self.istd[np.newaxis, :],
+                getattr(self.blank_average, 'area_' + fraction), self.blank_average.istd, **calibration)
+        return concentrations
+
+
+def read_scenarios(scenarios_filepath, parameters):
+    """
+    Reads calibration scenarios from a csv file
+    :param scenarios_filepath: Path of a csv file with one row per scenario
+    :param parameters: Instance of op.BatchParameters class giving the analysis type,
+        internal standard and any calibration values a scenario does not set
+    :return: List of (name, op.BatchParameters) tuples in file order. Scenarios
+        without a name are named scenario_1, scenario_2 and so on.
+    """
+    scenarios = []
+    with open(scenarios_filepath, 'rb') as f:
+        reader = csv.DictReader(f)
+        unknown = [c for c in reader.fieldnames or [] if c not in opx.SCENARIO_COLUMNS + ['name']]
+        if unknown:
+            raise ValueError("%s has an unknown column %s. Scenario columns are name, %s."
+                             % (scenarios_filepath, unknown[0], ', '.join(opx.SCENARIO_COLUMNS)))
+        for n, row in enumerate(reader):
+            values = parameters.as_dict()
+            for key in opx.SCENARIO_COLUMNS:
+                if row.get(key, '').strip():
+                    try:
+                        values[key] = float(row[key])
+                    except ValueError:
+                        raise ValueError("%s row %d has an invalid %s: %s" %
+                                         (scenarios_filepath, n + 2, key, row[key]))
+            name = (row.get('name') or '').strip() or 'scenario_%d' % (n + 1)
+            scenarios.append((name, op.BatchParameters(**values)))
+    names = [name for name, _ in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError("%s has more than one scenario with the same name." % scenarios_filepath)
+    return scenarios
+
+
+def resolve_batch(directory, parameters, processes=opx.DEF_PARSE_PROCESSES, cache=None):
+    """
+    Reads a batch directory and resolves the areas of its samples
+    :param directory: Directory containing the blank and sample reports for one batch
+    :param parameters: Instance of op.BatchParameters class, for the analysis type and internal standard
+    :param processes: Number of worker processes used to parse the reports
+    :param cache: Optional opcache.ReportCache instance used to skip parsing unchanged reports
+    :return: Instance of ResolvedBatch class. The peak data of each report is released
+        once its areas are resolved.
+    """
+    blank_file_list, sample_file_list = op.find_report_files(directory)
+    reports = op.iter_data_from_reports(blank_file_list + sample_file_list, processes, cache)
+    try:
+        try:
+            # Blanks are averaged as they are read, so only one is held at a time
+            blank_average = op.BlankAverage(blank_data=(next(reports)[2] for _ in blank_file_list),
+                                            analysis_c6_c10=parameters.analysis_c6_c10, **parameters.istd_kwargs())
+        except op.IstdError as e:
+            e.blank = True
+            e.batch = directory
+            raise
+
+        def iter_samples():
+            for f in sample_file_list:
+                sample_name, analysis_time, peak_data = next(reports)
+                try:
+                    evaluation = op.SampleEvaluation(peak_data, parameters.analysis_c6_c10,
+                                                     **parameters.istd_kwargs())
+                except op.IstdError as e:
+                    e.sample_name = sample_name
+                    e.batch = directory
+                    raise
+                yield f, sample_name, analysis_time, evaluation
+        return ResolvedBatch(iter_samples(), blank_average, parameters)
+    finally:
+        reports.close()
+
+
+def write_long(out_filepath, batch, scenarios):
+    """
+    Writes one row per scenario and sample to a csv file
+    :param out_filepath: Path of the csv file to be written
+    :param batch: Instance of ResolvedBatch class
+    :param scenarios: List of (name, op.BatchParameters) tuples, as read_scenarios
+    :return: Number of rows written.
+    """
+    concentrations = batch.concentrations(scenarios)
+    fieldnames = ['scenario'] + opx.SCENARIO_COLUMNS + batch.parameters.fieldnames
+    with open(out_filepath, 'wb') as f:
+        writer = csv.DictWriter(f, fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        for n, (name, parameters) in enumerate(scenarios):
+            scenario = dict((key, getattr(parameters, key)) for key in opx.SCENARIO_COLUMNS)
+            scenario['scenario'] = name
+            columns = dict((fieldname, values[n].tolist()) for fieldname, values in concentrations.items())
+            for m in range(len(batch)):
+                row = dict(scenario, sample_name=batch.sample_names[m], analysis_time=batch.analysis_times[m])
+                for fieldname, values in columns.items():
+                    row[fieldname] = values[m]
+                writer.writerow(row)
+    return len(scenarios) * len(batch)
+
+
+def write_wide(out_filepath, batch, scenarios):
+    """
+    Writes one row per sample with a column per scenario and fraction to a csv file
+    :param out_filepath: Path of the csv file to be written. Concentration columns are
+        named <scenario>_conc_<fraction>, in scenario order.
+    :param batch: Instance of ResolvedBatch class
+    :param scenarios: List of (name, op.BatchParameters) tuples, as read_scenarios
+    :return: Number of rows written.
+    """
+    concentrations = batch.concentrations(scenarios)
+    conc_fieldnames = [c for c in batch.parameters.fieldnames if c in concentrations]
+    columns = []
+    for n, (name, _) in enumerate(scenarios):
+        for fieldname in conc_fieldnames:
+            columns.append(('%s_%s' % (name, fieldname), concentrations[fieldname][n].tolist()))
+
+    with open(out_filepath, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sample_name', 'analysis_time'] + [column for column, _ in columns])
+        for m in range(len(batch)):
+            writer.writerow([batch.sample_names[m], batch.analysis_times[m]] +
+                            [values[m] for _, values in columns])
+    return len(batch)
+
@@ -21,6 +21,7 @@ __version__ = '1.0'
 SAMPLE_NAME_ROW = 1
 ANALYSIS_TIME_ROW = 4
 PEAK_INDEX_COLUMN = 0
+PEAK_LIST_TITLES = ('Start', 'RT', 'End', 'Area')
 
 # Variable columns
 SAMPLE_NAME_COLUMN = 26
@@ -47,9 +48,17 @@ PEAK_LS_RT = 2
 PEAK_LS_END = 3
 PEAK_LS_AREA = 4
 
+# Acquired time formats in reports, tried in order when storing results
+ANALYSIS_TIME_FORMATS = ['%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y %I:%M:%S %p', '%d/%m/%Y %I:%M %p',
+                         '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S']
+
 # Filename flags
 BLANK_TAG = 'BLK'
 
+# Report file extensions, with the delimiter of each text export
+EXCEL_REPORT_EXTENSIONS = ['.xls', '.xlsx']
+TEXT_REPORT_DELIMITERS = {'.csv': ',', '.txt': '\t', '.tsv': '\t'}
+
 # Default values
 DEF_ISTD_RT_C6_C10 = 6.445
 DEF_ISTD_RT_TOLERANCE_C6_C10 = 0.045
@@ -73,6 +82,48 @@ DEF_CALIBRATION_INTERCEPT = -0.3160
 DEF_ANALYSIS_C6_C10 = True
 DEF_DECIMAL_PLACES = 3
 
+# Number of worker processes for parsing reports (0 uses one per CPU, 1 is serial)
+DEF_PARSE_PROCESSES = 0
+
+# Reports each worker process parses ahead of the calculation, which bounds the parsed reports held in memory
+DEF_PARSE_WINDOW_PER_PROCESS = 4
+
+# Number of samples calculated together by the vectorised engine
+DEF_VECTOR_BLOCK_SIZE = 256
+
+# Peaks listed for a failed internal standard search when none are in the retention time window
+DEF_ISTD_CANDIDATE_COUNT = 5
+
+# Internal standard tolerance search grid, up to this multiple of the current tolerances
+DEF_TUNE_TOLERANCE_SCALE = 4
+DEF_TUNE_GRID_STEPS = 40
+
+# Watch mode polling interval, and time a report must be unchanged before it is read
+DEF_WATCH_INTERVAL_SECONDS = 5
+DEF_WATCH_SETTLE_SECONDS = 10
+
+# Processing server, which only listens on this computer
+DEF_SERVER_HOST = '127.0.0.1'
+DEF_SERVER_PORT = 8720
+
+# Parsed report cache, kept in the user's home directory
+DEF_CACHE_DIRNAME = '.org-process-cache'
+DEF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Fraction names, in csv column order
+FRACTIONS_C6_C10 = ['c6_c10']
+FRACTIONS_C10_C40 = ['c10_c16', 'c16_c34', 'c34_c40', 'c10_c40']
+
 # CSV Options
+JOURNAL_SUFFIX = '.journal'
+RUN_REPORT_SUFFIX = '.run.json'
+FAILURES_SUFFIX = '.failures.json'
+# Report discovery ignores these lower case file names, prefixes (Excel temp and
+# lock files, hidden and LibreOffice lock files) and suffixes (run output files)
+IGNORED_FILE_NAMES = ['desktop.ini', 'thumbs.db']
+IGNORED_FILE_PREFIXES = ('~', '.')
+IGNORED_FILE_SUFFIXES = (JOURNAL_SUFFIX, RUN_REPORT_SUFFIX, FAILURES_SUFFIX, '.tmp')
+# Calibration values a what-if scenario can change
+SCENARIO_COLUMNS = ['calibration_slope', 'calibration_intercept', 'istd_concentration', 'dilution_factor']
 FIELDNAMES_C6_C10 = ['sample_name', 'analysis_time', 'conc_c6_c10']
 FIELDNAMES_C10_C40 = ['sample_name', 'analysis_time', 'conc_c10_c16', 'conc_c16_c34', 'conc_c34_c40', 'conc_c10_c40']
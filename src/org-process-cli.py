@@ -0,0 +1,607 @@
+"""
+Module: org-process-cli.py
+Command line interface for running Org-Process calculations without the
+graphical interface, e.g. for unattended batch runs on a server.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd
+
+Functions:
+archive: Adds the reports in directories to a peak archive
+batch: Runs a batch calculation for several directories, each with its own blanks
+build_parser: Builds the command line argument parser
+cache_from_args: Builds the parsed report cache from the parsed arguments
+history: Prints stored results from a results database as csv
+main: Runs the Org-Process command line interface
+parameters_from_args: Builds the batch parameters from the parsed arguments
+query: Prints internal standard and fraction areas of archived reports as csv
+report_failures: Prints the number of failed reports listed in a failure manifest
+rerun: Recalculates only the reports listed in a failure manifest
+run: Runs a batch calculation for a single directory
+serve: Runs the local processing server until interrupted
+store_from_args: Opens the results database from the parsed arguments
+tune: Searches for the tightest internal standard tolerances for a directory
+watch: Keeps the results for a directory up to date until interrupted
+whatif: Calculates the results for a directory under several calibration scenarios at once
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import op
+import opcache
+import opdb
+import opserver
+import opwatch
+import opx
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+
+def archive(args):
+    """
+    Adds the reports in directories to a peak archive
+    :param args: Parsed command line arguments
+    :return: Process exit status, 3 if any reports could not be read.
+    """
+    # Imported here so numpy is only needed for the archive
+    import oparchive
+
+    cache = cache_from_args(args)
+    try:
+        peak_archive = oparchive.PeakArchive(args.archive)
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    failed = []
+    for directory in args.directories:
+        added, unchanged, directory_failed = peak_archive.add_directory(directory, not args.no_recursive,
+                                                                        args.processes, cache)
+        failed.extend(directory_failed)
+        sys.stdout.write("%s: %d reports added, %d already archived\n" % (directory, added, unchanged))
+    for f, reason in failed:
+        sys.stdout.write("Unreadable: %s (%s)\n" % (f, reason))
+    sys.stdout.write("%d reports in %s\n" % (len(peak_archive), args.archive))
+    return 3 if failed else 0
+
+
+def batch(args):
+    """
+    Runs a batch calculation for several directories, each with its own blanks
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    directories = list(args.directories)
+    if args.root:
+        directories.extend(op.find_batch_directories(args.root))
+    if not directories:
+        sys.stderr.write("No batch directories given.\n")
+        return 1
+
+    parameters = parameters_from_args(args)
+    try:
+        cache = cache_from_args(args)
+        store = store_from_args(args)
+        rows_written = op.calculate_batches(directories, args.output, parameters, args.processes, cache=cache,
+                                            vectorised=args.vectorised, resume=args.resume,
+                                            per_batch=args.per_batch, run_report=args.run_report, store=store,
+                                            continue_on_error=args.continue_on_error)
+    except op.IstdError as e:
+        if e.blank:
+            sys.stderr.write("ISTD error encountered on blank in %s: %s\n" % (e.batch, e))
+        else:
+            sys.stderr.write("ISTD error encountered on sample %s in %s: %s\n" % (e.sample_name, e.batch, e))
+        return 2
+    except (IOError, OSError, ValueError, sqlite3.Error) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+
+    sys.stdout.write("%d samples from %d batches written to %s\n" % (rows_written, len(directories), args.output))
+    if cache is not None:
+        sys.stdout.write("Report cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+    if args.continue_on_error:
+        if args.per_batch:
+            return report_failures(os.path.join(args.output, 'batches' + opx.FAILURES_SUFFIX))
+        return report_failures(args.output + opx.FAILURES_SUFFIX)
+    return 0
+
+
+def build_parser():
+    """
+    Builds the command line argument parser
+    :return: argparse.ArgumentParser instance.
+    """
+    parser = argparse.ArgumentParser(
+        prog='org-process-cli',
+        description='Bulk processing of MassHunter analysis reports for TRH analysis.')
+    subparsers = parser.add_subparsers(title='commands', dest='command')
+
+    # Batch parameters shared by the commands. Values that are not given take
+    # the defaults for the analysis type.
+    params = argparse.ArgumentParser(add_help=False)
+    group = params.add_argument_group('analysis parameters')
+    analysis = group.add_mutually_exclusive_group()
+    analysis.add_argument('--c6-c10', dest='analysis_c6_c10', action='store_true',
+                          default=opx.DEF_ANALYSIS_C6_C10, help='TRH C6-C10 analysis')
+    analysis.add_argument('--c10-c40', dest='analysis_c6_c10', action='store_false',
+                          help='TRH >C10-C40 analysis')
+    group.add_argument('--istd-rt', type=float, help='ISTD retention time target')
+    group.add_argument('--istd-rt-tolerance', type=float, help='ISTD retention time tolerance')
+    group.add_argument('--istd-area-target', type=float, help='ISTD area target')
+    group.add_argument('--istd-area-tolerance', type=float, help='ISTD area tolerance')
+    group.add_argument('--istd-concentration', type=float, help='ISTD concentration (ug/L)')
+    group.add_argument('--dilution-factor', type=float, help='Dilution factor')
+    group.add_argument('--calibration-slope', type=float, help='Calibration slope (m)')
+    group.add_argument('--calibration-intercept', type=float, help='Calibration intercept (c)')
+    group.add_argument('--processes', type=int, default=opx.DEF_PARSE_PROCESSES,
+                       help='Worker processes for parsing reports (0 = one per CPU, 1 = serial)')
+    group.add_argument('--cache-dir', help='Parsed report cache directory (default: ~/%s)' % opx.DEF_CACHE_DIRNAME)
+    group.add_argument('--cache-max-mb', type=float, default=opx.DEF_CACHE_MAX_BYTES / (1024 * 1024),
+                       help='Maximum size of the parsed report cache in MB')
+    group.add_argument('--no-cache', action='store_true', help='Parse every report without using the cache')
+    group.add_argument('--vectorised', action='store_true',
+                       help='Calculate samples in blocks with the NumPy engine (requires numpy)')
+
+    run_parser = subparsers.add_parser('run', parents=[params], help='Calculate the results for a directory')
+    run_parser.add_argument('directory', help='Directory containing the blank and sample reports')
+    run_parser.add_argument('output', help='Path of the csv results file')
+    run_parser.add_argument('--resume', action='store_true',
+                            help='Continue an interrupted run after its last completed sample')
+    run_parser.add_argument('--run-report', action='store_true',
+                            help='Write stage timings and per-report counters to <output>%s' % opx.RUN_REPORT_SUFFIX)
+    run_parser.add_argument('--database', help='Also store the results in this SQLite database')
+    run_parser.add_argument('--continue-on-error', action='store_true',
+                            help='Calculate the other samples when a report fails, and list the failures '
+                                 'in <output>%s' % opx.FAILURES_SUFFIX)
+    run_parser.add_argument('--recursive', action='store_true',
+                            help='Include reports in sub-directories of the directory in the batch')
+    run_parser.set_defaults(func=run)
+
+    batch_parser = subparsers.add_parser('batch', parents=[params],
+                                         help='Calculate the results for several batch directories in one run')
+    batch_parser.add_argument('output', help='Path of the combined csv results file, or with --per-batch '
+                                             'the directory for one results file per batch')
+    batch_parser.add_argument('directories', nargs='*', help='Batch directories, each with its own blanks')
+    batch_parser.add_argument('--root', help='Directory containing one sub-directory per batch')
+    batch_parser.add_argument('--per-batch', action='store_true',
+                              help='Write one results file per batch instead of a combined file')
+    batch_parser.add_argument('--resume', action='store_true',
+                              help='Continue an interrupted run after its last completed samples')
+    batch_parser.add_argument('--run-report', action='store_true',
+                              help='Write stage timings and per-report counters to <output>%s' %
+                                   opx.RUN_REPORT_SUFFIX)
+    batch_parser.add_argument('--database', help='Also store the results in this SQLite database')
+    batch_parser.add_argument('--continue-on-error', action='store_true',
+                              help='Calculate the other samples when a report fails, and list the failures '
+                                   'in <output>%s' % opx.FAILURES_SUFFIX)
+    batch_parser.set_defaults(func=batch)
+
+    rerun_parser = subparsers.add_parser('rerun', parents=[params],
+                                         help='Recalculate only the reports listed in a failure manifest')
+    rerun_parser.add_argument('manifest', help='Failure manifest written by run or batch with --continue-on-error')
+    rerun_parser.add_argument('output', help='Path of the csv results file for the recalculated samples')
+    rerun_parser.add_argument('--run-report', action='store_true',
+                              help='Write stage timings and per-report counters to <output>%s' %
+                                   opx.RUN_REPORT_SUFFIX)
+    rerun_parser.add_argument('--database', help='Also store the results in this SQLite database')
+    rerun_parser.set_defaults(func=rerun)
+
+    watch_parser = subparsers.add_parser('watch', parents=[params],
+                                         help='Keep the results for a directory up to date as reports arrive')
+    watch_parser.add_argument('directory', help='Directory the instrument exports reports to')
+    watch_parser.add_argument('output', help='Path of the csv results file')
+    watch_parser.add_argument('--interval', type=float, default=opx.DEF_WATCH_INTERVAL_SECONDS,
+                              help='Seconds between checks of the directory')
+    watch_parser.add_argument('--settle', type=float, default=opx.DEF_WATCH_SETTLE_SECONDS,
+                              help='Seconds a report must be unchanged before it is read')
+    watch_parser.set_defaults(func=watch)
+
+    serve_parser = subparsers.add_parser('serve', parents=[params],
+                                         help='Run a local processing server that keeps batches in memory')
+    serve_parser.add_argument('--port', type=int, default=opx.DEF_SERVER_PORT,
+                              help='Port to listen on at %s' % opx.DEF_SERVER_HOST)
+    serve_parser.add_argument('--root', help='Only accept batch directories inside this directory')
+    serve_parser.set_defaults(func=serve)
+
+    tune_parser = subparsers.add_parser('tune', parents=[params],
+                                        help='Find the tightest ISTD tolerances that give every report one ISTD peak')
+    tune_parser.add_argument('directory', help='Directory containing the blank and sample reports')
+    tune_parser.add_argument('--rt-tolerances', type=float, nargs='+',
+                             help='RT tolerances to search (default: %d steps up to %d times --istd-rt-tolerance)'
+                                  % (opx.DEF_TUNE_GRID_STEPS, opx.DEF_TUNE_TOLERANCE_SCALE))
+    tune_parser.add_argument('--area-tolerances', type=float, nargs='+',
+                             help='Area tolerances to search (default: %d steps up to %d times '
+                                  '--istd-area-tolerance)' % (opx.DEF_TUNE_GRID_STEPS, opx.DEF_TUNE_TOLERANCE_SCALE))
+    tune_parser.add_argument('--json', help='Also write the search results, including the peak count '
+                                            'frontier and each report\'s tightest tolerances, to this JSON file')
+    tune_parser.set_defaults(func=tune)
+
+    whatif_parser = subparsers.add_parser('whatif', parents=[params],
+                                          help='Calculate the results for a directory under several calibrations '
+                                               'at once')
+    whatif_parser.add_argument('directory', help='Directory containing the blank and sample reports')
+    whatif_parser.add_argument('scenarios', help='csv file with a name column and any of the %s columns, one row '
+                                                 'per scenario' % ', '.join(opx.SCENARIO_COLUMNS))
+    whatif_parser.add_argument('output', help='Path of the csv results file')
+    whatif_parser.add_argument('--long', action='store_true',
+                               help='Write one row per scenario and sample instead of one row per sample '
+                                    'with columns for each scenario')
+    whatif_parser.set_defaults(func=whatif)
+
+    archive_parser = subparsers.add_parser('archive', parents=[params],
+                                           help='Add the reports in directories to a peak archive for trend queries')
+    archive_parser.add_argument('archive', help='Peak archive directory, created if it does not exist')
+    archive_parser.add_argument('directories', nargs='+', help='Directories of reports to add')
+    archive_parser.add_argument('--no-recursive', action='store_true',
+                                help='Only add the reports directly in each directory, not in sub-directories')
+    archive_parser.set_defaults(func=archive)
+
+    query_parser = subparsers.add_parser('query', parents=[params],
+                                         help='Print ISTD and fraction areas of archived reports as csv')
+    query_parser.add_argument('archive', help='Peak archive directory')
+    query_parser.add_argument('--since', help='Earliest analysis time, YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+    query_parser.add_argument('--until', help='Latest analysis time, YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+    query_parser.add_argument('--sample-name', help='Only reports for this sample name')
+    kind = query_parser.add_mutually_exclusive_group()
+    kind.add_argument('--blanks', dest='blanks', action='store_true', default=None, help='Only blanks')
+    kind.add_argument('--samples', dest='blanks', action='store_false', help='Only samples')
+    query_parser.add_argument('--concentrations', action='store_true',
+                              help='Also calculate concentrations, blank corrected with the archived blanks '
+                                   'in each report\'s directory')
+    query_parser.add_argument('--above', nargs=2, metavar=('COLUMN', 'VALUE'),
+                              help='Only reports with COLUMN (e.g. area_c34_c40 or conc_c34_c40) above VALUE')
+    query_parser.add_argument('--output', help='Write the csv to this file instead of the screen')
+    query_parser.set_defaults(func=query)
+
+    history_parser = subparsers.add_parser('history', help='Print stored results from a results database as csv')
+    history_parser.add_argument('database', help='SQLite results database')
+    history_parser.add_argument('sample_name', nargs='?', help='Sample name to print results for (default: all)')
+    history_parser.add_argument('--since', help='Earliest analysis time, YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+    history_parser.add_argument('--until', help='Latest analysis time, YYYY-MM-DD or YYYY-MM-DD HH:MM:SS')
+    history_parser.set_defaults(func=history)
+
+    return parser
+
+
+def cache_from_args(args):
+    """
+    Builds the parsed report cache from the parsed arguments
+    :param args: Parsed command line arguments
+    :return: Instance of opcache.ReportCache class, or None if caching is disabled.
+    """
+    if args.no_cache:
+        return None
+    return opcache.ReportCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+
+
+def history(args):
+    """
+    Prints stored results from a results database as csv
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    since = args.since
+    until = args.until
+    if until is not None and len(until) == len('YYYY-MM-DD'):
+        # A date includes every result analysed on that day
+        until += ' 23:59:59'
+    try:
+        store = opdb.ResultStore(args.database)
+        if args.sample_name:
+            results = store.sample_history(args.sample_name, since, until)
+        else:
+            results = store.results_between(since, until)
+        store.close()
+    except (IOError, OSError, ValueError, sqlite3.Error) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+
+    fieldnames = ['sample_name', 'analysis_time', 'reported_analysis_time', 'batch', 'directory'] + \
+        opdb.CONCENTRATION_COLUMNS
+    writer = csv.DictWriter(sys.stdout, fieldnames, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    for result in results:
+        writer.writerow(dict((k, v.encode('utf-8') if isinstance(v, unicode) else v) for k, v in result.items()))
+    return 0
+
+
+def parameters_from_args(args):
+    """
+    Builds the batch parameters from the parsed arguments
+    :param args: Parsed command line arguments
+    :return: Instance of op.BatchParameters class.
+    """
+    return op.BatchParameters(
+        analysis_c6_c10=args.analysis_c6_c10,
+        istd_rt=args.istd_rt,
+        istd_rt_tolerance=args.istd_rt_tolerance,
+        istd_area_target=args.istd_area_target,
+        istd_area_tolerance=args.istd_area_tolerance,
+        istd_concentration=args.istd_concentration,
+        dilution_factor=args.dilution_factor,
+        calibration_slope=args.calibration_slope,
+        calibration_intercept=args.calibration_intercept)
+
+
+def query(args):
+    """
+    Prints internal standard and fraction areas of archived reports as csv
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    # Imported here so numpy is only needed for the archive
+    import oparchive
+
+    until = args.until
+    if until is not None and len(until) == len('YYYY-MM-DD'):
+        # A date includes every report analysed on that day
+        until += ' 23:59:59'
+    parameters = parameters_from_args(args)
+    try:
+        peak_archive = oparchive.PeakArchive(args.archive)
+    except (IOError, ValueError) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    entries = peak_archive.reports(args.since, until, args.sample_name, args.blanks)
+
+    columns = {'istd_area': peak_archive.istd_areas(entries, **parameters.istd_kwargs())}
+    for fraction, areas in peak_archive.fraction_areas(entries, parameters.analysis_c6_c10).items():
+        columns['area_' + fraction] = areas
+    fieldnames = ['istd_area'] + ['area_' + fraction for fraction in op.fraction_names(parameters.analysis_c6_c10)]
+    if args.concentrations:
+        columns.update(peak_archive.concentrations(entries, parameters))
+        fieldnames += [c for c in parameters.fieldnames if c.startswith('conc_')]
+    if args.above:
+        column, value = args.above
+        if column not in columns:
+            sys.stderr.write("--above needs one of the columns %s\n" % ', '.join(fieldnames))
+            return 1
+        # Reports with no value (NaN) are never above
+        keep = [v > float(value) for v in columns[column].tolist()]
+    else:
+        keep = [True] * len(entries)
+
+    out = open(args.output, 'wb') if args.output else sys.stdout
+    try:
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(['file', 'sample_name', 'analysis_time', 'blank'] + fieldnames)
+        for n, entry in enumerate(entries):
+            if not keep[n]:
+                continue
+            row = [entry['file'], entry['sample_name'], entry['analysis_time'], int(entry['blank'])]
+            values = [float(columns[c][n]) for c in fieldnames]
+            row += ['' if v != v else v for v in values]
+            writer.writerow([v.encode('utf-8') if isinstance(v, unicode) else v for v in row])
+    finally:
+        if args.output:
+            out.close()
+    return 0
+
+
+def report_failures(manifest_filepath):
+    """
+    Prints the number of failed reports listed in a failure manifest
+    :param manifest_filepath: Failure manifest written by a run with --continue-on-error
+    :return: Process exit status, 3 if any reports failed.
+    """
+    if not os.path.exists(manifest_filepath):
+        return 0
+    failures = op.read_failure_manifest(manifest_filepath)['failures']
+    sys.stderr.write("%d reports failed and are listed in %s\n" % (len(failures), manifest_filepath))
+    return 3
+
+
+def rerun(args):
+    """
+    Recalculates only the reports listed in a failure manifest
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    parameters = parameters_from_args(args)
+    try:
+        cache = cache_from_args(args)
+        store = store_from_args(args)
+        rows_written = op.rerun_failures(args.manifest, args.output, parameters, args.processes, cache=cache,
+                                         vectorised=args.vectorised, run_report=args.run_report, store=store)
+    except (IOError, OSError, ValueError, sqlite3.Error) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+
+    sys.stdout.write("%d samples written to %s\n" % (rows_written, args.output))
+    if cache is not None:
+        sys.stdout.write("Report cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+    return report_failures(args.output + opx.FAILURES_SUFFIX)
+
+
+def run(args):
+    """
+    Runs a batch calculation for a single directory
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    parameters = parameters_from_args(args)
+    try:
+        cache = cache_from_args(args)
+        store = store_from_args(args)
+        rows_written = op.calculate_batch(args.directory, args.output, parameters, args.processes, cache=cache,
+                                          vectorised=args.vectorised, resume=args.resume,
+                                          run_report=args.run_report, store=store,
+                                          continue_on_error=args.continue_on_error, recursive=args.recursive)
+    except op.IstdError as e:
+        if e.blank:
+            sys.stderr.write("ISTD error encountered on blank: %s\n" % e)
+        else:
+            sys.stderr.write("ISTD error encountered on sample %s: %s\n" % (e.sample_name, e))
+        return 2
+    except (IOError, OSError, ValueError, sqlite3.Error) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+
+    sys.stdout.write("%d samples written to %s\n" % (rows_written, args.output))
+    if cache is not None:
+        sys.stdout.write("Report cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+    if args.continue_on_error:
+        return report_failures(args.output + opx.FAILURES_SUFFIX)
+    return 0
+
+
+def serve(args):
+    """
+    Runs the local processing server until interrupted
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    def log(message):
+        sys.stdout.write("%s %s\n" % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+        sys.stdout.flush()
+
+    try:
+        server = opserver.ProcessingServer(args.port, parameters_from_args(args), args.processes,
+                                           cache_from_args(args), log, args.root)
+    except (OSError, IOError) as e:
+        sys.stderr.write("Could not listen on port %d: %s\n" % (args.port, e))
+        return 1
+    log("Serving on http://%s:%d/, press Ctrl+C to stop" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("Stopped")
+    finally:
+        server.server_close()
+    return 0
+
+
+def store_from_args(args):
+    """
+    Opens the results database from the parsed arguments
+    :param args: Parsed command line arguments
+    :return: Instance of opdb.ResultStore class, or None if no database was given.
+    """
+    if not args.database:
+        return None
+    return opdb.ResultStore(args.database)
+
+
+def tune(args):
+    """
+    Searches for the tightest internal standard tolerances for a directory
+    :param args: Parsed command line arguments
+    :return: Process exit status, 3 if no tolerances searched give every report one peak.
+    """
+    # Imported here so numpy is only needed for tuning
+    import optune
+
+    parameters = parameters_from_args(args)
+    search = optune.search_batch(args.directory, parameters, args.rt_tolerances, args.area_tolerances,
+                                 args.processes, cache_from_args(args))
+    if not search.files:
+        sys.stderr.write("No readable reports found in %s\n" % args.directory)
+        return 1
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(search.as_dict(), f, indent=2, sort_keys=True)
+
+    sys.stdout.write("%d reports searched over %d RT and %d area tolerances\n" %
+                     (len(search.files), len(search.rt_tolerances), len(search.area_tolerances)))
+    for f, reason in search.unreadable:
+        sys.stdout.write("Unreadable: %s (%s)\n" % (f, reason))
+    if parameters.istd_rt_tolerance in search.rt_tolerances and \
+            parameters.istd_area_tolerance in search.area_tolerances:
+        counts = search.peak_counts(parameters.istd_rt_tolerance, parameters.istd_area_tolerance)
+        sys.stdout.write("Current tolerances (RT %g, area %g): %d of %d reports have one ISTD peak\n" %
+                         (parameters.istd_rt_tolerance, parameters.istd_area_tolerance, counts.count(1),
+                          len(counts)))
+
+    tightest = search.tightest()
+    if tightest is not None:
+        sys.stdout.write("Tightest tolerances giving every report one ISTD peak: "
+                         "--istd-rt-tolerance %g --istd-area-tolerance %g\n" % tightest)
+        return 0
+
+    rt_tolerance, area_tolerance, single_count = search.best()
+    sys.stdout.write("No tolerances searched give every report one ISTD peak. Best: --istd-rt-tolerance %g "
+                     "--istd-area-tolerance %g (%d of %d reports)\n" %
+                     (rt_tolerance, area_tolerance, single_count, len(search.files)))
+    sys.stdout.write("Outliers at the best tolerances:\n")
+    for f, count in search.outliers():
+        sys.stdout.write("  %s: %d ISTD peaks\n" % (f, count))
+    return 3
+
+
+def watch(args):
+    """
+    Keeps the results for a directory up to date until interrupted
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    def log(message):
+        sys.stdout.write("%s %s\n" % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+        sys.stdout.flush()
+
+    try:
+        watcher = opwatch.ReportWatcher(args.directory, args.output, parameters_from_args(args), args.processes,
+                                        cache_from_args(args), args.settle, log)
+        log("Watching %s, press Ctrl+C to stop" % args.directory)
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        log("Stopped")
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+    return 0
+
+
+def whatif(args):
+    """
+    Calculates the results for a directory under several calibration scenarios at once
+    :param args: Parsed command line arguments
+    :return: Process exit status.
+    """
+    # Imported here so numpy is only needed for scenarios
+    import opwhatif
+
+    parameters = parameters_from_args(args)
+    try:
+        scenarios = opwhatif.read_scenarios(args.scenarios, parameters)
+        batch = opwhatif.resolve_batch(args.directory, parameters, args.processes, cache_from_args(args))
+    except op.IstdError as e:
+        if e.blank:
+            sys.stderr.write("ISTD error encountered on blank: %s\n" % e)
+        else:
+            sys.stderr.write("ISTD error encountered on sample %s: %s\n" % (e.sample_name, e))
+        return 2
+    except (IOError, ValueError) as e:
+        sys.stderr.write("%s\n" % e)
+        return 1
+
+    if args.long:
+        opwhatif.write_long(args.output, batch, scenarios)
+    else:
+        opwhatif.write_wide(args.output, batch, scenarios)
+    sys.stdout.write("%d samples under %d scenarios written to %s\n" % (len(batch), len(scenarios), args.output))
+    return 0
+
+
+def main(argv=None):
+    """Run the Org-Process command line interface."""
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    # Required for the report parsing pool in a frozen Windows executable
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -11,19 +11,22 @@ Date modified: 24/02/2017
 External dependencies: PyQT4
 
 Classes:
+CalculationWorker: Runs a batch calculation on a background thread.
 MainApp: Constructor for the main application.
 
 Functions:
 Main: Runs the Org-Process application.
 """
 
-import glob
+import multiprocessing
+import os
 import sys
-from pprint import pprint
+import time
 
-from PyQt4 import QtGui
+from PyQt4 import QtCore, QtGui
 
 import op
+import opcache
 import opx
 import opui
 
@@ -33,6 +36,93 @@ __email__ = 'daniel.harris@dpi.nsw.gov.au'
 __version__ = '1.0.1'
 
 
+class CalculationWorker(QtCore.QThread):
+    """
+    Runs a batch calculation on a background thread so the window stays
+    responsive. Results and errors are reported back through signals.
+    """
+    # Reports done, total reports, estimated seconds remaining
+    progress = QtCore.pyqtSignal(int, int, float)
+    # Report cache hits and misses
+    exported = QtCore.pyqtSignal(int, int)
+    # Number of failed reports and the failure manifest listing them
+    exportedWithFailures = QtCore.pyqtSignal(int, str)
+    istdError = QtCore.pyqtSignal(str)
+    error = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, directory, out_filepath, parameters, cache=None, resume=False, continue_on_error=False,
+                 rerun_manifest=None, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.directory = directory
+        self.out_filepath = out_filepath
+        self.parameters = parameters
+        self.cache = cache
+        self.resume = resume
+        self.continue_on_error = continue_on_error
+        # Failure manifest of an earlier run, to recalculate only its failed reports
+        self.rerun_manifest = rerun_manifest
+        self._cancel_requested = False
+        self._start_time = None
+
+    def cancel(self):
+        """Asks the calculation to stop before the next report."""
+        self._cancel_requested = True
+
+    def isCancelRequested(self):
+        return self._cancel_requested
+
+    def reportProgress(self, done, total):
+        elapsed = time.time() - self._start_time
+        eta = elapsed / done * (total - done)
+        self.progress.emit(done, total, eta)
+
+    def run(self):
+        self._start_time = time.time()
+        try:
+            if self.rerun_manifest is not None:
+                op.rerun_failures(
+                    self.rerun_manifest,
+                    self.out_filepath,
+                    self.parameters,
+                    processes=opx.DEF_PARSE_PROCESSES,
+                    progress=self.reportProgress,
+                    cancelled=self.isCancelRequested,
+                    cache=self.cache)
+            else:
+                op.calculate_batch(
+                    self.directory,
+                    self.out_filepath,
+                    self.parameters,
+                    processes=opx.DEF_PARSE_PROCESSES,
+                    progress=self.reportProgress,
+                    cancelled=self.isCancelRequested,
+                    cache=self.cache,
+                    resume=self.resume,
+                    continue_on_error=self.continue_on_error)
+        except op.CalculationCancelled:
+            self.cancelled.emit()
+            return
+        except op.IstdError as e:
+            if e.blank:
+                self.istdError.emit("ISTD error encountered on blank: %s" % e)
+            else:
+                self.istdError.emit("ISTD error encountered on sample %s: %s" % (e.sample_name, e))
+            return
+        except Exception as e:
+            self.error.emit("Calculation failed: %s" % e)
+            return
+
+        manifest_filepath = self.out_filepath + opx.FAILURES_SUFFIX
+        if (self.continue_on_error or self.rerun_manifest is not None) and os.path.exists(manifest_filepath):
+            failures = op.read_failure_manifest(manifest_filepath)['failures']
+            self.exportedWithFailures.emit(len(failures), manifest_filepath)
+        elif self.cache is not None:
+            self.exported.emit(self.cache.hits, self.cache.misses)
+        else:
+            self.exported.emit(0, 0)
+
+
 class MainApp(opui.Ui_MainWindow, QtGui.QMainWindow):
     """
     Constructor for the main application
@@ -55,11 +145,25 @@ class MainApp(opui.Ui_MainWindow, QtGui.QMainWindow):
         self.doubleSpinBoxCalibrationSlope.setValue(opx.DEF_CALIBRATION_SLOPE)
         self.doubleSpinBoxCalibrationIntercept.setValue(opx.DEF_CALIBRATION_INTERCEPT)
 
+        # Add progress display and cancel button for background calculations
+        self.worker = None
+        self.progressBar = QtGui.QProgressBar(self.statusbar)
+        self.progressBar.setVisible(False)
+        self.statusbar.addPermanentWidget(self.progressBar)
+        self.pushButtonCancel = QtGui.QPushButton(self.centralwidget)
+        self.pushButtonCancel.setGeometry(QtCore.QRect(425, 390, 75, 23))
+        self.pushButtonCancel.setText("Cancel")
+        self.pushButtonCancel.setEnabled(False)
+        self.checkBoxContinueOnError = QtGui.QCheckBox(self.centralwidget)
+        self.checkBoxContinueOnError.setGeometry(QtCore.QRect(20, 390, 200, 23))
+        self.checkBoxContinueOnError.setText("Continue past failed reports")
+
         # Connect signals
         self.toolButtonDataDirectory.clicked.connect(self.directoryPicker)
         self.toolButtonResultsFile.clicked.connect(self.filePicker)
         self.radioButtonC6_C10.toggled.connect(self.selectTestType)
         self.pushButtonStart.clicked.connect(self.startCalculation)
+        self.pushButtonCancel.clicked.connect(self.cancelCalculation)
 
 
     def directoryPicker(self):
@@ -102,192 +206,141 @@ class MainApp(opui.Ui_MainWindow, QtGui.QMainWindow):
         dir = str(self.lineEditDataDirectory.text())
         out_filepath = str(self.lineEditResultsFile.text())
 
-        # Make list of all blank files in directory
-        blank_data_list = []
-        blank_pattern = dir + '\*' + opx.BLANK_TAG + '*'
-        blank_file_list = glob.glob(blank_pattern)
-
-        # Select the correct internal standard
-        istd_rt = self.doubleSpinBoxRtTarget.value()
-        istd_rt_tolerance = self.doubleSpinBoxRtTolerance.value()
-        istd_area_target = self.spinBoxAreaTarget.value()
-        istd_area_tolerance = self.spinBoxAreaTolerance.value()
-        istd_concentration = self.doubleSpinBoxConcentration.value()
-        dilution_factor = self.doubleSpinBoxDilutionFactor.value()
-        calibration_slope = self.doubleSpinBoxCalibrationSlope.value()
-        calibration_intercept = self.doubleSpinBoxCalibrationIntercept.value()
-
-        for f in blank_file_list:
-            blank = op.get_data_from_report(f)[2]
-            blank_data_list.append(blank)
+        # Select the correct internal standard and calibration
+        parameters = op.BatchParameters(
+            analysis_c6_c10=self.analysis_c6_c10,
+            istd_rt=self.doubleSpinBoxRtTarget.value(),
+            istd_rt_tolerance=self.doubleSpinBoxRtTolerance.value(),
+            istd_area_target=self.spinBoxAreaTarget.value(),
+            istd_area_tolerance=self.spinBoxAreaTolerance.value(),
+            istd_concentration=self.doubleSpinBoxConcentration.value(),
+            dilution_factor=self.doubleSpinBoxDilutionFactor.value(),
+            calibration_slope=self.doubleSpinBoxCalibrationSlope.value(),
+            calibration_intercept=self.doubleSpinBoxCalibrationIntercept.value())
+
+        # Run the calculation in the background, the worker reports back through signals
+        continue_on_error = self.checkBoxContinueOnError.isChecked()
+        # Offer to recalculate only the reports that failed in the last run of this results file
+        rerun_manifest = None
+        manifest_filepath = out_filepath + opx.FAILURES_SUFFIX
+        if continue_on_error and os.path.exists(manifest_filepath) and \
+                not os.path.exists(out_filepath + opx.JOURNAL_SUFFIX):
+            failure_count = len(op.read_failure_manifest(manifest_filepath)['failures'])
+            base, extension = os.path.splitext(out_filepath)
+            rerun_filepath = base + '_rerun' + extension
+            answer = QtGui.QMessageBox.question(
+                self,
+                "Recalculate failed reports?",
+                "%d reports failed in the last calculation for this results file. Recalculate only those "
+                "reports with the current values? Their results will be written to %s."
+                % (failure_count, rerun_filepath),
+                QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)
+            if answer == QtGui.QMessageBox.Yes:
+                rerun_manifest = manifest_filepath
+                out_filepath = rerun_filepath
+
+        # Offer to pick up an interrupted run of this results file
+        resume = False
+        if rerun_manifest is None and os.path.exists(out_filepath + opx.JOURNAL_SUFFIX):
+            answer = QtGui.QMessageBox.question(
+                self,
+                "Resume calculation?",
+                "The last calculation for this results file did not finish. "
+                "Resume it from the last completed sample?",
+                QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)
+            resume = answer == QtGui.QMessageBox.Yes
+
+        # A fresh cache object per run so the hit and miss counts are for this run only
         try:
-            blank_average = op.BlankAverage(
-                blank_data=blank_data_list,
-                analysis_c6_c10=self.analysis_c6_c10,
-                istd_rt=istd_rt,
-                istd_rt_tolerance=istd_rt_tolerance,
-                istd_area_target=istd_area_target,
-                istd_area_tolerance=istd_area_tolerance)
-        except op.IstdError, e:
-            txt = "ISTD error encountered on blank: %s" %e
-            msg = QtGui.QMessageBox()
-            msg.setIcon(QtGui.QMessageBox.Warning)
-            msg.setText(txt)
-            msg.setWindowTitle("ISTD error encountered!")
-            msg.exec_()
-            return
-
-        # Make exclude list for files that should not be analysed
-        temp_files = glob.glob(dir + '~')
-        excel_files = glob.glob(dir + '*.xls*')
-        exclude_list = [x for x in glob.glob(dir + '\*') if x in temp_files and x not in excel_files]
-        # Make list of all sample files in directory (includes QC)
-        sample_file_list = [x for x in glob.glob(dir + '\*') if x not in blank_file_list and x not in exclude_list]
-
-        # Initialise empty list for storing results
-        result_set = []
-
-        # Iterate through sample files and calculate results
-        for f in sample_file_list:
-            sample_name, analysis_time, peak_data = op.get_data_from_report(f)
-
-            try:
-                # Calculate C6-C10
-                if self.analysis_c6_c10:
-                    blank_average.area = blank_average.area_c6_c10
-                    i_c6 = 0
-                    i_c10 = op.get_fraction_end_index(peak_data, opx.C6_C10_END)
-                    conc_c6_c10 = op.calculate_sample_concentration(
-                        peak_data_list=peak_data,
-                        blank=blank_average,
-                        low_index=i_c6,
-                        high_index=i_c10,
-                        istd_rt=istd_rt,  # USER INPUT
-                        istd_rt_tolerance=istd_rt_tolerance,  # USER INPUT
-                        istd_area_target=istd_area_target,  # USER INPUT
-                        istd_area_tolerance=istd_area_tolerance,  # USER INPUT
-                        calibration_slope=calibration_slope,  # USER INPUT
-                        calibration_intercept=calibration_intercept,  # USER INPUT
-                        istd_concentration=istd_concentration,  # USER INPUT
-                        dilution_factor=dilution_factor)  # USER INPUT
-
-                    result = {
-                        'sample_name': sample_name,
-                        'analysis_time': analysis_time,
-                        'conc_c6_c10': conc_c6_c10
-                    }
-
-                    result_set.append(result)
-
-                # Calculate C10-C16
-                else:
-                    blank_average.area = blank_average.area_c10_c16
-                    i_c10 = op.get_fraction_start_index(peak_data, opx.C10_C16_START)
-                    i_c16 = op.get_fraction_end_index(peak_data, opx.C10_C16_END)
-                    conc_c10_c16 = op.calculate_sample_concentration(
-                        peak_data_list=peak_data,
-                        blank=blank_average,
-                        low_index=i_c10,
-                        high_index=i_c16,
-                        istd_rt=istd_rt,  # USER INPUT
-                        istd_rt_tolerance=istd_rt_tolerance,  # USER INPUT
-                        istd_area_target=istd_area_target,  # USER INPUT
-                        istd_area_tolerance=istd_area_tolerance,  # USER INPUT
-                        calibration_slope=calibration_slope,  # USER INPUT
-                        calibration_intercept=calibration_intercept,  # USER INPUT
-                        istd_concentration=istd_concentration,  # USER INPUT
-                        dilution_factor=dilution_factor)  # USER INPUT
-
-                    # Calculate C16-C34
-                    blank_average.area = blank_average.area_c16_c34
-                    i_c34 = op.get_fraction_end_index(peak_data, opx.C16_C34_END)
-                    conc_c16_c34 = op.calculate_sample_concentration(
-                        peak_data_list=peak_data,
-                        blank=blank_average,
-                        low_index=i_c16,
-                        high_index=i_c34,
-                        istd_rt=istd_rt,  # USER INPUT
-                        istd_rt_tolerance=istd_rt_tolerance,  # USER INPUT
-                        istd_area_target=istd_area_target,  # USER INPUT
-                        istd_area_tolerance=istd_area_tolerance,  # USER INPUT
-                        calibration_slope=calibration_slope,  # USER INPUT
-                        calibration_intercept=calibration_intercept,  # USER INPUT
-                        istd_concentration=istd_concentration,  # USER INPUT
-                        dilution_factor=dilution_factor)  # USER INPUT
-
-                    # Calculate C34-C40
-                    blank_average.area = blank_average.area_c34_c40
-                    i_c40 = op.get_fraction_end_index(peak_data, opx.C34_C40_END)
-                    conc_c34_c40 = op.calculate_sample_concentration(
-                        peak_data_list=peak_data,
-                        blank=blank_average,
-                        low_index=i_c34,
-                        high_index=i_c40,
-                        istd_rt=istd_rt,  # USER INPUT
-                        istd_rt_tolerance=istd_rt_tolerance,  # USER INPUT
-                        istd_area_target=istd_area_target,  # USER INPUT
-                        istd_area_tolerance=istd_area_tolerance,  # USER INPUT
-                        calibration_slope=calibration_slope,  # USER INPUT
-                        calibration_intercept=calibration_intercept,  # USER INPUT
-                        istd_concentration=istd_concentration,  # USER INPUT
-                        dilution_factor=dilution_factor)  # USER INPUT
-
-                    # Calculate C10-C40
-                    blank_average.area = blank_average.area_c10_c40
-                    conc_c10_c40 = op.calculate_sample_concentration(
-                        peak_data_list=peak_data,
-                        blank=blank_average,
-                        low_index=i_c10,
-                        high_index=i_c40,
-                        istd_rt=istd_rt,  # USER INPUT
-                        istd_rt_tolerance=istd_rt_tolerance,  # USER INPUT
-                        istd_area_target=istd_area_target,  # USER INPUT
-                        istd_area_tolerance=istd_area_tolerance,  # USER INPUT
-                        calibration_slope=calibration_slope,  # USER INPUT
-                        calibration_intercept=calibration_intercept,  # USER INPUT
-                        istd_concentration=istd_concentration,  # USER INPUT
-                        dilution_factor=dilution_factor)  # USER INPUT
-
-                    result = {
-                        'sample_name': sample_name,
-                        'analysis_time': analysis_time,
-                        'conc_c10_c16': conc_c10_c16,
-                        'conc_c16_c34': conc_c16_c34,
-                        'conc_c34_c40': conc_c34_c40,
-                        'conc_c10_c40': conc_c10_c40
-                    }
-
-                    result_set.append(result)
-
-            except op.IstdError, e:
-                txt = "ISTD error encountered on sample %s: %s" % (sample_name, e)
-                msg = QtGui.QMessageBox()
-                msg.setIcon(QtGui.QMessageBox.Warning)
-                msg.setText(txt)
-                msg.setWindowTitle("ISTD error encountered!")
-                msg.exec_()
-                return
-
-        # Write the result set to CSV file
-        if self.analysis_c6_c10:
-            fieldnames = opx.FIELDNAMES_C6_C10
-        else:
-            fieldnames = opx.FIELDNAMES_C10_C40
-        export_successful = op.write_to_csv(result_set, out_filepath, fieldnames)
-
-        if export_successful:
-            msg = QtGui.QMessageBox()
-            msg.setIcon(QtGui.QMessageBox.Information)
-            msg.setText("Data exported successfully!")
-            msg.setWindowTitle("Export successful!")
-            msg.exec_()
-
-        # Pretty print results for verification
-        pprint(result_set)
+            cache = opcache.ReportCache()
+        except (IOError, OSError):
+            cache = None
+        self.worker = CalculationWorker(dir, out_filepath, parameters, cache, resume, continue_on_error,
+                                        rerun_manifest, self)
+        self.worker.progress.connect(self.showProgress)
+        self.worker.exported.connect(self.showExported)
+        self.worker.exportedWithFailures.connect(self.showExportedWithFailures)
+        self.worker.istdError.connect(self.showIstdError)
+        self.worker.error.connect(self.showError)
+        self.worker.cancelled.connect(self.showCancelled)
+        self.worker.finished.connect(self.calculationFinished)
+
+        self.pushButtonStart.setEnabled(False)
+        self.pushButtonCancel.setEnabled(True)
+        self.progressBar.setValue(0)
+        self.progressBar.setVisible(True)
+        self.statusbar.showMessage("Starting calculation...")
+        self.worker.start()
+
+    def closeEvent(self, event):
+        # Stop a running calculation before the window goes away
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        QtGui.QMainWindow.closeEvent(self, event)
+
+    def cancelCalculation(self):
+        """Stops the running calculation before the next report."""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.pushButtonCancel.setEnabled(False)
+            self.statusbar.showMessage("Cancelling...")
+
+    def calculationFinished(self):
+        self.worker = None
+        self.pushButtonStart.setEnabled(True)
+        self.pushButtonCancel.setEnabled(False)
+        self.progressBar.setVisible(False)
+
+    def showProgress(self, done, total, eta):
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+        minutes, seconds = divmod(int(round(eta)), 60)
+        self.statusbar.showMessage("Processed %d of %d reports, about %d:%02d remaining" % (done, total, minutes, seconds))
+
+    def showExported(self, cache_hits, cache_misses):
+        self.statusbar.showMessage("Data exported successfully! %d reports read from cache, %d parsed." %
+                                   (cache_hits, cache_misses))
+        msg = QtGui.QMessageBox()
+        msg.setIcon(QtGui.QMessageBox.Information)
+        msg.setText("Data exported successfully!")
+        msg.setWindowTitle("Export successful!")
+        msg.exec_()
+
+    def showExportedWithFailures(self, failure_count, manifest_filepath):
+        self.statusbar.showMessage("Data exported with %d failed reports." % failure_count)
+        msg = QtGui.QMessageBox()
+        msg.setIcon(QtGui.QMessageBox.Warning)
+        msg.setText("Data exported, but %d reports failed. They are listed in %s.\n\n"
+                    "Adjust the values and start again to recalculate only the failed reports."
+                    % (failure_count, manifest_filepath))
+        msg.setWindowTitle("Export completed with failures")
+        msg.exec_()
+
+    def showCancelled(self):
+        self.statusbar.showMessage("Calculation cancelled. Start again to resume from the last completed sample.")
+
+    def showIstdError(self, txt):
+        self.statusbar.clearMessage()
+        msg = QtGui.QMessageBox()
+        msg.setIcon(QtGui.QMessageBox.Warning)
+        msg.setText(txt)
+        msg.setWindowTitle("ISTD error encountered!")
+        msg.exec_()
+
+    def showError(self, txt):
+        self.statusbar.clearMessage()
+        msg = QtGui.QMessageBox()
+        msg.setIcon(QtGui.QMessageBox.Critical)
+        msg.setText(txt)
+        msg.setWindowTitle("Calculation failed!")
+        msg.exec_()
 
 
 def main():
     """Run the org-process app."""
+    # Required for the report parsing pool in the frozen Windows executable
+    multiprocessing.freeze_support()
     app = QtGui.QApplication(sys.argv)
     window = MainApp()
     window.show()
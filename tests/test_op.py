@@ -0,0 +1,546 @@
+"""
+Module: test_op.py
+Tests that PeakTable keeps every peak through each of its conversions, that
+the indexed and streaming calculations in op give the same results as the
+original list calculations, that text reports read the same as Excel reports,
+of report file discovery, and of batch runs that are resumed or continue past
+failed reports, on synthetic reports from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import codecs
+import datetime
+import math
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opcache
+import opx
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 10
+PEAK_COUNT = 300
+# Samples in each batch of the batch run tests
+BATCH_SAMPLE_COUNT = 4
+
+# Directory of the generated reports, each report file and the PeakTable of each report
+directory = None
+report_files = []
+peak_tables = []
+# Analysis type -> PeakTables of the batch generated for it
+batch_tables = {}
+
+
+def setUpModule():
+    global directory
+    directory = tempfile.mkdtemp()
+    for analysis_c6_c10 in (True, False):
+        blank_file_list, sample_file_list = reportgen.generate_batch(
+            os.path.join(directory, str(analysis_c6_c10)), SAMPLE_COUNT, PEAK_COUNT, analysis_c6_c10=analysis_c6_c10)
+        report_files.extend(blank_file_list + sample_file_list)
+        batch_tables[analysis_c6_c10] = [op.get_data_from_report(f)[2] for f in blank_file_list + sample_file_list]
+        peak_tables.extend(batch_tables[analysis_c6_c10])
+
+
+def tearDownModule():
+    shutil.rmtree(directory)
+
+
+class BlankAverageTest(unittest.TestCase):
+
+    def test_running_statistics_match_two_pass(self):
+        for analysis_c6_c10, tables in batch_tables.items():
+            istd_kwargs = op.BatchParameters(analysis_c6_c10).istd_kwargs()
+            # Every report of the batch has an internal standard, so each is used as a blank
+            blank_average = op.BlankAverage(None, analysis_c6_c10, **istd_kwargs)
+            values = dict((name, []) for name in ['istd'] + op.fraction_names(analysis_c6_c10))
+            for table in tables:
+                blank_average.add(table)
+                values['istd'].append(op.get_istd_area(list(table), **istd_kwargs))
+                for fraction, area in op.get_fraction_areas(list(table), analysis_c6_c10).items():
+                    values[fraction].append(area)
+
+            self.assertEqual(blank_average.count, len(tables))
+            # Averages are the same running sum as mean()
+            self.assertEqual(blank_average.istd, op.mean(values['istd']))
+            spread = blank_average.spread()
+            for name, name_values in values.items():
+                if name != 'istd':
+                    self.assertEqual(getattr(blank_average, 'area_' + name), op.mean(name_values))
+                average = op.mean(name_values)
+                stdev = math.sqrt(sum((v - average) ** 2 for v in name_values) / (len(name_values) - 1))
+                self.assertEqual(spread[name]['mean'], average)
+                self.assertAlmostEqual(spread[name]['stdev'], stdev, delta=stdev * 1e-9)
+                self.assertAlmostEqual(spread[name]['rsd_percent'], 100 * stdev / average, delta=1e-9)
+                self.assertEqual(spread[name]['min'], min(name_values))
+                self.assertEqual(spread[name]['max'], max(name_values))
+
+    def test_single_blank_has_no_stdev(self):
+        table = batch_tables[False][0]
+        blank_average = op.BlankAverage([table], False, **op.BatchParameters(False).istd_kwargs())
+        for name, spread in blank_average.spread().items():
+            self.assertIsNone(spread['stdev'], name)
+            self.assertIsNone(spread['rsd_percent'], name)
+            self.assertEqual(spread['min'], spread['max'])
+
+
+class BisectionTest(unittest.TestCase):
+
+    def test_fraction_indices_match_linear_scan(self):
+        for table in peak_tables:
+            peaks = list(table)
+            # Every start and end value, so equal differences are included, and targets outside the peaks
+            rts = sorted(set(table.start) | set(table.end) | {0.0, opx.C6_C10_END, opx.C10_C16_START,
+                                                                opx.C10_C16_END, opx.C16_C34_END, 1000.0})
+            for rt in rts:
+                self.assertEqual(op.get_fraction_start_index(table, rt), op.get_fraction_start_index(peaks, rt))
+                self.assertEqual(_call(op.get_fraction_end_index, table, rt),
+                                 _call(op.get_fraction_end_index, peaks, rt))
+
+    def test_istd_area_matches_linear_scan(self):
+        for table in peak_tables:
+            peaks = list(table)
+            for analysis_c6_c10 in (True, False):
+                defaults = op.BatchParameters(analysis_c6_c10).istd_kwargs()
+                # Wider windows have several candidates, and the closest retention time is chosen
+                for scale in (0.5, 1, 10, 100):
+                    istd_kwargs = dict(defaults, istd_rt_tolerance=defaults['istd_rt_tolerance'] * scale,
+                                       istd_area_tolerance=defaults['istd_area_tolerance'] * scale)
+                    self.assertEqual(_call(op.get_istd_area, table, **istd_kwargs),
+                                     _call(op.get_istd_area, peaks, **istd_kwargs))
+
+
+class CalculateBatchesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Two batches with the same folder name, so the second batch's name has a suffix
+        self.batch_directories = [os.path.join(self.directory, name, 'batch') for name in ('A', 'B')]
+        for seed, batch_directory in enumerate(self.batch_directories):
+            reportgen.generate_batch(batch_directory, BATCH_SAMPLE_COUNT + seed, 100, seed=seed)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        # Results of a separate calculate_batch run for each batch
+        self.expected = []
+        for n, batch_directory in enumerate(self.batch_directories):
+            out_filepath = os.path.join(self.directory, 'expected%d.csv' % n)
+            op.calculate_batch(batch_directory, out_filepath, self.parameters, processes=1)
+            with open(out_filepath, 'rb') as f:
+                self.expected.append(f.read())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_combined_matches_calculate_batch(self):
+        expected = []
+        for n in range(len(self.batch_directories)):
+            expected.extend(op._read_results(os.path.join(self.directory, 'expected%d.csv' % n)))
+        # The pool of two processes parses the second batch while the first is calculated
+        for processes, vectorised in ((1, False), (2, False), (1, True)):
+            out_filepath = os.path.join(self.directory, 'results.csv')
+            self.assertEqual(op.calculate_batches(self.batch_directories, out_filepath, self.parameters,
+                                                  processes=processes, vectorised=vectorised),
+                             2 * BATCH_SAMPLE_COUNT + 1)
+            results = op._read_results(out_filepath)
+            self.assertEqual([r.pop('batch') for r in results],
+                             ['batch'] * BATCH_SAMPLE_COUNT + ['batch_2'] * (BATCH_SAMPLE_COUNT + 1))
+            self.assertEqual(results, expected)
+
+    def test_per_batch_matches_calculate_batch(self):
+        out_path = os.path.join(self.directory, 'results')
+        self.assertEqual(op.calculate_batches(self.batch_directories, out_path, self.parameters, processes=2,
+                                              per_batch=True), 2 * BATCH_SAMPLE_COUNT + 1)
+        for name, expected in zip(('batch', 'batch_2'), self.expected):
+            with open(os.path.join(out_path, name + '.csv'), 'rb') as f:
+                self.assertEqual(f.read(), expected)
+
+
+class CsvResultWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directory = os.path.join(self.directory, 'batch')
+        reportgen.generate_batch(self.batch_directory, BATCH_SAMPLE_COUNT, 100)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        self.out_filepath = os.path.join(self.directory, 'results.csv')
+        # Results of an uninterrupted run
+        expected_filepath = os.path.join(self.directory, 'expected.csv')
+        op.calculate_batch(self.batch_directory, expected_filepath, self.parameters, processes=1)
+        with open(expected_filepath, 'rb') as f:
+            self.expected = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume_after_cancel(self):
+        # The vectorised engine writes its block of samples together, so none are written before the cancel
+        for vectorised, rows_written in ((False, 2), (True, 0)):
+            # Cancelled after the blanks and two samples
+            done = [0]
+            self.assertRaises(op.CalculationCancelled, op.calculate_batch, self.batch_directory,
+                              self.out_filepath, self.parameters, processes=1, vectorised=vectorised,
+                              progress=lambda n, total: done.__setitem__(0, n), cancelled=lambda: done[0] == 5)
+            with open(self.out_filepath + opx.JOURNAL_SUFFIX, 'rb') as f:
+                self.assertEqual(len(f.readlines()), 1 + rows_written)
+            # A row and journal entry partly written when the run died
+            with open(self.out_filepath, 'ab') as f:
+                f.write(b'S0003,2017-02-24 1')
+            with open(self.out_filepath + opx.JOURNAL_SUFFIX, 'ab') as f:
+                f.write(b'{"file": ')
+
+            self.assertEqual(op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters,
+                                                processes=1, vectorised=vectorised, resume=True),
+                             BATCH_SAMPLE_COUNT - rows_written)
+            self._check_results()
+
+    def test_resume_without_journal(self):
+        # The journal of a completed run is removed, so the file is written again in full
+        op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters, processes=1)
+        self.assertFalse(os.path.exists(self.out_filepath + opx.JOURNAL_SUFFIX))
+        self.assertEqual(op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters,
+                                            processes=1, resume=True), BATCH_SAMPLE_COUNT)
+        self._check_results()
+
+    def test_resume_with_truncated_journal(self):
+        # Stopped while the journal header was written
+        with open(self.out_filepath, 'wb') as f:
+            f.write(b'sample_name,analysis_')
+        with open(self.out_filepath + opx.JOURNAL_SUFFIX, 'wb') as f:
+            f.write(b'{"fieldnames": ["sample_name"')
+        self.assertEqual(op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters,
+                                            processes=1, resume=True), BATCH_SAMPLE_COUNT)
+        self._check_results()
+
+    def test_resume_with_different_settings(self):
+        self.assertRaises(op.CalculationCancelled, op.calculate_batch, self.batch_directory, self.out_filepath,
+                          self.parameters, processes=1, cancelled=lambda: True)
+        with self.assertRaises(ValueError) as context:
+            op.calculate_batch(self.batch_directory, self.out_filepath,
+                               op.BatchParameters(analysis_c6_c10=False, dilution_factor=3), processes=1,
+                               resume=True)
+        self.assertIn("different settings", str(context.exception))
+
+    def _check_results(self):
+        """Checks that the results file is the same as an uninterrupted run's and the journal is removed."""
+        with open(self.out_filepath, 'rb') as f:
+            self.assertEqual(f.read(), self.expected)
+        self.assertFalse(os.path.exists(self.out_filepath + opx.JOURNAL_SUFFIX))
+
+
+class FailureManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directory = os.path.join(self.directory, 'batch')
+        reportgen.generate_batch(self.batch_directory, BATCH_SAMPLE_COUNT, 100)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        self.out_filepath = os.path.join(self.directory, 'results.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sample_failures_serial(self):
+        self._check_sample_failures(vectorised=False)
+
+    def test_sample_failures_vectorised(self):
+        # The truncated sample fails its block, which is then calculated one sample at a time
+        self._check_sample_failures(vectorised=True)
+
+    def test_blank_failure(self):
+        truncated = self._write_truncated_report('BLK9', blank=True)
+        op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters, processes=1,
+                           continue_on_error=True)
+        self.assertEqual(op._read_results(self.out_filepath), [])
+        failures = op.read_failure_manifest(self.out_filepath + opx.FAILURES_SUFFIX)['failures']
+        # The blank comes first, then every sample of its batch
+        self.assertEqual([(f['file'], f['blank'], f['reason']) for f in failures[:1]],
+                         [(truncated, True, 'fraction_boundary')])
+        self.assertEqual([(f['blank'], f['reason']) for f in failures[1:]],
+                         [(False, 'blank_average')] * BATCH_SAMPLE_COUNT)
+        self.assertEqual(failures[1]['error'], "No blank average, 1 of 4 blanks failed.")
+
+    def test_rerun_failures(self):
+        truncated = self._write_truncated_report('S9999')
+        unreadable = self._write_unreadable_report('S9998')
+        op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters, processes=1,
+                           continue_on_error=True)
+
+        # Only the failed samples are recalculated, and the one that still fails is listed again
+        reportgen.write_report(truncated, 'S9999', datetime.datetime(2017, 2, 24, 10, 0), 100, seed='truncated')
+        rerun_filepath = os.path.join(self.directory, 'rerun.csv')
+        self.assertEqual(op.rerun_failures(self.out_filepath + opx.FAILURES_SUFFIX, rerun_filepath,
+                                           self.parameters, processes=1), 1)
+        failures = op.read_failure_manifest(rerun_filepath + opx.FAILURES_SUFFIX)['failures']
+        self.assertEqual([(f['file'], f['reason']) for f in failures], [(unreadable, 'unreadable')])
+
+        # The rerun result is the same as a full run's
+        full_filepath = os.path.join(self.directory, 'full.csv')
+        op.calculate_batch(self.batch_directory, full_filepath, self.parameters, processes=1,
+                           continue_on_error=True)
+        full_results = dict((r['sample_name'], r) for r in op._read_results(full_filepath))
+        self.assertEqual(op._read_results(rerun_filepath), [full_results['S9999']])
+
+    def _check_sample_failures(self, vectorised):
+        truncated = self._write_truncated_report('S9999')
+        unreadable = self._write_unreadable_report('S9998')
+        self.assertEqual(op.calculate_batch(self.batch_directory, self.out_filepath, self.parameters, processes=1,
+                                            vectorised=vectorised, continue_on_error=True), BATCH_SAMPLE_COUNT)
+        manifest = op.read_failure_manifest(self.out_filepath + opx.FAILURES_SUFFIX)
+        self.assertEqual(manifest['run']['directory'], os.path.abspath(self.batch_directory))
+        self.assertEqual([(f['file'], f['blank'], f['sample_name'], f['reason'], f['batch'])
+                          for f in manifest['failures']],
+                         [(unreadable, False, None, 'unreadable', None),
+                          (truncated, False, 'S9999', 'fraction_boundary', None)])
+        self.assertIn("32.8", manifest['failures'][1]['error'])
+
+        # Without continue_on_error the run stops at the first failure
+        os.remove(unreadable)
+        self.assertRaises(ValueError, op.calculate_batch, self.batch_directory, self.out_filepath,
+                          self.parameters, processes=1, vectorised=vectorised)
+
+    def _write_truncated_report(self, sample_name, blank=False):
+        """Writes a report that ends before the C34-C40 boundary, so its fraction areas cannot be found."""
+        file = os.path.join(self.batch_directory, 'Report_%s.xls' % sample_name)
+        reportgen.write_report(file, sample_name, datetime.datetime(2017, 2, 24, 10, 0), 100, blank=blank,
+                               seed='truncated', max_rt=31.5)
+        return file
+
+    def _write_unreadable_report(self, sample_name):
+        """Writes a report file that is not a workbook."""
+        file = os.path.join(self.batch_directory, 'Report_%s.xls' % sample_name)
+        with open(file, 'w') as f:
+            f.write('not a workbook')
+        return file
+
+
+class PeakTableTest(unittest.TestCase):
+
+    def test_list_round_trip(self):
+        for table in peak_tables:
+            peaks = list(table)
+            self._check_same_table(op.PeakTable(peaks), table)
+            self.assertEqual(list(op.PeakTable(peaks)), peaks)
+            self.assertEqual([table[i] for i in range(len(table))], peaks)
+
+    def test_columns_round_trip(self):
+        for table in peak_tables:
+            self._check_same_table(op.PeakTable.from_columns(*table.columns), table)
+            for low_index, high_index in [(0, 10), (-10, None), (5, 5), (PEAK_COUNT // 2, PEAK_COUNT + 5)]:
+                self.assertEqual(list(table[low_index:high_index]), list(table)[low_index:high_index])
+
+    def test_pickle_round_trip(self):
+        for table in peak_tables:
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                self._check_same_table(pickle.loads(pickle.dumps(table, protocol)), table)
+
+    def test_cache_round_trip(self):
+        cache = opcache.ReportCache(os.path.join(directory, 'cache'))
+        for f in report_files:
+            report_data = op.get_data_from_report(f)
+            cache.put(f, report_data)
+            cached = cache.get(f)
+            self.assertEqual(cached[:2], report_data[:2])
+            self._check_same_table(cached[2], report_data[2])
+
+    def _check_same_table(self, table, expected):
+        """Checks that the columns and every index of two tables are equal."""
+        self.assertIsInstance(table, op.PeakTable)
+        self.assertEqual(table, expected)
+        for name in op.PeakTable.__slots__:
+            self.assertEqual(list(getattr(table, name)), list(getattr(expected, name)), name)
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directories = [os.path.join(self.directory, name) for name in ('A', 'B')]
+        for seed, batch_directory in enumerate(self.batch_directories):
+            reportgen.generate_batch(batch_directory, BATCH_SAMPLE_COUNT, 100, seed=seed)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_calculate_batches(self):
+        expected_filepath = os.path.join(self.directory, 'expected.csv')
+        op.calculate_batches(self.batch_directories, expected_filepath, self.parameters, processes=1)
+
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        names = op.batch_names(self.batch_directories)
+        writer = op.CsvResultWriter(out_filepath, ['batch'] + self.parameters.fieldnames)
+
+        def write(batch_number, f, result):
+            result['batch'] = names[batch_number]
+            writer.write(f, result)
+
+        self.assertEqual(op.run_pipeline(self.batch_directories, self.parameters, write, processes=1),
+                         2 * BATCH_SAMPLE_COUNT)
+        writer.close()
+        with open(out_filepath, 'rb') as f, open(expected_filepath, 'rb') as expected:
+            self.assertEqual(f.read(), expected.read())
+
+    def test_stages(self):
+        # Order of the directories taken by the discover stage and the results written
+        events = []
+
+        def directories():
+            for batch_directory in self.batch_directories:
+                events.append(('scan', batch_directory))
+                yield batch_directory
+
+        def drop_first(results):
+            for batch_number, f, result in results:
+                if not f.endswith('S0000.xls'):
+                    yield batch_number, f, result
+
+        def write(batch_number, f, result):
+            events.append(('write', batch_number, os.path.basename(f)))
+
+        self.assertEqual(op.run_pipeline(directories(), self.parameters, write, stages=[drop_first], processes=1),
+                         2 * (BATCH_SAMPLE_COUNT - 1))
+        # Every directory is scanned before the first result, as documented by iter_batch_results
+        self.assertEqual(events[:2], [('scan', d) for d in self.batch_directories])
+        self.assertEqual(events[2:], [('write', n, 'Report_S%04d.xls' % i)
+                                      for n in range(2) for i in range(1, BATCH_SAMPLE_COUNT)])
+
+
+class ScanReportFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Only the names are classified, so the files are left empty
+        for name in ['Report_BLK1.xls', 'report_blk2.XLS', 'Report_S0001.xls', 'QC_1.csv',
+                     '~$Report_S0001.xls', '~$Report_BLK1.xls', '.~lock.Report_S0001.xls#', '.hidden', 'Thumbs.db',
+                     'desktop.ini', 'results.csv', 'results.csv' + opx.JOURNAL_SUFFIX,
+                     'results.csv' + opx.RUN_REPORT_SUFFIX, 'results.csv' + opx.FAILURES_SUFFIX, 'tmpab12.tmp',
+                     os.path.join('sub', 'Report_BLK3.xls'), os.path.join('sub', 'Report_S0002.xls'),
+                     os.path.join('sub', '~$Report_S0002.xls'), os.path.join('sub', 'deeper', 'Report_S0003.xls'),
+                     os.path.join('.git', 'Report_S0004.xls')]:
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_classification(self):
+        # The results file is excluded however its path is written
+        results_filepath = os.path.join(self.directory, 'sub', '..', 'results.csv')
+        blank_file_list, sample_file_list, ignored_file_list = op.scan_report_files(self.directory,
+                                                                                    exclude=[results_filepath])
+        self.assertEqual(blank_file_list, self._paths('Report_BLK1.xls', 'report_blk2.XLS'))
+        self.assertEqual(sample_file_list, self._paths('QC_1.csv', 'Report_S0001.xls'))
+        self.assertEqual(ignored_file_list, self._paths(
+            '.hidden', '.~lock.Report_S0001.xls#', 'Thumbs.db', 'desktop.ini', 'results.csv',
+            'results.csv' + opx.FAILURES_SUFFIX, 'results.csv' + opx.JOURNAL_SUFFIX,
+            'results.csv' + opx.RUN_REPORT_SUFFIX, 'tmpab12.tmp', '~$Report_BLK1.xls', '~$Report_S0001.xls'))
+        self.assertEqual(op.find_report_files(self.directory, exclude=[results_filepath]),
+                         (blank_file_list, sample_file_list))
+
+        # Without the exclusion the results file is a sample
+        self.assertIn(os.path.join(self.directory, 'results.csv'), op.scan_report_files(self.directory)[1])
+
+    def test_recursive(self):
+        blank_file_list, sample_file_list, ignored_file_list = op.scan_report_files(
+            self.directory, recursive=True, exclude=[os.path.join(self.directory, 'results.csv')])
+        # Files in hidden directories are not listed at all
+        self.assertEqual(blank_file_list, self._paths('Report_BLK1.xls', 'report_blk2.XLS',
+                                                      os.path.join('sub', 'Report_BLK3.xls')))
+        self.assertEqual(sample_file_list, self._paths('QC_1.csv', 'Report_S0001.xls',
+                                                       os.path.join('sub', 'Report_S0002.xls'),
+                                                       os.path.join('sub', 'deeper', 'Report_S0003.xls')))
+        self.assertIn(os.path.join(self.directory, 'sub', '~$Report_S0002.xls'), ignored_file_list)
+        self.assertEqual(len(ignored_file_list), 12)
+
+    def _paths(self, *names):
+        """Gets the sorted paths of files in the test directory."""
+        return sorted(os.path.join(self.directory, name) for name in names)
+
+
+class SumAreasTest(unittest.TestCase):
+
+    def test_cumulative_sum_matches_slice_sum(self):
+        for table in peak_tables:
+            peaks = list(table)
+            # Bounds are list slice bounds, so include negative and out of range indices
+            bounds = [-PEAK_COUNT - 1, -5, 0, 1, 2, PEAK_COUNT // 3, PEAK_COUNT // 2, PEAK_COUNT - 1, PEAK_COUNT,
+                      PEAK_COUNT + 5]
+            # Rounding error stated by op.sum_areas
+            tolerance = len(peaks) * 2 ** -52 * sum(p[opx.PEAK_LS_AREA] for p in peaks)
+            for low_index in bounds:
+                for high_index in bounds:
+                    self.assertAlmostEqual(op.sum_areas(table, low_index, high_index),
+                                           op.sum_areas(peaks, low_index, high_index), delta=tolerance)
+
+
+class TextReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_excel_report(self):
+        # The same seed gives the same reports whatever the extension
+        excel_files = reportgen.generate_batch(os.path.join(self.directory, 'xls'), BATCH_SAMPLE_COUNT, 100)
+        expected = self._calculate_batch('xls')
+        for extension in sorted(opx.TEXT_REPORT_DELIMITERS):
+            text_files = reportgen.generate_batch(os.path.join(self.directory, extension[1:]), BATCH_SAMPLE_COUNT,
+                                                  100, extension=extension)
+            for excel_file, text_file in zip(sum(excel_files, []), sum(text_files, [])):
+                self.assertEqual(op.get_data_from_report(text_file), op.get_data_from_report(excel_file))
+            self.assertEqual(self._calculate_batch(extension[1:]), expected, extension)
+
+    def test_byte_order_mark(self):
+        # Excel adds a byte order mark to a csv file saved as UTF-8
+        excel_file = os.path.join(self.directory, 'Report_S0000.xls')
+        text_file = os.path.join(self.directory, 'Report_S0000.csv')
+        for f in (excel_file, text_file):
+            reportgen.write_report(f, 'S0000', datetime.datetime(2017, 2, 24, 10, 0), 100, seed='bom')
+        with open(text_file, 'rb') as f:
+            data = f.read()
+        with open(text_file, 'wb') as f:
+            f.write(codecs.BOM_UTF8 + data)
+        self.assertEqual(op.get_data_from_report(text_file), op.get_data_from_report(excel_file))
+
+    def _calculate_batch(self, name):
+        """Calculates the batch in the named sub-directory, giving the bytes of its results file."""
+        out_filepath = os.path.join(self.directory, name + '.results')
+        op.calculate_batch(os.path.join(self.directory, name), out_filepath, self.parameters, processes=1)
+        with open(out_filepath, 'rb') as f:
+            return f.read()
+
+
+def _call(function, *args, **kwargs):
+    """Calls a function, returning the type and message of any error it raises instead of a value."""
+    try:
+        return function(*args, **kwargs)
+    except (ValueError, op.IstdError) as e:
+        return type(e), str(e)
+
+
+if __name__ == '__main__':
+    unittest.main()
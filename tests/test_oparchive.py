@@ -0,0 +1,168 @@
+"""
+Module: test_oparchive.py
+Tests that the peak archive in oparchive gives back every archived report's
+peaks and the same values as a normal run, on synthetic batches from
+benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import oparchive
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+BLANK_COUNT = 3
+SAMPLE_COUNT = 4
+
+
+class PeakArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.reports_directory = os.path.join(self.directory, 'reports')
+        self.batch_directories = [os.path.join(self.reports_directory, name) for name in ('A', 'B')]
+        self.file_list = []
+        for seed, batch_directory in enumerate(self.batch_directories):
+            blank_file_list, sample_file_list = reportgen.generate_batch(batch_directory, SAMPLE_COUNT, 100,
+                                                                         BLANK_COUNT, seed=seed)
+            self.file_list.extend(blank_file_list + sample_file_list)
+        self.archive_directory = os.path.join(self.directory, 'archive')
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        archive = oparchive.PeakArchive(self.archive_directory)
+        self.assertEqual(archive.add_directory(self.reports_directory, processes=1),
+                         (len(self.file_list), 0, []))
+
+        # Read back after the archive is opened again
+        archive = oparchive.PeakArchive(self.archive_directory)
+        self.assertEqual(len(archive), len(self.file_list))
+        self._check_peaks(archive)
+        self.assertEqual(archive.add_directory(self.reports_directory, processes=1), (0, len(self.file_list), []))
+
+    def test_changed_report(self):
+        archive = oparchive.PeakArchive(self.archive_directory)
+        archive.add_directory(self.reports_directory, processes=1)
+        f = self.file_list[BLANK_COUNT]
+        reportgen.write_report(f, 'changed', datetime.datetime(2017, 2, 24, 10, 0), 120, seed='changed')
+        stat = os.stat(f)
+        os.utime(f, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertEqual(archive.add_directory(self.reports_directory, processes=1),
+                         (1, len(self.file_list) - 1, []))
+        # Only the latest version of the report is used
+        archive = oparchive.PeakArchive(self.archive_directory)
+        self.assertEqual(len(archive), len(self.file_list))
+        self.assertEqual([entry['peaks'] for entry in archive.reports(sample_name='changed')], [120])
+        self._check_peaks(archive)
+
+    def test_interrupted_append(self):
+        archive = oparchive.PeakArchive(self.archive_directory)
+        archive.add_reports(self.file_list[:2], processes=1)
+        # Peaks and a partial index line written by an append that did not finish
+        for name, _ in oparchive.COLUMNS:
+            with open(os.path.join(self.archive_directory, name + '.bin'), 'ab') as f:
+                f.write(b'\0' * 80)
+        with open(os.path.join(self.archive_directory, oparchive.INDEX_FILENAME), 'ab') as f:
+            f.write(b'{"file": ')
+
+        archive = oparchive.PeakArchive(self.archive_directory)
+        self.assertEqual(len(archive), 2)
+        self.assertEqual(archive.add_reports(self.file_list, processes=1), (len(self.file_list) - 2, 2, []))
+        self._check_peaks(oparchive.PeakArchive(self.archive_directory))
+
+    def test_unreadable_report(self):
+        unreadable = os.path.join(self.batch_directories[0], 'Report_S9998.xls')
+        with open(unreadable, 'w') as f:
+            f.write('not a workbook')
+        archive = oparchive.PeakArchive(self.archive_directory)
+        added, archived, failed = archive.add_directory(self.reports_directory, processes=1)
+        self.assertEqual((added, archived, [f for f, _ in failed]), (len(self.file_list), 0, [unreadable]))
+        self._check_peaks(archive)
+
+    def test_queries_match_calculate_batch(self):
+        # Ends before the C34-C40 boundary, so it has no fraction areas
+        truncated = os.path.join(self.batch_directories[1], 'Report_S9999.xls')
+        reportgen.write_report(truncated, 'S9999', datetime.datetime(2017, 2, 24, 11, 0), 100, seed='truncated',
+                               max_rt=31.5)
+        archive = oparchive.PeakArchive(self.archive_directory)
+        archive.add_directory(self.reports_directory, processes=1)
+
+        entries = archive.reports()
+        self.assertEqual(len(entries), len(self.file_list) + 1)
+        istd_areas = archive.istd_areas(entries, **self.parameters.istd_kwargs())
+        self.assertEqual(istd_areas.tolist(), [op.get_istd_area(op.get_data_from_report(entry['file'])[2],
+                                                                **self.parameters.istd_kwargs())
+                                               for entry in entries])
+
+        for batch_directory in self.batch_directories:
+            samples = archive.reports(blank=False, directory=batch_directory)
+            concentrations = archive.concentrations(samples, self.parameters)
+            out_filepath = os.path.join(self.directory, 'results.csv')
+            op.calculate_batch(batch_directory, out_filepath, self.parameters, processes=1,
+                               continue_on_error=True)
+            expected = dict((r['sample_name'], r) for r in op._read_results(out_filepath))
+            for n, entry in enumerate(samples):
+                for fieldname, values in concentrations.items():
+                    if entry['file'] == truncated:
+                        self.assertTrue(math.isnan(values[n]), fieldname)
+                    else:
+                        self.assertEqual(values[n], float(expected[entry['sample_name']][fieldname]), fieldname)
+
+    def test_reports(self):
+        archive = oparchive.PeakArchive(self.archive_directory)
+        archive.add_directory(self.reports_directory, processes=1)
+        self.assertEqual([entry['file'] for entry in archive.reports(sample_name='s0001')],
+                         [os.path.join(d, 'Report_S0001.xls') for d in self.batch_directories])
+        self.assertEqual(len(archive.reports(blank=True)), 2 * BLANK_COUNT)
+        self.assertEqual(len(archive.reports(directory=self.batch_directories[0])), BLANK_COUNT + SAMPLE_COUNT)
+        # Each batch's reports are a minute apart from 9:00, so two of each are in the period
+        period = archive.reports(start=datetime.datetime(2017, 2, 24, 9, 0), end='2017-02-24 09:01:00')
+        self.assertEqual([entry['sample_name'] for entry in period], ['BLK0', 'BLK0', 'BLK1', 'BLK1'])
+
+    def test_version(self):
+        oparchive.PeakArchive(self.archive_directory)
+        with open(os.path.join(self.archive_directory, oparchive.VERSION_FILENAME), 'w') as f:
+            json.dump({'version': oparchive.ARCHIVE_VERSION + 1}, f)
+        self.assertRaises(ValueError, oparchive.PeakArchive, self.archive_directory)
+
+    def _check_peaks(self, archive):
+        """Checks that every report's archived peaks and metadata are the same as the report's."""
+        entries = dict((entry['file'], entry) for entry in archive.reports())
+        self.assertEqual(sorted(entries), sorted(self.file_list))
+        for f in self.file_list:
+            sample_name, analysis_time, peak_data = op.get_data_from_report(f)
+            entry = entries[f]
+            self.assertEqual((entry['sample_name'], entry['analysis_time'], entry['blank']),
+                             (sample_name, analysis_time, op.is_blank_report(f)))
+            self.assertEqual(archive.peaks(entry), peak_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
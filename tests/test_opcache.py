@@ -0,0 +1,120 @@
+"""
+Module: test_opcache.py
+Tests that the report cache in opcache parses a changed report again and keeps
+within its size bound, on synthetic reports from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opcache
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 4
+
+
+class ReportCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.blank_file_list, self.sample_file_list = reportgen.generate_batch(
+            os.path.join(self.directory, 'batch'), SAMPLE_COUNT, 100)
+        self.cache_directory = os.path.join(self.directory, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_changed_report_is_parsed_again(self):
+        cache = opcache.ReportCache(self.cache_directory)
+        f = self.sample_file_list[0]
+        cache.put(f, op.get_data_from_report(f))
+        self.assertEqual(cache.missing(self.sample_file_list), self.sample_file_list[1:])
+
+        self._change_report(f)
+        self.assertFalse(cache.contains(f))
+        self.assertIsNone(cache.get(f))
+        # Read through iter_data_from_reports, the new version is parsed and cached
+        report_data = list(op.iter_data_from_reports([f], processes=1, cache=cache))[0]
+        self.assertEqual(report_data[0], 'changed')
+        self.assertEqual(cache.get(f)[0], 'changed')
+
+    def test_report_changed_while_read(self):
+        cache = opcache.ReportCache(self.cache_directory)
+        f = self.sample_file_list[0]
+        key = cache.key(f)
+        report_data = op.get_data_from_report(f)
+        self._change_report(f)
+
+        # Stored under the version that was read, so the changed report is not served from it
+        cache.put(f, report_data, key)
+        self.assertIsNone(cache.get(f))
+        self.assertEqual(cache.get(f, key)[0], report_data[0])
+
+    def test_eviction(self):
+        file_list = self.blank_file_list + self.sample_file_list
+        entry_size = self._entry_size(file_list[0])
+        # Room for about two entries
+        cache = opcache.ReportCache(self.cache_directory, max_bytes=int(entry_size * 2.5))
+        for n, f in enumerate(file_list[:2]):
+            cache.put(f, op.get_data_from_report(f))
+            # Last used times a second apart, so the eviction order does not depend on the clock
+            os.utime(cache._entry_path(cache.key(f)), (n, n))
+        self.assertEqual(cache.evictions, 0)
+
+        # Reading the first entry makes the second the least recently used
+        self.assertIsNotNone(cache.get(file_list[0]))
+        cache.put(file_list[2], op.get_data_from_report(file_list[2]))
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.missing(file_list[:3]), [file_list[1]])
+        self._check_size(cache)
+
+    def test_replaced_entry_size(self):
+        # Writing a report again replaces its entry, so the running size stays the same
+        f = self.sample_file_list[0]
+        cache = opcache.ReportCache(self.cache_directory)
+        report_data = op.get_data_from_report(f)
+        for _ in range(3):
+            cache.put(f, report_data)
+            self._check_size(cache)
+        self.assertTrue(cache.contains(f))
+
+    def _change_report(self, f):
+        """Writes a different report over f, with a modification time that cannot match the old one."""
+        reportgen.write_report(f, 'changed', datetime.datetime(2017, 2, 24, 10, 0), 120, seed='changed')
+        stat = os.stat(f)
+        os.utime(f, (stat.st_atime, stat.st_mtime + 10))
+
+    def _check_size(self, cache):
+        """Checks that the cache's running size is the total size of its entries."""
+        self.assertEqual(cache._size, sum(size for _, size, _ in cache._entries()))
+
+    def _entry_size(self, f):
+        """Gets the size of the cache entry of a report in a separate cache."""
+        cache = opcache.ReportCache(os.path.join(self.directory, 'sizes'))
+        cache.put(f, op.get_data_from_report(f))
+        return os.path.getsize(cache._entry_path(cache.key(f)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Module: test_opdb.py
+Tests that results stored in the opdb result database by a batch run are read
+back the same as the csv results file, on synthetic batches from
+benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opdb
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 4
+
+
+class ResultStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directories = [os.path.join(self.directory, name) for name in ('A', 'B')]
+        for seed, batch_directory in enumerate(self.batch_directories):
+            reportgen.generate_batch(batch_directory, SAMPLE_COUNT, 100, seed=seed)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False, dilution_factor=3)
+        self.database_filepath = os.path.join(self.directory, 'results.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        store = opdb.ResultStore(self.database_filepath)
+        op.calculate_batch(self.batch_directories[0], out_filepath, self.parameters, processes=1, store=store)
+        store.close()
+
+        # Read back from the file after it is reopened
+        store = opdb.ResultStore(self.database_filepath)
+        runs = store.runs()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]['directory'], os.path.abspath(self.batch_directories[0]))
+        self.assertEqual(runs[0]['results_file'], os.path.abspath(out_filepath))
+        self.assertIsNone(runs[0]['batch'])
+        self.assertEqual(runs[0]['analysis_c6_c10'], 0)
+        for name in opdb.PARAMETER_COLUMNS:
+            self.assertEqual(runs[0][name], getattr(self.parameters, name), name)
+
+        results = store.results_between()
+        self.assertEqual([_csv_row(r) for r in results], op._read_results(out_filepath))
+        for result in results:
+            self.assertEqual(result['run_id'], runs[0]['run_id'])
+            self.assertEqual(result['analysis_time'], opdb.parse_analysis_time(result['reported_analysis_time']))
+        store.close()
+
+    def test_queries(self):
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        store = opdb.ResultStore(self.database_filepath)
+        op.calculate_batches(self.batch_directories, out_filepath, self.parameters, processes=1, store=store)
+        self.assertEqual(sorted(run['batch'] for run in store.runs()), ['A', 'B'])
+
+        # The sample names are the same in each batch, and are matched ignoring case
+        history = store.sample_history('s0001')
+        self.assertEqual([(r['sample_name'], r['batch']) for r in history], [('S0001', 'A'), ('S0001', 'B')])
+        expected = [r for r in op._read_results(out_filepath) if r['sample_name'] == 'S0001']
+        self.assertEqual([dict(_csv_row(r), batch=r['batch']) for r in history], expected)
+
+        # Limits are inclusive, as datetimes or ISO 8601 strings
+        first = store.results_between()[0]['analysis_time']
+        self.assertEqual(len(store.results_between(end=first)), 2)
+        self.assertEqual(store.results_between(start=datetime.datetime(2017, 2, 24, 10, 1), end=first), [])
+        self.assertEqual(len(store.sample_history('S0001', start='2017-02-24 00:00:00')), 2)
+        self.assertEqual(store.sample_history('missing'), [])
+        store.close()
+
+    def test_newer_schema(self):
+        connection = sqlite3.connect(self.database_filepath)
+        connection.execute('PRAGMA user_version = %d' % (opdb.SCHEMA_VERSION + 1))
+        connection.close()
+        self.assertRaises(ValueError, opdb.ResultStore, self.database_filepath)
+
+    def test_parse_analysis_time(self):
+        for text in ('24/02/2017 10:01:00', '24/02/2017 10:01', '24/02/2017 10:01:00 AM', '2017-02-24T10:01:00'):
+            self.assertEqual(opdb.parse_analysis_time(text), '2017-02-24 10:01:00', text)
+        self.assertIsNone(opdb.parse_analysis_time('Feb 24 2017'))
+        self.assertIsNone(opdb.parse_analysis_time(None))
+
+
+def _csv_row(result):
+    """Converts a stored result to a row as read from the csv results file."""
+    row = {
+        'sample_name': result['sample_name'],
+        'analysis_time': result['reported_analysis_time']
+    }
+    for name in op.BatchParameters(analysis_c6_c10=False).fieldnames[2:]:
+        row[name] = '%r' % result[name] if result[name] is not None else ''
+    return row
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Module: test_opserver.py
+Tests of the local processing server, driven through ServerClient as a LIMS
+integration would, on synthetic batches from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opserver
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 4
+
+
+class ProcessingServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directory = os.path.join(self.directory, 'batch')
+        reportgen.generate_batch(self.batch_directory, SAMPLE_COUNT, 100)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        self.server = opserver.ProcessingServer(0, self.parameters, processes=1, root=self.directory)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = opserver.ServerClient(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_results_match_calculate_batch(self):
+        batch = self.client.create_batch(directory=self.batch_directory)
+        self.assertIsNone(batch['blank_average_error'])
+        self.assertEqual(batch['failures'], [])
+        self.assertEqual(self._strip(batch['results']), self._calculate_batch())
+        self.assertEqual(self.client.status()['batches'], ['batch'])
+
+    def test_sample_without_fraction_end(self):
+        # Ends before the C34-C40 boundary, so its fraction areas cannot be found
+        truncated = os.path.join(self.batch_directory, 'Report_S9999.xls')
+        reportgen.write_report(truncated, 'S9999', datetime.datetime(2017, 2, 24, 10, 0), 100, seed='truncated',
+                               max_rt=31.5)
+        for batch in (self.client.create_batch(directory=self.batch_directory), self.client.batch('batch')):
+            self.assertIsNone(batch['blank_average_error'])
+            self.assertEqual(len(batch['results']), SAMPLE_COUNT)
+            self.assertEqual([(f['file'], f['reason']) for f in batch['failures']],
+                             [(truncated, 'fraction_boundary')])
+
+        # Replacing the report with a complete one clears the failure
+        reportgen.write_report(truncated, 'S9999', datetime.datetime(2017, 2, 24, 10, 0), 100, seed='truncated')
+        os.utime(truncated, (0, 0))
+        batch = self.client.batch('batch')
+        self.assertEqual(batch['failures'], [])
+        self.assertEqual(len(batch['results']), SAMPLE_COUNT + 1)
+
+    def test_blank_without_fraction_end(self):
+        truncated = os.path.join(self.batch_directory, 'Report_BLK9.xls')
+        reportgen.write_report(truncated, 'BLK9', datetime.datetime(2017, 2, 24, 8, 0), 100, blank=True,
+                               seed='truncated', max_rt=31.5)
+        batch = self.client.create_batch(directory=self.batch_directory)
+        self.assertIsNotNone(batch['blank_average_error'])
+        self.assertEqual(batch['results'], [])
+        reasons = sorted((f['blank'], f['reason']) for f in batch['failures'])
+        self.assertEqual(reasons, [(False, 'blank_average')] * SAMPLE_COUNT + [(True, 'fraction_boundary')])
+
+    def test_invalid_requests(self):
+        for body, message in [(b'[1, 2]', "The request body must be a JSON object."),
+                              (b'{"name": "x", "parameters": [1]}', "The batch parameters must be a JSON object."),
+                              (b'not json', "The request body is not valid JSON.")]:
+            with self.assertRaises(ValueError) as context:
+                self.client._request('POST', '/batches', body)
+            self.assertEqual(str(context.exception), message)
+        for directory in (os.path.join(self.directory, 'missing'), tempfile.gettempdir()):
+            self.assertRaises(ValueError, self.client.create_batch, directory=directory)
+        self.assertEqual(self.client.status()['batches'], [])
+
+    def _calculate_batch(self):
+        """Calculates the batch with op.calculate_batch, as result rows of floats."""
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        op.calculate_batch(self.batch_directory, out_filepath, self.parameters, processes=1)
+        return self._strip(op._read_results(out_filepath))
+
+    def _strip(self, results):
+        """Gets the concentrations of result rows as floats, in file order."""
+        return [dict((k, float(v)) for k, v in r.items() if k.startswith('conc_')) for r in results]
+
+
+if __name__ == '__main__':
+    unittest.main()
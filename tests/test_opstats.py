@@ -0,0 +1,73 @@
+"""
+Module: test_opstats.py
+Tests of the JSON run report written by op.calculate_batch with run_report set.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opx
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+BLANK_COUNT = 3
+SAMPLE_COUNT = 5
+
+
+class RunReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        reportgen.generate_batch(self.directory, SAMPLE_COUNT, 50, BLANK_COUNT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_istd_candidates_serial(self):
+        self._check_istd_candidates(self._run_report(vectorised=False))
+
+    def test_istd_candidates_vectorised(self):
+        # Every sample is calculated in one block of the NumPy engine
+        self.assertLess(SAMPLE_COUNT, opx.DEF_VECTOR_BLOCK_SIZE)
+        self._check_istd_candidates(self._run_report(vectorised=True))
+
+    def _check_istd_candidates(self, report):
+        files = report['files']
+        self.assertEqual(sum(1 for record in files if record['blank']), BLANK_COUNT)
+        self.assertEqual(sum(1 for record in files if not record['blank']), SAMPLE_COUNT)
+        # reportgen writes one internal standard peak in each report
+        for record in files:
+            self.assertEqual(record.get('istd_candidates'), 1, record['file'])
+        self.assertEqual(report['counters'].get('istd_single_candidate'), BLANK_COUNT + SAMPLE_COUNT)
+
+    def _run_report(self, vectorised):
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        parameters = op.BatchParameters(analysis_c6_c10=False)
+        op.calculate_batch(self.directory, out_filepath, parameters, processes=1, vectorised=vectorised,
+                           run_report=True)
+        with open(out_filepath + opx.RUN_REPORT_SUFFIX) as f:
+            return json.load(f)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Module: test_optune.py
+Tests that the tolerance search in optune chooses the same tolerances as a brute
+force search with op.get_istd_candidates at every point of the grid, on
+synthetic batches from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import optune
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 6
+GRID_STEPS = 12
+
+
+class ToleranceSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        reportgen.generate_batch(self.directory, SAMPLE_COUNT, 100)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        self.rt_tolerances = optune.tolerance_grid(self.parameters.istd_rt_tolerance, steps=GRID_STEPS)
+        self.area_tolerances = optune.tolerance_grid(self.parameters.istd_area_tolerance, steps=GRID_STEPS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_brute_force(self):
+        search, counts = self._search()
+        # The grid runs from no acceptable peak to several
+        self.assertTrue(set(c for report_counts in counts.values() for c in report_counts.values()) >= {0, 1, 2})
+        self._check_search(search, counts)
+        self.assertEqual(search.outliers(), [])
+
+        # Every report of the batch is calculated at the tightest tolerances
+        rt_tolerance, area_tolerance = search.tightest()
+        parameters = op.BatchParameters(analysis_c6_c10=False, istd_rt_tolerance=rt_tolerance,
+                                        istd_area_tolerance=area_tolerance)
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        self.assertEqual(op.calculate_batch(self.directory, out_filepath, parameters, processes=1), SAMPLE_COUNT)
+
+    def test_outlier(self):
+        # The internal standard area is far below the target
+        outlier = os.path.join(self.directory, 'Report_S9999.xls')
+        reportgen.write_report(outlier, 'S9999', datetime.datetime(2017, 2, 24, 10, 0), 100, seed='outlier',
+                               istd_area=1.0)
+        unreadable = os.path.join(self.directory, 'Report_S9998.xls')
+        with open(unreadable, 'w') as f:
+            f.write('not a workbook')
+
+        # Wider area tolerances would accept one of the other peaks instead
+        self.area_tolerances = optune.tolerance_grid(self.parameters.istd_area_tolerance, scale=1,
+                                                     steps=GRID_STEPS)
+        search, counts = self._search()
+        self.assertEqual([f for f, _ in search.unreadable], [unreadable])
+        self.assertNotIn(unreadable, search.files)
+        self.assertEqual(set(counts[outlier].values()), {0})
+        self._check_search(search, counts)
+        self.assertIsNone(search.tightest())
+        self.assertIsNone(search.tightest(outlier))
+        self.assertEqual(search.frontier(), [])
+        self.assertEqual(search.outliers(), [(outlier, 0)])
+        self.assertEqual(search.best()[2], len(search.files) - 1)
+
+    def _check_search(self, search, counts):
+        """Checks the peak counts and chosen tolerances of a search against the brute force counts."""
+        grid = [(rt_tolerance, area_tolerance) for rt_tolerance in self.rt_tolerances
+                for area_tolerance in self.area_tolerances]
+        for rt_tolerance, area_tolerance in grid:
+            self.assertEqual(search.peak_counts(rt_tolerance, area_tolerance),
+                             [counts[f][rt_tolerance, area_tolerance] for f in search.files])
+
+        def tightest(pairs):
+            # Smallest sum of the tolerances relative to the largest in each grid, then the smaller RT tolerance
+            pairs = list(pairs)
+            if not pairs:
+                return None
+            return min(pairs, key=lambda pair: (pair[0] / self.rt_tolerances.max() +
+                                                pair[1] / self.area_tolerances.max(), pair[0]))
+
+        def single_count(pair):
+            return sum(1 for f in search.files if counts[f][pair] == 1)
+
+        self.assertEqual(search.tightest(), tightest(pair for pair in grid if single_count(pair) == len(search.files)))
+        for f in search.files:
+            self.assertEqual(search.tightest(f), tightest(pair for pair in grid if counts[f][pair] == 1))
+        most = max(single_count(pair) for pair in grid)
+        best = tightest(pair for pair in grid if single_count(pair) == most)
+        self.assertEqual(search.best(), (best[0], best[1], most))
+        frontier = []
+        for rt_tolerance in self.rt_tolerances:
+            area_tolerances = [a for a in self.area_tolerances
+                               if single_count((rt_tolerance, a)) == len(search.files)]
+            if area_tolerances:
+                frontier.append((rt_tolerance, min(area_tolerances)))
+        self.assertEqual(search.frontier(), frontier)
+
+    def _search(self):
+        """
+        Searches the batch, and counts the acceptable internal standard peaks of each report one grid point at a time
+        :return: Tuple of the ToleranceSearch and a dictionary of report file -> (RT tolerance,
+            area tolerance) -> peak count.
+        """
+        search = optune.search_batch(self.directory, self.parameters, self.rt_tolerances, self.area_tolerances,
+                                     processes=1)
+        counts = {}
+        for f in search.files:
+            peak_data = op.get_data_from_report(f)[2]
+            counts[f] = {}
+            for rt_tolerance in self.rt_tolerances:
+                for area_tolerance in self.area_tolerances:
+                    candidates = op.get_istd_candidates(peak_data, self.parameters.istd_rt, rt_tolerance,
+                                                        self.parameters.istd_area_target, area_tolerance)
+                    counts[f][rt_tolerance, area_tolerance] = sum(
+                        1 for c in candidates if c['in_rt_window'] and c['in_area_range'])
+        return search, counts
+
+
+if __name__ == '__main__':
+    unittest.main()
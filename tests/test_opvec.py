@@ -0,0 +1,107 @@
+"""
+Module: test_opvec.py
+Tests that the NumPy engine in opvec gives the same results as the op functions
+it vectorises, on synthetic batches from benchmarks/reportgen.py.
+
+The op functions are given each report's peaks as a plain list of peak tuples,
+so they take the original list code paths.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opvec
+import opx
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 20
+PEAK_COUNT = 300
+
+
+class VectorisedEquivalenceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        # Analysis type -> (blank reports, sample reports), each a list of
+        # (sample name, analysis time, list of peak tuples)
+        cls.batches = {}
+        for analysis_c6_c10 in (True, False):
+            blank_file_list, sample_file_list = reportgen.generate_batch(
+                os.path.join(cls.directory, str(analysis_c6_c10)), SAMPLE_COUNT, PEAK_COUNT,
+                analysis_c6_c10=analysis_c6_c10)
+            cls.batches[analysis_c6_c10] = ([_read_report(f) for f in blank_file_list],
+                                            [_read_report(f) for f in sample_file_list])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_fraction_indices(self):
+        for analysis_c6_c10, (_, samples) in self.batches.items():
+            peak_data_lists = [r[2] for r in samples]
+            arrays = opvec.PeakArrays(peak_data_lists)
+            self.assertEqual(opvec.get_fraction_start_indices(arrays, opx.C10_C16_START).tolist(),
+                             [op.get_fraction_start_index(p, opx.C10_C16_START) for p in peak_data_lists])
+            # Boundaries used by op.get_fraction_areas for the analysis type
+            if analysis_c6_c10:
+                rt_ends = [opx.C6_C10_END]
+            else:
+                rt_ends = [opx.C10_C16_END, opx.C16_C34_END, opx.C34_C40_END]
+            for rt_end in rt_ends:
+                self.assertEqual(opvec.get_fraction_end_indices(arrays, rt_end).tolist(),
+                                 [op.get_fraction_end_index(p, rt_end) for p in peak_data_lists])
+
+    def test_istd_areas(self):
+        for analysis_c6_c10, (_, samples) in self.batches.items():
+            istd_kwargs = op.BatchParameters(analysis_c6_c10).istd_kwargs()
+            peak_data_lists = [r[2] for r in samples]
+            self.assertEqual(opvec.get_istd_areas(opvec.PeakArrays(peak_data_lists), **istd_kwargs).tolist(),
+                             [op.get_istd_area(p, **istd_kwargs) for p in peak_data_lists])
+
+    def test_fraction_areas(self):
+        for analysis_c6_c10, (_, samples) in self.batches.items():
+            peak_data_lists = [r[2] for r in samples]
+            areas = opvec.fraction_areas(opvec.PeakArrays(peak_data_lists), analysis_c6_c10)
+            for n, peak_data_list in enumerate(peak_data_lists):
+                for fraction, area in op.get_fraction_areas(peak_data_list, analysis_c6_c10).items():
+                    # Summed in a different order, so only equal to rounding error
+                    self.assertAlmostEqual(areas[fraction][n], area, delta=abs(area) * 1e-12)
+
+    def test_sample_results(self):
+        for analysis_c6_c10, (blanks, samples) in self.batches.items():
+            parameters = op.BatchParameters(analysis_c6_c10)
+            blank_average = op.BlankAverage([r[2] for r in blanks], analysis_c6_c10, **parameters.istd_kwargs())
+            self.assertEqual(opvec.calculate_sample_results(samples, blank_average, parameters),
+                             [op.calculate_sample_result(name, time, peaks, blank_average, parameters)
+                              for name, time, peaks in samples])
+
+
+def _read_report(file):
+    """Reads a report with its peaks as a list of peak tuples."""
+    sample_name, analysis_time, peak_data = op.get_data_from_report(file)
+    return sample_name, analysis_time, list(peak_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Module: test_opwatch.py
+Tests that ReportWatcher keeps a batch's results file the same as a full
+calculation as reports arrive, change and are removed, on synthetic batches
+from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opwatch
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 4
+
+
+class ReportWatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch_directory = os.path.join(self.directory, 'batch')
+        self.blank_file_list, self.sample_file_list = reportgen.generate_batch(self.batch_directory,
+                                                                               SAMPLE_COUNT, 100)
+        self.parameters = op.BatchParameters(analysis_c6_c10=False)
+        self.out_filepath = os.path.join(self.directory, 'results.csv')
+        # Every change is read at the second poll that sees it
+        self.watcher = opwatch.ReportWatcher(self.batch_directory, self.out_filepath, self.parameters, processes=1,
+                                             settle_time=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_settle(self):
+        watcher = opwatch.ReportWatcher(self.batch_directory, self.out_filepath, self.parameters, processes=1,
+                                        settle_time=3600)
+        for _ in range(2):
+            self.assertEqual(watcher.poll(), [])
+        self.assertEqual(sorted(watcher.pending), self.blank_file_list + self.sample_file_list)
+        self.assertFalse(os.path.exists(self.out_filepath))
+
+        # A report that changes while it waits starts waiting again
+        self.assertEqual(self.watcher.poll(), [])
+        f = self.sample_file_list[0]
+        self._write_sample(f, 'S0000')
+        self.assertEqual(sorted(self.watcher.poll()), self.blank_file_list + self.sample_file_list[1:])
+        self.assertEqual(list(self.watcher.pending), [f])
+        self.assertEqual(self.watcher.poll(), [f])
+        self.assertEqual(self.watcher.pending, {})
+        self._check_results()
+
+    def test_append_new_samples(self):
+        self._poll_until_read()
+        inode = os.stat(self.out_filepath).st_ino
+
+        # Samples after the existing rows are appended to the same file
+        self._write_sample(os.path.join(self.batch_directory, 'Report_S9999.xls'), 'S9999')
+        self._poll_until_read()
+        self.assertEqual(os.stat(self.out_filepath).st_ino, inode)
+        self._check_results()
+
+    def test_rewrite_changed_sample(self):
+        self._poll_until_read()
+        inode = os.stat(self.out_filepath).st_ino
+
+        # A changed row that is not the last means a new file is swapped in
+        self._write_sample(self.sample_file_list[1], 'S0001')
+        self._poll_until_read()
+        self.assertNotEqual(os.stat(self.out_filepath).st_ino, inode)
+        self._check_results()
+
+    def test_blank_change_recalculates_samples(self):
+        self._poll_until_read()
+        before = op._read_results(self.out_filepath)
+        reportgen.write_report(os.path.join(self.batch_directory, 'Report_BLK9.xls'), 'BLK9',
+                               datetime.datetime(2017, 2, 24, 8, 0), 100, blank=True, seed='blank')
+        self._poll_until_read()
+        self.assertNotEqual(op._read_results(self.out_filepath), before)
+        self._check_results()
+
+    def test_remove(self):
+        self._poll_until_read()
+        os.remove(self.sample_file_list[0])
+        self.assertEqual(self.watcher.poll(), [self.sample_file_list[0]])
+        self._check_results()
+
+        # Removing a blank recalculates every sample
+        os.remove(self.blank_file_list[0])
+        self.assertEqual(self.watcher.poll(), [self.blank_file_list[0]])
+        self._check_results()
+
+        # A report removed while it waits to settle is no longer waited for
+        f = os.path.join(self.batch_directory, 'Report_S9999.xls')
+        self._write_sample(f, 'S9999')
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertEqual(list(self.watcher.pending), [f])
+        os.remove(f)
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertEqual(self.watcher.pending, {})
+
+    def _check_results(self):
+        """Checks that the results file is the same as a full calculation of the batch directory's reports."""
+        expected_filepath = os.path.join(self.directory, 'expected.csv')
+        op.calculate_batch(self.batch_directory, expected_filepath, self.parameters, processes=1)
+        self.assertEqual(op._read_results(self.out_filepath), op._read_results(expected_filepath))
+
+    def _poll_until_read(self):
+        """Polls until the changed reports have settled and been read."""
+        self.assertEqual(self.watcher.poll(), [])
+        self.assertNotEqual(self.watcher.poll(), [])
+        self.assertEqual(self.watcher.pending, {})
+
+    def _write_sample(self, f, sample_name):
+        """Writes a new version of a sample report, with a modification time that cannot match an older one."""
+        reportgen.write_report(f, sample_name, datetime.datetime(2017, 2, 24, 10, 0), 100, seed=f)
+        stat = os.stat(f)
+        os.utime(f, (stat.st_atime, stat.st_mtime + 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
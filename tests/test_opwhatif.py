@@ -0,0 +1,110 @@
+"""
+Module: test_opwhatif.py
+Tests that each calibration scenario calculated by opwhatif gives the same
+results as a full op.calculate_batch run with its values, on synthetic batches
+from benchmarks/reportgen.py.
+
+Author: Daniel Harris
+Title: Data & Procedures Officer
+Organisation: DPI Water
+Date modified: 18/10/2026
+
+External dependencies: xlrd, xlwt, numpy
+
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import op
+import opwhatif
+import opx
+import reportgen
+
+__author__ = 'Daniel Harris'
+__date__ = '18 October 2026'
+__email__ = 'daniel.harris@dpi.nsw.gov.au'
+__version__ = '1.0.1'
+
+SAMPLE_COUNT = 5
+
+# Scenario rows; values that are not given take the batch parameters
+SCENARIOS = [
+    {'name': 'unchanged'},
+    {'name': 'slope', 'calibration_slope': '3.5', 'calibration_intercept': '-0.2'},
+    {'istd_concentration': '40', 'dilution_factor': '0.01'}
+]
+
+
+class ScenarioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scenarios_filepath = os.path.join(self.directory, 'scenarios.csv')
+        self._write_scenarios(['name'] + opx.SCENARIO_COLUMNS, SCENARIOS)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_matches_calculate_batch(self):
+        for analysis_c6_c10 in (True, False):
+            batch_directory = os.path.join(self.directory, str(analysis_c6_c10))
+            reportgen.generate_batch(batch_directory, SAMPLE_COUNT, 100, analysis_c6_c10=analysis_c6_c10)
+            parameters = op.BatchParameters(analysis_c6_c10=analysis_c6_c10)
+            scenarios = opwhatif.read_scenarios(self.scenarios_filepath, parameters)
+            self.assertEqual([name for name, _ in scenarios], ['unchanged', 'slope', 'scenario_3'])
+            self.assertEqual(scenarios[0][1].as_dict(), parameters.as_dict())
+
+            batch = opwhatif.resolve_batch(batch_directory, parameters, processes=1)
+            long_filepath = os.path.join(self.directory, 'long.csv')
+            self.assertEqual(opwhatif.write_long(long_filepath, batch, scenarios), len(scenarios) * SAMPLE_COUNT)
+            wide_filepath = os.path.join(self.directory, 'wide.csv')
+            self.assertEqual(opwhatif.write_wide(wide_filepath, batch, scenarios), SAMPLE_COUNT)
+            long_rows = op._read_results(long_filepath)
+            wide_rows = op._read_results(wide_filepath)
+
+            for n, (name, scenario_parameters) in enumerate(scenarios):
+                expected = self._calculate_batch(batch_directory, scenario_parameters)
+                rows = long_rows[n * SAMPLE_COUNT:(n + 1) * SAMPLE_COUNT]
+                for row in rows:
+                    self.assertEqual(row.pop('scenario'), name)
+                    for key in opx.SCENARIO_COLUMNS:
+                        self.assertEqual(float(row.pop(key)), getattr(scenario_parameters, key))
+                self.assertEqual(rows, expected, name)
+                # Wide rows have a column per scenario and fraction
+                self.assertEqual([dict((c, r.get(c) or r['%s_%s' % (name, c)]) for c in parameters.fieldnames)
+                                  for r in wide_rows], expected, name)
+
+    def test_invalid_scenarios(self):
+        parameters = op.BatchParameters(analysis_c6_c10=False)
+        for fieldnames, rows, message in [
+                (['name', 'slope'], [{'name': 'a', 'slope': '1'}], "unknown column slope"),
+                (['calibration_slope'], [{'calibration_slope': 'steep'}], "row 2 has an invalid calibration_slope"),
+                (['name'], [{'name': 'a'}, {'name': 'a'}], "more than one scenario with the same name")]:
+            self._write_scenarios(fieldnames, rows)
+            with self.assertRaises(ValueError) as context:
+                opwhatif.read_scenarios(self.scenarios_filepath, parameters)
+            self.assertIn(message, str(context.exception))
+
+    def _calculate_batch(self, batch_directory, parameters):
+        """Calculates a batch with op.calculate_batch, giving the rows of its results file."""
+        out_filepath = os.path.join(self.directory, 'results.csv')
+        op.calculate_batch(batch_directory, out_filepath, parameters, processes=1)
+        return op._read_results(out_filepath)
+
+    def _write_scenarios(self, fieldnames, rows):
+        with open(self.scenarios_filepath, 'wb') as f:
+            writer = csv.DictWriter(f, fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    unittest.main()